@@ -7,26 +7,48 @@ V3.0.0 - 通用架构
 负责处理 OpenClaw API 请求，解析 JSON 格式，与 Core 交互。
 """
 
-import json
 import time
 import logging
 from typing import Dict, Any, Optional
 
 from base_adapter import (
+    AUTO_MODEL_IDS,
     BaseAPIServerAdapter, 
     build_task_from_messages, 
     create_error_response,
-    create_success_response
+    create_success_response,
+    dumps_json,
+    emit_json,
 )
 
 logger = logging.getLogger("adapter_openclaw")
 
+# SSE 固定片段 (预先编码，避免每个块重复拼接字符串)
+SSE_DATA_PREFIX = b"data: "
+SSE_EVENT_END = b"\n\n"
+SSE_DONE = b"data: [DONE]\n\n"
+
+# 模型列表条目的固定字段
+MODEL_ENTRY_TEMPLATE = {"object": "model", "created": 1700000000}
+
 
 class OpenClawAdapter(BaseAPIServerAdapter):
     """OpenClaw API 适配器"""
     
     def __init__(self):
         super().__init__("openclaw")
+        # 流式响应块模板，format_stream_chunk 原地修改后序列化
+        self._chunk_tpl = {
+            "id": "",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "",
+            "choices": [{
+                "index": 0,
+                "delta": {"content": ""},
+                "finish_reason": None
+            }]
+        }
     
     def parse_request(self, raw_input: Any) -> Dict[str, Any]:
         """
@@ -117,8 +139,11 @@ class OpenClawAdapter(BaseAPIServerAdapter):
         max_tokens = request_data.get("max_tokens", 4096)
         stream = request_data.get("stream", False)
         
-        # 构建任务描述
-        task_description = build_task_from_messages(messages)
+        # 构建任务描述 (仅自动选择时需要，指定模型时跳过)
+        if model in AUTO_MODEL_IDS:
+            task_description = build_task_from_messages(messages)
+        else:
+            task_description = ""
         
         return {
             "task_description": task_description,
@@ -150,46 +175,42 @@ class OpenClawAdapter(BaseAPIServerAdapter):
         return create_success_response(model, content, metadata)
     
     def format_stream_chunk(self, model: str, content: str, 
-                           chunk_index: int = 0) -> str:
+                           chunk_index: int = 0) -> bytes:
         """
         格式化流式响应块
         
         SSE (Server-Sent Events) 格式
         
+        复用实例上的块模板，只修改变化的字段，因此不是线程安全的:
+        并发的流应各自使用独立的适配器实例。
+        
         Args:
             model: 模型 ID
             content: 内容块
             chunk_index: 块索引
         
         Returns:
-            SSE 格式的数据块
+            SSE 格式的数据块 (字节串)
         """
-        import time
-        
-        data = {
-            "id": f"chatcmpl-{int(time.time())}",
-            "object": "chat.completion.chunk",
-            "created": int(time.time()),
-            "model": model,
-            "choices": [{
-                "index": chunk_index,
-                "delta": {
-                    "content": content
-                },
-                "finish_reason": None
-            }]
-        }
-        
-        return f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+        now = int(time.time())
+        data = self._chunk_tpl
+        data["id"] = f"chatcmpl-{now}"
+        data["created"] = now
+        data["model"] = model
+        choice = data["choices"][0]
+        choice["index"] = chunk_index
+        choice["delta"]["content"] = content
+        
+        return SSE_DATA_PREFIX + dumps_json(data) + SSE_EVENT_END
     
-    def format_stream_end(self) -> str:
+    def format_stream_end(self) -> bytes:
         """
         格式化流式响应结束
         
         Returns:
             结束标记
         """
-        return "data: [DONE]\n\n"
+        return SSE_DONE
     
     def list_models_response(self, models: Dict[str, Dict]) -> Dict:
         """
@@ -201,16 +222,16 @@ class OpenClawAdapter(BaseAPIServerAdapter):
         Returns:
             OpenAI 兼容的模型列表
         """
-        data = []
-        
-        for model_id, info in models.items():
-            data.append({
+        data = [
+            {
                 "id": model_id,
-                "object": "model",
-                "created": 1700000000,
-                "owned_by": info.get("provider", "smart-selector"),
-                "provider": info.get("provider", "smart-selector")
-            })
+                **MODEL_ENTRY_TEMPLATE,
+                "owned_by": provider,
+                "provider": provider
+            }
+            for model_id, info in models.items()
+            for provider in (info.get("provider", "smart-selector"),)
+        ]
         
         return {
             "object": "list",
@@ -252,7 +273,7 @@ def create_chat_completion(adapter: OpenClawAdapter, core,
         parsed = adapter.parse_chat_request(request_data)
         
         # 选择模型
-        if parsed["model"] == "auto" or parsed["model"] == "smart-select":
+        if parsed["model"] in AUTO_MODEL_IDS:
             model_id, reason = core.select(parsed["task_description"])
         else:
             model_id = parsed["model"]
@@ -298,7 +319,7 @@ def main():
     
     # 解析并选择
     result = create_chat_completion(adapter, core, test_request)
-    print(json.dumps(result, ensure_ascii=False, indent=2))
+    emit_json(result, pretty=True)
 
 
 if __name__ == "__main__":
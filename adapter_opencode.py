@@ -8,15 +8,70 @@ V3.0.0 - 通用架构
 """
 
 import sys
-import json
 import logging
 from typing import Dict, Any, Optional
 
-from base_adapter import BaseCLIAdapter, build_task_from_messages, create_error_response
+from base_adapter import BaseCLIAdapter, build_task_from_messages, create_error_response, dumps_json, emit_json
 
 logger = logging.getLogger("adapter_opencode")
 
 
+# ============ 请求解析 ============
+
+def _parse_str(raw_input: str) -> Dict[str, Any]:
+    """字符串输入 - 直接作为任务描述"""
+    return {
+        "task_description": raw_input,
+        "metadata": {"source": "cli_string"}
+    }
+
+
+def _parse_dict(raw_input: dict) -> Dict[str, Any]:
+    """字典输入 - 支持 task 字段或 messages 列表"""
+    if "task" in raw_input:
+        return {
+            "task_description": raw_input.get("task", ""),
+            "model": raw_input.get("model", "auto"),
+            "metadata": {"source": "cli_dict"}
+        }
+    if "messages" in raw_input:
+        task_desc = build_task_from_messages(raw_input.get("messages", []))
+        return {
+            "task_description": task_desc,
+            "model": raw_input.get("model", "auto"),
+            "metadata": {"source": "cli_messages"}
+        }
+    return _parse_unknown(raw_input)
+
+
+def _parse_unknown(raw_input: Any) -> Dict[str, Any]:
+    """无法识别的输入 - 转为字符串作为任务描述"""
+    return {
+        "task_description": str(raw_input),
+        "metadata": {"source": "unknown"}
+    }
+
+
+def _parse_fallback(raw_input: Any) -> Dict[str, Any]:
+    """非精确类型 (str/dict 子类等) 的兜底解析"""
+    if isinstance(raw_input, str):
+        return _parse_str(raw_input)
+    if isinstance(raw_input, dict):
+        return _parse_dict(raw_input)
+    return _parse_unknown(raw_input)
+
+
+# 指定模型的命令行选项
+MODEL_FLAGS = frozenset({"-m", "--model"})
+
+
+# 按输入类型分派的解析器
+_PARSERS = {
+    str: _parse_str,
+    dict: _parse_dict,
+}
+
+
 class OpenCodeAdapter(BaseCLIAdapter):
     """OpenCode 命令行适配器"""
     
@@ -38,34 +93,8 @@ class OpenCodeAdapter(BaseCLIAdapter):
         Returns:
             标准请求格式
         """
-        if isinstance(raw_input, str):
-            # 字符串输入 - 直接作为任务描述
-            return {
-                "task_description": raw_input,
-                "metadata": {"source": "cli_string"}
-            }
-        
-        elif isinstance(raw_input, dict):
-            # 字典输入
-            if "task" in raw_input:
-                return {
-                    "task_description": raw_input.get("task", ""),
-                    "model": raw_input.get("model", "auto"),
-                    "metadata": {"source": "cli_dict"}
-                }
-            elif "messages" in raw_input:
-                task_desc = build_task_from_messages(raw_input.get("messages", []))
-                return {
-                    "task_description": task_desc,
-                    "model": raw_input.get("model", "auto"),
-                    "metadata": {"source": "cli_messages"}
-                }
-        
-        # 默认返回
-        return {
-            "task_description": str(raw_input),
-            "metadata": {"source": "unknown"}
-        }
+        handler = _PARSERS.get(type(raw_input), _parse_fallback)
+        return handler(raw_input)
     
     def format_response(self, core_output: Dict[str, Any]) -> Any:
         """
@@ -118,23 +147,14 @@ class OpenCodeAdapter(BaseCLIAdapter):
         task_parts = []
         model = "auto"
         
-        i = 0
-        while i < len(args):
-            arg = args[i]
-            if arg in ["-m", "--model"]:
-                if i + 1 < len(args):
-                    model = args[i + 1]
-                    i += 2
-                    continue
-            elif arg in ["-j", "--json"]:
-                # JSON 输出模式，在 format_cli_output 中处理
-                pass
-            elif arg.startswith("-"):
-                # 跳过其他参数
-                i += 1
-                continue
-            task_parts.append(arg)
-            i += 1
+        it = iter(args)
+        for arg in it:
+            if arg in MODEL_FLAGS:
+                # 消费下一个参数作为模型，缺失时保持自动选择
+                model = next(it, "auto")
+            elif not arg.startswith("-"):
+                # 其他选项 (如 -j/--json 由 format_cli_output 处理) 直接跳过
+                task_parts.append(arg)
         
         task_description = " ".join(task_parts)
         
@@ -183,7 +203,7 @@ class OpenCodeAdapter(BaseCLIAdapter):
         if metadata:
             output["metadata"] = metadata
         
-        return json.dumps(output, ensure_ascii=False, indent=2)
+        return dumps_json(output, indent=True).decode("utf-8")
 
 
 # ============ 主函数 ============
@@ -222,7 +242,7 @@ def main():
     else:
         # 列出所有模型
         models = core.get_models()
-        print(json.dumps(models, ensure_ascii=False, indent=2))
+        emit_json(models, pretty=True)
 
 
 if __name__ == "__main__":
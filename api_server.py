@@ -7,14 +7,27 @@ OpenCode Smart Model Selector - API Server
 - POST /v1/chat/completions - 聊天完成
 - GET  /v1/models - 获取可用模型列表
 - GET  /health - 健康检查
+- POST /admin/cache_clear - 清空自动选模缓存 (所有 worker；仅限本机或持有管理令牌)
 """
 
-import json
+import argparse
+import collections
+import functools
+import hashlib
+import hmac
+import itertools
 import logging
+import os
+import re
 import sys
+import threading
+import time
 from pathlib import Path
 from typing import Dict, Any, Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+from urllib3.util.retry import Retry
 
 from typing import Dict, Any, Optional
 
@@ -24,6 +37,8 @@ sys.path.insert(0, str(SCRIPT_DIR))
 
 from smart_model_dispatcher import SmartModelDispatcher
 from model_selector import SmartModelSelector
+from base_adapter import AUTO_MODEL_IDS, build_task_from_messages, dumps_json, loads_json
+from adapter_openclaw import OpenClawAdapter, SSE_EVENT_END
 # OpenClaw 整合模块
 from openclaw_selector import OpenClawModelSelector, PerformanceTracker
 
@@ -34,16 +49,89 @@ logging.basicConfig(
 )
 logger = logging.getLogger("api_server")
 
+# 上游请求超时 (连接超时, 读取超时)
+UPSTREAM_TIMEOUT = (3.05, 60)
+# 上游连接池大小
+UPSTREAM_POOL_CONNECTIONS = 16
+UPSTREAM_POOL_MAXSIZE = 64
+# API Key 索引刷新间隔 (秒)
+KEY_REFRESH_INTERVAL = 300
+# 自动选模结果缓存: 最大条目数与有效期 (秒，过期后按最新性能数据重新选择)
+SELECTION_CACHE_SIZE = 4096
+SELECTION_CACHE_TTL = 60
+# 自动选模缓存的失效标记文件 (按端口区分)，mtime 变化时各 worker 在下次查询时清空本进程缓存
+SELECTION_CACHE_STAMP_DIR = Path.home() / ".config" / "opencode"
+# 管理接口令牌 (环境变量)；设置后 /admin/* 必须携带 "Authorization: Bearer <令牌>"，
+# 未设置时只接受来自本机回环地址的请求
+ADMIN_TOKEN_ENV = "OPENCODE_ADMIN_TOKEN"
+# gunicorn 默认 worker 进程数与每个 worker 的线程数
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_THREADS = 32
+
 # 尝试导入 Flask
 try:
-    from flask import Flask, request, jsonify, Response, stream_with_context
-    import time
+    from flask import Flask, request, Response, stream_with_context
     FLASK_AVAILABLE = True
 except ImportError:
     FLASK_AVAILABLE = False
     logger.warning("Flask not installed. Install with: pip install flask")
 
 
+def json_response(data: Any, status: int = 200) -> "Response":
+    """构建 JSON 响应 (直接写出序列化后的字节串，替代 jsonify)"""
+    return Response(dumps_json(data), status=status, mimetype="application/json")
+
+
+def _anthropic_stream_text(event: Dict[str, Any]) -> str:
+    """从 Anthropic 流式事件中提取增量文本"""
+    if event.get("type") == "content_block_delta":
+        return event.get("delta", {}).get("text", "")
+    return ""
+
+
+def _google_stream_text(event: Dict[str, Any]) -> str:
+    """从 Google 流式事件中提取增量文本"""
+    candidates = event.get("candidates") or [{}]
+    parts = candidates[0].get("content", {}).get("parts") or [{}]
+    return parts[0].get("text", "")
+
+
+# 模型名关键词 -> 提供商
+PROVIDER_KEYWORDS = (
+    ("claude", "anthropic"),
+    ("gemini", "google"),
+    ("gpt", "openai"),
+    ("openai", "openai"),
+    ("deepseek", "deepseek"),
+    ("qwen", "siliconflow"),
+    ("silicon", "siliconflow"),
+    ("minimax", "minimax"),
+)
+DEFAULT_PROVIDER = "google"
+
+# 所有关键词合并为一个正则，一次扫描完成匹配
+PROVIDER_KEYWORD_RE = re.compile(
+    "|".join(re.escape(keyword) for keyword, _ in PROVIDER_KEYWORDS), re.IGNORECASE
+)
+_KEYWORD_TO_PROVIDER = dict(PROVIDER_KEYWORDS)
+
+
+@functools.lru_cache(maxsize=2048)
+def infer_provider(model: str) -> str:
+    """从模型名关键词推断提供商 (结果缓存)"""
+    match = PROVIDER_KEYWORD_RE.search(model)
+    if match:
+        return _KEYWORD_TO_PROVIDER[match.group(0).lower()]
+    return DEFAULT_PROVIDER
+
+
+# 需要逐块转换为 OpenAI 格式的流式提供商 (其余提供商原样透传)
+STREAM_TEXT_EXTRACTORS = {
+    "anthropic": _anthropic_stream_text,
+    "google": _google_stream_text,
+}
+
+
 class APIServer:
     """OpenCode API Server - OpenAI 兼容接口"""
     
@@ -52,12 +140,41 @@ class APIServer:
         self.port = port
         self.app = Flask(__name__)
         
-        # 初始化调度器
+        # 初始化调度器 (构造时已加载一次 API Keys)
         self.dispatcher = SmartModelDispatcher()
+        self._key_refresh_lock = threading.Lock()
+        self._index_api_keys()
         self.model_selector = SmartModelSelector()
         # OpenClaw 整合
         self.openclaw_selector = OpenClawModelSelector()
-        self.performance_tracker = PerformanceTracker()
+        self.performance_tracker = PerformanceTracker.instance()
+        # 任务描述摘要 -> (过期时间, (model_id, reason))
+        self._selection_cache: "collections.OrderedDict[bytes, tuple]" = collections.OrderedDict()
+        self._selection_cache_lock = threading.Lock()
+        # 本进程缓存对应的失效标记 (标记文件的 mtime_ns，文件不存在时为 0)
+        self._selection_cache_stamp_file = SELECTION_CACHE_STAMP_DIR / f"api_server_{port}.cache_stamp"
+        self._selection_cache_stamp = self._read_selection_cache_stamp()
+        
+        # 已注册模型 -> 提供商 (精确匹配，未命中时再按关键词推断)
+        self._model_to_provider = {
+            model_id: model.provider
+            for model_id, model in self.model_selector.MODELS.items()
+        }
+        
+        # /v1/models 响应缓存 (模型可用性变化时重建)
+        self._models_payload: bytes = b""
+        self._models_payload_generation = -1
+        
+        # 上游 HTTP 连接池 (复用 TCP/TLS 连接)
+        self.http = self._create_http_session()
+        
+        # 提供商 -> 调用方法
+        self._dispatch = {
+            "anthropic": self._call_anthropic,
+            "google": self._call_google,
+            "openai": self._call_openai,
+            "deepseek": self._call_deepseek,
+        }
         
         # 注册路由
         self._register_routes()
@@ -69,36 +186,35 @@ class APIServer:
             logger.info("[V3] 工厂模式路由注册完成")
         except ImportError as e:
             logger.warning(f"[V3] 工厂模式导入失败: {e}")
-        self._register_routes()
         
         logger.info(f"API Server 初始化完成: {host}:{port}")
     
+    def _create_http_session(self) -> requests.Session:
+        """创建带连接池的上游请求 Session"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=UPSTREAM_POOL_CONNECTIONS,
+            pool_maxsize=UPSTREAM_POOL_MAXSIZE,
+            max_retries=Retry(total=2, backoff_factor=0.2)
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        # 声明 urllib3 能解码的全部压缩格式 (安装 brotli/zstandard 后自动包含 br/zstd)
+        session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        return session
+    
     def _register_routes(self):
         """注册 API 路由"""
         
         @self.app.route("/health", methods=["GET"])
         def health():
             """健康检查"""
-            return jsonify({"status": "ok", "service": "opencode-api-server"})
+            return json_response({"status": "ok", "service": "opencode-api-server"})
         
         @self.app.route("/v1/models", methods=["GET"])
         def list_models():
             """获取可用模型列表"""
-            models = []
-            for model_id, model in self.model_selector.MODELS.items():
-                if model.available:
-                    models.append({
-                        "id": model_id,
-                        "object": "model",
-                        "created": 1700000000,
-                        "owned_by": model.provider,
-                        "provider": model.provider
-                    })
-            
-            return jsonify({
-                "object": "list",
-                "data": models
-            })
+            return Response(self._get_models_payload(), mimetype="application/json")
         
         @self.app.route("/v1/chat/completions", methods=["POST"])
         def chat_completions():
@@ -107,24 +223,24 @@ class APIServer:
                 data = request.get_json()
                 
                 if not data:
-                    return jsonify({
+                    return json_response({
                         "error": {
                             "message": "Request body is required",
                             "type": "invalid_request_error",
                             "code": "missing_request_body"
                         }
-                    }), 400
+                    }, 400)
                 
                 # 提取消息
                 messages = data.get("messages", [])
                 if not messages:
-                    return jsonify({
+                    return json_response({
                         "error": {
                             "message": "messages is required",
                             "type": "invalid_request_error",
                             "code": "missing_messages"
                         }
-                    }), 400
+                    }, 400)
                 
                 # 提取模型
                 model = data.get("model", "gemini-1.5-pro")
@@ -134,22 +250,16 @@ class APIServer:
                 max_tokens = data.get("max_tokens", 4096)
                 stream = data.get("stream", False)
                 
-                # 构建任务描述
-                task_description = self._build_task_description(messages)
-                
                 # 选择模型
-                if model == "auto" or model == "smart-select":
+                if model in AUTO_MODEL_IDS:
                     # 智能选择
                     # OpenClaw 混合策略选择 (任务匹配 + 性能驱动)
-                    model_id, reason = self.openclaw_selector.select(task_description)
+                    task_description = self._build_task_description(messages)
+                    model_id, reason = self._select_model(task_description)
                     provider = self._get_provider_from_model(model_id)
                     logger.info(f"[OpenClaw] 智能选择: {model_id} ({provider}) - {reason}")
-                    # 原选择逻辑已由 OpenClaw 选择器替代
-                    model_id = selected_model.id
-                    provider = selected_model.provider
-                    logger.info(f"智能选择: {model_id} ({provider}) - {reason}")
                 else:
-                    # 指定模型
+                    # 指定模型: 无需构建任务描述
                     model_id = model
                     provider = self._get_provider_from_model(model)
                 
@@ -159,29 +269,47 @@ class APIServer:
                     model=model_id,
                     messages=messages,
                     temperature=temperature,
-                    max_tokens=max_tokens
+                    max_tokens=max_tokens,
+                    stream=stream
                 )
                 
                 if stream:
-                    return self._stream_response(response, model_id)
+                    return self._stream_response(response, provider, model_id)
                 
                 # 构建响应
                 return self._build_response(response, model_id, messages)
                 
             except Exception as e:
                 logger.error(f"Chat completions error: {e}")
-                return jsonify({
+                return json_response({
                     "error": {
                         "message": str(e),
                         "type": "internal_error",
                         "code": "internal_error"
                     }
-                }), 500
+                }, 500)
+        
+        @self.app.route("/admin/cache_clear", methods=["POST"])
+        def cache_clear():
+            """清空自动选模缓存
+            
+            更新失效标记文件: 处理本请求的 worker 立即清空，其余 worker 在下一次选模查询时清空。
+            返回值 cleared_local 只是本 worker 清除的条目数。
+            """
+            if not self._admin_authorized():
+                return json_response({
+                    "error": {
+                        "message": "Admin endpoints require a loopback client or a valid admin token",
+                        "type": "permission_error",
+                        "code": "forbidden"
+                    }
+                }, 403)
+            return json_response({"status": "ok", "cleared_local": self._clear_selection_cache()})
         
         @self.app.route("/", methods=["GET"])
         def root():
             """根路径"""
-            return jsonify({
+            return json_response({
                 "name": "OpenCode API Server",
                 "version": "1.0.0",
                 "description": "OpenAI compatible API for OpenCode Smart Model Selector"
@@ -200,11 +328,11 @@ class APIServer:
                 
                 data = request.get_json()
                 if not data:
-                    return jsonify({"error": {"message": "Request body is required"}}), 400
+                    return json_response({"error": {"message": "Request body is required"}}, 400)
                 
                 parsed = adapter.parse_chat_request(data)
                 
-                if parsed.get("model") in ["auto", "smart-select"]:
+                if parsed.get("model") in AUTO_MODEL_IDS:
                     model_id, reason = core.select(parsed["task_description"])
                 else:
                     model_id = parsed["model"]
@@ -212,7 +340,7 @@ class APIServer:
                 
                 logger.info(f"[V3/{platform}] 选择: {model_id} - {reason}")
                 
-                return jsonify({
+                return json_response({
                     "model": model_id,
                     "reason": reason,
                     "platform": platform
@@ -220,10 +348,10 @@ class APIServer:
                 
             except ValueError as e:
                 logger.warning(f"[V3] 平台未注册: {e}")
-                return jsonify({"error": {"message": str(e), "fallback": True}}), 400
+                return json_response({"error": {"message": str(e), "fallback": True}}, 400)
             except Exception as e:
                 logger.error(f"[V3] Error: {e}")
-                return jsonify({"error": {"message": str(e)}}), 500
+                return json_response({"error": {"message": str(e)}}, 500)
         
         @self.app.route("/v3/models", methods=["GET"])
         def v3_list_models():
@@ -242,87 +370,162 @@ class APIServer:
                         "capabilities": info["capabilities"]
                     })
                 
-                return jsonify({"object": "list", "data": data})
+                return json_response({"object": "list", "data": data})
                 
             except Exception as e:
                 logger.error(f"[V3] Error: {e}")
-                return jsonify({"error": {"message": str(e)}}), 500
+                return json_response({"error": {"message": str(e)}}, 500)
         
         @self.app.route("/v3/health", methods=["GET"])
         def v3_health():
-            return jsonify({
+            return json_response({
                 "status": "ok",
                 "service": "Smart Model Selector V3",
                 "platforms": SelectorFactory.list_platforms()
             })
     
+    def _get_models_payload(self) -> bytes:
+        """获取序列化后的模型列表，仅在模型可用性变化后重新构建"""
+        generation = self.model_selector.models_generation
+        if generation != self._models_payload_generation:
+            selector = self.model_selector
+            models = [
+                {
+                    "id": model_id,
+                    "object": "model",
+                    "created": 1700000000,
+                    "owned_by": model.provider,
+                    "provider": model.provider
+                }
+                for model_id, model in selector.MODELS.items()
+                if selector.is_available(model_id)
+            ]
+            self._models_payload = dumps_json({"object": "list", "data": models})
+            self._models_payload_generation = generation
+        return self._models_payload
+    
     def _build_task_description(self, messages: list) -> str:
         """从消息构建任务描述"""
-        parts = []
-        for msg in messages:
-            role = msg.get("role", "user")
-            content = msg.get("content", "")
-            parts.append(f"[{role}]: {content}")
-        return "\n".join(parts)
+        return build_task_from_messages(messages)
+    
+    def _select_model(self, task_description: str) -> tuple:
+        """自动选择模型 (按任务描述摘要缓存 SELECTION_CACHE_TTL 秒的 LRU)"""
+        key = hashlib.blake2b(task_description.encode("utf-8"), digest_size=16).digest()
+        now = time.monotonic()
+        cache = self._selection_cache
+        
+        stamp = self._read_selection_cache_stamp()
+        
+        with self._selection_cache_lock:
+            if stamp != self._selection_cache_stamp:
+                # 其他 worker 收到过 /admin/cache_clear
+                cache.clear()
+                self._selection_cache_stamp = stamp
+            entry = cache.get(key)
+            if entry is not None and entry[0] > now:
+                cache.move_to_end(key)
+                return entry[1]
+        
+        result = self.openclaw_selector.select(task_description)
+        
+        with self._selection_cache_lock:
+            cache[key] = (now + SELECTION_CACHE_TTL, result)
+            cache.move_to_end(key)
+            if len(cache) > SELECTION_CACHE_SIZE:
+                cache.popitem(last=False)
+        return result
+    
+    def _read_selection_cache_stamp(self) -> int:
+        """读取自动选模缓存的失效标记 (标记文件的 mtime_ns，文件不存在时为 0)"""
+        try:
+            return self._selection_cache_stamp_file.stat().st_mtime_ns
+        except OSError:
+            return 0
+    
+    def _clear_selection_cache(self) -> int:
+        """清空所有 worker 的自动选模缓存，返回本 worker 清除的条目数
+        
+        gunicorn 的每个 worker 进程各有一份缓存: 本 worker 立即清空，
+        并更新失效标记文件，其他 worker 在下一次查询时发现标记变化后清空
+        """
+        stamp_file = self._selection_cache_stamp_file
+        previous = self._read_selection_cache_stamp()
+        stamp_file.parent.mkdir(parents=True, exist_ok=True)
+        stamp_file.touch()
+        # 文件系统时间戳精度有限，连续两次清空时保证标记严格递增
+        stamp = max(time.time_ns(), previous + 1)
+        os.utime(stamp_file, ns=(stamp, stamp))
+        stamp = self._read_selection_cache_stamp()
+        with self._selection_cache_lock:
+            count = len(self._selection_cache)
+            self._selection_cache.clear()
+            self._selection_cache_stamp = stamp
+        return count
+    
+    def _admin_authorized(self) -> bool:
+        """管理接口鉴权: 配置了 ADMIN_TOKEN_ENV 时校验 Bearer 令牌，否则只允许本机回环地址"""
+        token = os.environ.get(ADMIN_TOKEN_ENV)
+        if token:
+            scheme, _, supplied = request.headers.get("Authorization", "").partition(" ")
+            return scheme.lower() == "bearer" and hmac.compare_digest(supplied.encode(), token.encode())
+        return request.remote_addr in ("127.0.0.1", "::1")
     
     def _get_provider_from_model(self, model: str) -> str:
         """从模型名推断提供商"""
-        model_lower = model.lower()
-        
-        if "claude" in model_lower:
-            return "anthropic"
-        elif "gemini" in model_lower:
-            return "google"
-        elif "gpt" in model_lower or "openai" in model_lower:
-            return "openai"
-        elif "deepseek" in model_lower:
-            return "deepseek"
-        elif "qwen" in model_lower or "silicon" in model_lower:
-            return "siliconflow"
-        elif "minimax" in model_lower:
-            return "minimax"
-        else:
-            return "google"  # 默认
+        return self._model_to_provider.get(model) or infer_provider(model)
     
     def _call_api(self, provider: str, model: str, messages: list, 
-                  temperature: float, max_tokens: int) -> Dict[str, Any]:
-        """调用 API"""
-        
-        # 使用调度器的预检逻辑
-        self.dispatcher.initialize_system()
+                  temperature: float, max_tokens: int, stream: bool = False) -> Any:
+        """调用 API
+        
+        返回值:
+        - stream=True: 未读取的上游 requests.Response，由 _stream_response 逐行转发
+        - OpenAI 兼容提供商: 上游原始响应体 (bytes)
+        - 其他提供商: 转换后的 OpenAI 格式字典
+        """
+        # 未知提供商回退到 Google
+        handler = self._dispatch.get(provider, self._call_google)
+        return handler(model, messages, temperature, max_tokens, stream)
+    
+    def _index_api_keys(self):
+        """按提供商建立 API Key 轮询索引"""
+        keys_by_provider = collections.defaultdict(list)
+        for api in self.dispatcher.api_keys:
+            keys_by_provider[api.provider].append(api.key)
         
-        # 构建请求格式
-        payload = {
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens
+        self._key_cycles = {
+            provider: itertools.cycle(keys)
+            for provider, keys in keys_by_provider.items()
         }
+        self._keys_loaded_at = time.time()
+    
+    def _refresh_api_keys(self):
+        """重新加载 API Keys (同一时间只允许一个线程刷新)"""
+        if not self._key_refresh_lock.acquire(blocking=False):
+            return
         
-        # 根据提供商构建请求
-        if provider == "anthropic":
-            return self._call_anthropic(model, messages, temperature, max_tokens)
-        elif provider == "google":
-            return self._call_google(model, messages, temperature, max_tokens)
-        elif provider == "openai":
-            return self._call_openai(model, messages, temperature, max_tokens)
-        elif provider == "deepseek":
-            return self._call_deepseek(model, messages, temperature, max_tokens)
-            return self._call_google(model, messages, temperature, max_tokens)
+        old_keys = self.dispatcher.api_keys
+        try:
+            self.dispatcher.api_keys = []
+            self.dispatcher.initialize_system()
+        except (Exception, SystemExit) as e:
+            # initialize_system 失败时会 sys.exit，服务器内不能让它退出进程
+            self.dispatcher.api_keys = old_keys
+            logger.warning(f"API Key 刷新失败，继续使用旧索引: {e}")
+        finally:
+            self._index_api_keys()
+            self._key_refresh_lock.release()
     
     def _find_valid_key(self, provider: str) -> Optional[str]:
-        """查找指定提供商的有效 API Key"""
-        # 初始化系统
-        self.dispatcher.initialize_system()
-        
-        # 查找该 provider 的 key
-        for api in self.dispatcher.api_keys:
-            if api.provider == provider:
-                return api.key
+        """查找指定提供商的有效 API Key (同一提供商的多个 Key 轮询使用)"""
+        if time.time() - self._keys_loaded_at > KEY_REFRESH_INTERVAL:
+            self._refresh_api_keys()
         
-        return None
+        key_cycle = self._key_cycles.get(provider)
+        return next(key_cycle) if key_cycle else None
 
     def _call_anthropic(self, model: str, messages: list, 
-                        temperature: float, max_tokens: int) -> Dict[str, Any]:
+                        temperature: float, max_tokens: int, stream: bool = False) -> Any:
         """调用 Anthropic API"""
         api_key = self._find_valid_key("anthropic")
         if not api_key:
@@ -349,20 +552,24 @@ class APIServer:
             "model": model,
             "messages": anthropic_messages,
             "temperature": temperature,
-            "max_tokens": max_tokens
+            "max_tokens": max_tokens,
+            "stream": stream
         }
         
         url = "https://api.anthropic.com/v1/messages"
         
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
+            response = self.http.post(url, headers=headers, json=payload,
+                                      timeout=UPSTREAM_TIMEOUT, stream=stream)
             response.raise_for_status()
+            if stream:
+                return response
             data = response.json()
             
             return {
                 "id": f"chatcmpl-{data.get('id', 'unknown')}",
                 "object": "chat.completion",
-                "created": data.get("created_time", int(__import__("time").time())),
+                "created": data.get("created_time", int(time.time())),
                 "model": model,
                 "choices": [{
                     "index": 0,
@@ -382,12 +589,15 @@ class APIServer:
             raise Exception(f"Anthropic API error: {e}")
     
     def _call_google(self, model: str, messages: list,
-                     temperature: float, max_tokens: int) -> Dict[str, Any]:
+                     temperature: float, max_tokens: int, stream: bool = False) -> Any:
         api_key = self._find_valid_key("google")
         if not api_key:
             raise Exception("No valid Google API key available")
         
-        url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
+        if stream:
+            url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent?alt=sse&key={api_key}"
+        else:
+            url = f"https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent?key={api_key}"
         
         # 转换消息格式
         contents = []
@@ -411,19 +621,22 @@ class APIServer:
         }
         
         try:
-            response = requests.post(url, json=payload, timeout=60)
+            response = self.http.post(url, json=payload, timeout=UPSTREAM_TIMEOUT, stream=stream)
             response.raise_for_status()
+            if stream:
+                return response
             data = response.json()
             
             if "candidates" not in data:
                 raise Exception(f"Google API error: {data}")
             
             content = data["candidates"][0]["content"]["parts"][0]["text"]
+            now = int(time.time())
             
             return {
-                "id": f"chatcmpl-google-{int(__import__("time").time())}",
+                "id": f"chatcmpl-google-{now}",
                 "object": "chat.completion",
-                "created": int(__import__("time").time()),
+                "created": now,
                 "model": model,
                 "choices": [{
                     "index": 0,
@@ -443,7 +656,7 @@ class APIServer:
             raise Exception(f"Google API error: {e}")
     
     def _call_openai(self, model: str, messages: list,
-                     temperature: float, max_tokens: int) -> Dict[str, Any]:
+                     temperature: float, max_tokens: int, stream: bool = False) -> Any:
         api_key = self._find_valid_key("openai")
         if not api_key:
             raise Exception("No valid OpenAI API key available")
@@ -458,18 +671,23 @@ class APIServer:
             "model": model,
             "messages": messages,
             "temperature": temperature,
-            "max_tokens": max_tokens
+            "max_tokens": max_tokens,
+            "stream": stream
         }
         
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
+            response = self.http.post(url, headers=headers, json=payload,
+                                      timeout=UPSTREAM_TIMEOUT, stream=stream)
             response.raise_for_status()
-            return response.json()
+            if stream:
+                return response
+            # 上游已是 OpenAI 格式，原样透传响应体，省去解析与再序列化
+            return response.content
         except requests.exceptions.RequestException as e:
             raise Exception(f"OpenAI API error: {e}")
     
     def _call_deepseek(self, model: str, messages: list,
-                       temperature: float, max_tokens: int) -> Dict[str, Any]:
+                       temperature: float, max_tokens: int, stream: bool = False) -> Any:
         api_key = self._find_valid_key("deepseek")
         if not api_key:
             raise Exception("No valid DeepSeek API key available")
@@ -484,70 +702,112 @@ class APIServer:
             "model": model,
             "messages": messages,
             "temperature": temperature,
-            "max_tokens": max_tokens
+            "max_tokens": max_tokens,
+            "stream": stream
         }
         
         try:
-            response = requests.post(url, headers=headers, json=payload, timeout=60)
+            response = self.http.post(url, headers=headers, json=payload,
+                                      timeout=UPSTREAM_TIMEOUT, stream=stream)
             response.raise_for_status()
-            return response.json()
+            if stream:
+                return response
+            # 上游已是 OpenAI 格式，原样透传响应体，省去解析与再序列化
+            return response.content
         except requests.exceptions.RequestException as e:
             raise Exception(f"DeepSeek API error: {e}")
     
-    def _build_response(self, response: Dict[str, Any], model: str, 
-                        messages: list) -> Dict[str, Any]:
+    def _build_response(self, response: Any, model: str, 
+                        messages: list) -> "Response":
         """构建响应"""
-        return jsonify(response)
+        if isinstance(response, bytes):
+            return Response(response, mimetype="application/json")
+        return json_response(response)
     
-    def _stream_response(self, response: Dict[str, Any], model: str):
-        """流式响应 (兼容 OpenAI SSE 协议)"""
+    def _stream_response(self, upstream: requests.Response, provider: str, model: str):
+        """流式响应 (兼容 OpenAI SSE 协议)
+        
+        OpenAI 兼容的提供商原样透传 SSE 行；Anthropic/Google 逐事件转换为 OpenAI chunk。
+        """
+        extract_text = STREAM_TEXT_EXTRACTORS.get(provider)
+        # 每个流独立的适配器实例 (块模板不可跨线程共享)
+        adapter = OpenClawAdapter()
+        
         def generate():
-            # 1. 提取上游同步返回的完整文本内容
             try:
-                content = response.get("choices", [{}])[0].get("message", {}).get("content", "")
-            except Exception:
-                content = "⚠️ 模型未返回有效内容"
-
-            # 2. 模拟打字机效果的分块流式输出
-            chunk_size = 15  # 每次吐出的字符数
-            for i in range(0, len(content), chunk_size):
-                chunk = content[i:i+chunk_size]
-                data = {
-                    "id": f"chatcmpl-{int(time.time())}",
-                    "object": "chat.completion.chunk",
-                    "created": int(time.time()),
-                    "model": model,
-                    "choices": [{"index": 0, "delta": {"content": chunk}}]
-                }
-                # 遵循 Server-Sent Events (SSE) 格式规范
-                yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
-                time.sleep(0.01)  # 极短延迟模拟流式平滑输出
-
-            # 3. 发送结束标志
-            yield "data: [DONE]\n\n"
-
-        return Response(stream_with_context(generate()), content_type='text/event-stream')
-        """流式响应（暂不支持）"""
-        return jsonify({
-            "error": {
-                "message": "Streaming not supported yet",
-                "type": "invalid_request_error",
-                "code": "streaming_not_supported"
-            }
-        }), 400
+                for line in upstream.iter_lines():
+                    if not line.startswith(b"data:"):
+                        continue
+                    
+                    if extract_text is None:
+                        # 上游已是 OpenAI 格式 (包括 [DONE])，直接转发
+                        yield line + SSE_EVENT_END
+                        continue
+                    
+                    try:
+                        event = loads_json(line[5:])
+                    except ValueError:
+                        continue
+                    text = extract_text(event)
+                    if text:
+                        yield adapter.format_stream_chunk(model, text)
+                
+                if extract_text is not None:
+                    yield adapter.format_stream_end()
+            finally:
+                upstream.close()
+        
+        return Response(stream_with_context(generate()), mimetype="text/event-stream")
     
+    def run(self, workers: int = DEFAULT_WORKERS, threads: int = DEFAULT_THREADS):
+        """启动服务器
+        
+        已安装 gunicorn 时使用 gthread worker (workers × threads 个并发请求)，
+        否则降级为 Flask 内置服务器 (每个请求一个线程)。
+        
+        Args:
+            workers: gunicorn worker 进程数
+            threads: 每个 worker 的线程数
+        """
         logger.info(f"启动 API Server: http://{self.host}:{self.port}")
-        # 尝试使用 gunicorn 提高并发性能
         try:
-            import gunicorn
-            # gunicorn 方式启动
-            from gunicorn.app.wsgiapp import WSGIApplication
-            logger.info("使用 gunicorn 并发服务器")
-            WSGIApplication("__main__:app").run()
+            from gunicorn.app.base import BaseApplication
         except ImportError:
-            # 降级到 Flask 内置服务器
             logger.warning("gunicorn 未安装，使用 Flask 内置服务器")
             self.app.run(host=self.host, port=self.port, debug=False, threaded=True)
+            return
+        
+        class GunicornApplication(BaseApplication):
+            """以当前 Flask app 运行 gunicorn (preload 后 fork worker)"""
+            
+            def __init__(self, app, options: Dict[str, Any]):
+                self.application = app
+                self.options = options
+                super().__init__()
+            
+            def load_config(self):
+                for key, value in self.options.items():
+                    self.cfg.set(key, value)
+            
+            def load(self):
+                return self.application
+        
+        logger.info(f"使用 gunicorn 并发服务器: {workers} workers × {threads} threads")
+        GunicornApplication(self.app, {
+            "bind": f"{self.host}:{self.port}",
+            "workers": workers,
+            "threads": threads,
+            "worker_class": "gthread",
+            "timeout": 120,
+        }).run()
+
+
+def create_app():
+    """WSGI 应用工厂
+
+    用法: gunicorn -k gthread -w 4 --threads 32 'api_server:create_app()'
+    """
+    return APIServer().app
 
 
 def main():
@@ -566,6 +826,18 @@ def main():
         default=8080,
         help="监听端口 (默认: 8080)"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"gunicorn worker 进程数 (默认: {DEFAULT_WORKERS})"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=DEFAULT_THREADS,
+        help=f"每个 worker 的线程数 (默认: {DEFAULT_THREADS})"
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
@@ -580,7 +852,7 @@ def main():
         sys.exit(1)
     
     server = APIServer(host=args.host, port=args.port)
-    server.run()
+    server.run(workers=args.workers, threads=args.threads)
 
 
 if __name__ == "__main__":
@@ -9,11 +9,21 @@ V3.0.0 - 通用架构
 """
 
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, Tuple
+from typing import Container, Dict, Any, Optional, Tuple
+import json
 import logging
+import sys
+import time
 
 logger = logging.getLogger("base_adapter")
 
+# 尝试导入 orjson (C 扩展，序列化速度远高于标准库 json)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 
 class BasePlatformAdapter(ABC):
     """平台适配器抽象基类"""
@@ -109,7 +119,7 @@ class BaseAPIServerAdapter(BasePlatformAdapter):
     
     @abstractmethod
     def format_stream_chunk(self, model: str, content: str, 
-                           chunk_index: int = 0) -> str:
+                           chunk_index: int = 0) -> bytes:
         """
         格式化流式响应块
         
@@ -119,7 +129,7 @@ class BaseAPIServerAdapter(BasePlatformAdapter):
             chunk_index: 块索引
         
         Returns:
-            SSE 格式的数据块
+            SSE 格式的数据块 (UTF-8 字节串，可直接写入响应流)
         """
         pass
 
@@ -159,13 +169,61 @@ class BaseCLIAdapter(BasePlatformAdapter):
 
 # ============ 工具函数 ============
 
-def validate_model_id(model_id: str, valid_models: list) -> bool:
+# 表示"由选择器自动选择模型"的模型 ID
+AUTO_MODEL_IDS = frozenset({"auto", "smart-select"})
+
+
+def dumps_json(data: Any, indent: bool = False) -> bytes:
+    """
+    序列化为 UTF-8 编码的 JSON 字节串
+    
+    优先使用 orjson，未安装时回退到标准库 json (ensure_ascii=False)。
+    
+    Args:
+        data: 待序列化的对象
+        indent: 是否缩进两格输出
+    
+    Returns:
+        JSON 字节串
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(data, ensure_ascii=False, indent=2 if indent else None).encode("utf-8")
+
+
+def loads_json(data: Any) -> Any:
+    """
+    解析 JSON 字节串或字符串 (优先使用 orjson)
+    
+    Args:
+        data: JSON 字节串或字符串
+    
+    Returns:
+        解析后的对象
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def emit_json(data: Any, pretty: bool = False):
+    """
+    将 JSON 写到标准输出 (CLI 输出统一入口)
+    
+    Args:
+        data: 待输出的对象
+        pretty: 是否缩进 (面向人阅读的输出用缩进，供脚本解析的输出保持紧凑)
+    """
+    sys.stdout.write(dumps_json(data, indent=pretty).decode("utf-8") + "\n")
+
+
+def validate_model_id(model_id: str, valid_models: Container[str]) -> bool:
     """
     验证模型 ID 是否有效
     
     Args:
         model_id: 模型 ID
-        valid_models: 有效模型列表
+        valid_models: 有效模型集合 (建议预先构建 frozenset，成员判断为 O(1))
     
     Returns:
         是否有效
@@ -188,6 +246,23 @@ def extract_messages(request_data: Dict) -> list:
     return []
 
 
+# 常见角色的前缀标签 (预先构造，避免每条消息格式化一次)
+_ROLE_TAGS = {
+    "user": "[user]: ",
+    "assistant": "[assistant]: ",
+    "system": "[system]: ",
+    "tool": "[tool]: ",
+}
+
+
+def _format_message(msg: Dict) -> str:
+    """将单条消息格式化为 "[role]: content" """
+    role = msg.get("role", "user")
+    content = msg.get("content", "")
+    tag = _ROLE_TAGS.get(role) or f"[{role}]: "
+    return tag + (content if isinstance(content, str) else str(content))
+
+
 def build_task_from_messages(messages: list) -> str:
     """
     从消息列表构建任务描述
@@ -198,12 +273,7 @@ def build_task_from_messages(messages: list) -> str:
     Returns:
         任务描述字符串
     """
-    parts = []
-    for msg in messages:
-        role = msg.get("role", "user")
-        content = msg.get("content", "")
-        parts.append(f"[{role}]: {content}")
-    return "\n".join(parts)
+    return "\n".join(map(_format_message, messages))
 
 
 def create_error_response(message: str, code: str = "internal_error") -> Dict:
@@ -239,12 +309,11 @@ def create_success_response(model: str, content: str,
     Returns:
         成功响应字典
     """
-    import time
-    
+    now = int(time.time())
     response = {
-        "id": f"chatcmpl-{int(time.time())}",
+        "id": f"chatcmpl-{now}",
         "object": "chat.completion",
-        "created": int(time.time()),
+        "created": now,
         "model": model,
         "choices": [{
             "index": 0,
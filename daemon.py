@@ -6,63 +6,94 @@ OpenCode 运行时监控守护进程
 2. 后台监控 API 健康状态
 3. 故障时自动切换到备用模型
 
-支持两种运行模式：
+支持三种运行模式：
 - 前台模式: python3 daemon.py start (调试用)
 - 后台模式: python3 daemon.py daemon (真正的守护进程)
+- systemd: opencode-daemon.service (Type=notify，由 systemd 托管，无需 fork)
 """
 
-import json
+import errno
+import functools
 import logging
 import os
+import selectors
 import signal
+import socket
 import sys
 import time
 from pathlib import Path
-from typing import Dict, Optional
-import requests
-from threading import Thread, Event
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Optional, Set, Tuple
+from urllib.parse import urlsplit
+from threading import Thread, Event, Lock
 import argparse
 import fcntl
+from concurrent.futures import ThreadPoolExecutor
 from logging.handlers import RotatingFileHandler
 
 sys.path.insert(0, str(Path(__file__).parent))
-from smart_model_dispatcher import SmartModelDispatcher
+from base_adapter import loads_json
+
+# requests / SmartModelDispatcher 在首次使用时导入，status/stop 等命令无需加载
+if TYPE_CHECKING:
+    import requests
 
 LOG_DIR = Path.home() / ".config" / "opencode"
-LOG_DIR.mkdir(parents=True, exist_ok=True)
 LOG_FILE = LOG_DIR / "daemon.log"
 
-handler = RotatingFileHandler(
-    LOG_FILE,
-    maxBytes=5 * 1024 * 1024,
-    backupCount=3
-)
-handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
-
-logging.basicConfig(
-    level=logging.INFO,
-    handlers=[handler, logging.StreamHandler()]
-)
 logger = logging.getLogger("OpenCodeDaemon")
 
+
+def setup_logging(foreground: bool):
+    """配置日志输出
+    
+    后台模式下 stdout/stderr 已重定向到 /dev/null，只写日志文件，
+    避免每条日志都格式化并写入被丢弃的终端输出。
+    """
+    LOG_DIR.mkdir(parents=True, exist_ok=True)
+    handler = RotatingFileHandler(
+        LOG_FILE,
+        maxBytes=5 * 1024 * 1024,
+        backupCount=3
+    )
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S'))
+    
+    handlers = [handler]
+    if foreground:
+        handlers.append(logging.StreamHandler())
+    
+    logging.basicConfig(level=logging.INFO, handlers=handlers)
+
 PID_FILE = Path.home() / ".config" / "opencode" / "daemon.pid"
 AUTH_CONFIG = Path.home() / ".local" / "share" / "opencode" / "auth.json"
 CHECK_INTERVAL = 30  # 每30秒检查一次
 HEALTH_CHECK_TIMEOUT = 5
+HEALTH_CHECK_CACHE_TTL = 10  # 健康检查结果缓存时间 (秒)，切换时避免重复探测刚检查过的 Provider
+HEALTH_CHECK_POOL_SIZE = 16  # 健康检查连接池大小 (不小于 Provider 数量)
+
 
+# 健康检查 URL 模板 (只请求一条模型记录，避免拉取完整模型列表)
+GOOGLE_HEALTH_TEMPLATE = "{base}/v1beta/models?key={key}&pageSize=1"
+DEEPSEEK_HEALTH_TEMPLATE = "{base}/v1/models?limit=1"
+DEFAULT_HEALTH_TEMPLATE = "{base}/models?limit=1"
 
-# Provider 配置常量
+# Provider 配置常量: (key 名称, base URL, 健康检查 URL 模板)
 PROVIDER_CONFIGS = {
-    "google": ("google_api_key", "https://generativelanguage.googleapis.com"),
-    "deepseek": ("deepseek_api_key", "https://api.deepseek.com"),
-    "anthropic": ("anthropic_api_key", "https://api.anthropic.com/v1"),
-    "siliconflow": ("siliconflow_api_key", "https://api.siliconflow.cn/v1"),
-    "minimax": ("minimax_api_key", "https://api.minimax.chat/v1"),
-    "kimi": ("kimi_api_key", "https://api.moonshot.cn/v1"),
-    "doubao": ("doubao_api_key", "https://ark.cn-beijing.volces.com/api/v1"),
-    "groq": ("groq_api_key", "https://api.groq.com/openai/v1"),
-    "openrouter": ("openrouter_api_key", "https://openrouter.ai/api/v1"),
-    "zhipuai": ("zhipuai_api_key", "https://open.bigmodel.cn/api/paas/v4"),
+    "google": ("google_api_key", "https://generativelanguage.googleapis.com", GOOGLE_HEALTH_TEMPLATE),
+    "deepseek": ("deepseek_api_key", "https://api.deepseek.com", DEEPSEEK_HEALTH_TEMPLATE),
+    "anthropic": ("anthropic_api_key", "https://api.anthropic.com/v1", DEFAULT_HEALTH_TEMPLATE),
+    "siliconflow": ("siliconflow_api_key", "https://api.siliconflow.cn/v1", DEFAULT_HEALTH_TEMPLATE),
+    "minimax": ("minimax_api_key", "https://api.minimax.chat/v1", DEFAULT_HEALTH_TEMPLATE),
+    "kimi": ("kimi_api_key", "https://api.moonshot.cn/v1", DEFAULT_HEALTH_TEMPLATE),
+    "doubao": ("doubao_api_key", "https://ark.cn-beijing.volces.com/api/v1", DEFAULT_HEALTH_TEMPLATE),
+    "groq": ("groq_api_key", "https://api.groq.com/openai/v1", DEFAULT_HEALTH_TEMPLATE),
+    "openrouter": ("openrouter_api_key", "https://openrouter.ai/api/v1", DEFAULT_HEALTH_TEMPLATE),
+    "zhipuai": ("zhipuai_api_key", "https://open.bigmodel.cn/api/paas/v4", DEFAULT_HEALTH_TEMPLATE),
+}
+
+# Provider -> 主机名 (用于 TCP 可达性预检)
+PROVIDER_HOSTS = {
+    provider: urlsplit(base_url).hostname
+    for provider, (_, base_url, _) in PROVIDER_CONFIGS.items()
 }
 
 # Provider 到 Profile 的映射
@@ -80,6 +111,93 @@ PROVIDER_TO_PROFILE = {
 }
 
 
+def sd_notify(state: bytes) -> bool:
+    """向 systemd 发送状态通知 (未由 systemd 启动时为空操作)"""
+    address = os.environ.get("NOTIFY_SOCKET")
+    if not address:
+        return False
+    if address.startswith("@"):
+        # 抽象命名空间 socket
+        address = "\0" + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(state)
+        return True
+    except OSError as e:
+        logger.warning(f"systemd 通知失败: {e}")
+        return False
+
+
+def resolve_host(host: str, port: int = 443) -> Optional[Tuple[str, tuple]]:
+    """解析主机地址，失败返回 None"""
+    try:
+        family, type_, proto, _, address = socket.getaddrinfo(
+            host, port, type=socket.SOCK_STREAM
+        )[0]
+    except (OSError, IndexError):
+        return None
+    return host, (family, type_, proto, address)
+
+
+def tcp_reachable(endpoints: Iterable[Tuple[str, tuple]],
+                  timeout: float = HEALTH_CHECK_TIMEOUT) -> Set[str]:
+    """单线程非阻塞 connect + selectors (Linux 上为 epoll) 批量探测可达性
+    
+    Args:
+        endpoints: (主机名, (family, type, proto, address)) 列表
+        timeout: 整批探测的超时时间
+    
+    Returns:
+        TCP 握手成功的主机名集合
+    """
+    selector = selectors.DefaultSelector()
+    reachable = set()
+    try:
+        for host, (family, type_, proto, address) in endpoints:
+            sock = socket.socket(family, type_, proto)
+            sock.setblocking(False)
+            err = sock.connect_ex(address)
+            if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                sock.close()
+                continue
+            selector.register(sock, selectors.EVENT_WRITE, host)
+        
+        deadline = time.monotonic() + timeout
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for key, _ in selector.select(remaining):
+                sock = key.fileobj
+                if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0:
+                    reachable.add(key.data)
+                selector.unregister(sock)
+                sock.close()
+    finally:
+        for key in list(selector.get_map().values()):
+            key.fileobj.close()
+        selector.close()
+    return reachable
+
+
+def is_daemon_process(pid: int) -> bool:
+    """确认 PID 属于本守护进程，避免 PID 被其他进程复用时误判
+
+    仅在 Linux 上通过 /proc/<pid>/cmdline 校验，其他平台无法判断时视为匹配。
+    """
+    if sys.platform != "linux":
+        return True
+    try:
+        with open(f"/proc/{pid}/cmdline", "rb") as f:
+            cmdline = f.read().replace(b"\0", b" ")
+    except FileNotFoundError:
+        return False
+    except OSError:
+        return True
+    return b"daemon.py" in cmdline or b"opencode" in cmdline
+
+
 class OpenCodeDaemon:
     def __init__(self):
         self.base_dir = Path(__file__).parent
@@ -87,6 +205,17 @@ class OpenCodeDaemon:
         self.stop_event = Event()
         self.proxy = self._get_proxy()
         self.dispatcher = None
+        self._session: Optional["requests.Session"] = None
+        self._session_lock = Lock()
+        self._auth_cache = None  # (mtime_ns, auth.json 解析结果)
+        self._health_cache: Dict[str, tuple] = {}  # provider -> (检查时间, 结果)
+        # provider -> 预先绑定 URL/headers 的探测函数，auth.json 变化时重建
+        self._probes: Dict[str, Callable[[], tuple]] = {}
+        self._probes_auth: Optional[Dict] = None
+        # 常驻探测线程池，所有 Provider 可同时探测，避免每次切换都新建线程
+        self._probe_executor = ThreadPoolExecutor(
+            max_workers=len(PROVIDER_CONFIGS), thread_name_prefix="health-probe"
+        )
         
     def _get_proxy(self) -> Optional[Dict[str, str]]:
         http_proxy = os.environ.get('HTTP_PROXY') or os.environ.get('http_proxy')
@@ -100,30 +229,66 @@ class OpenCodeDaemon:
         
         return proxy_dict if proxy_dict else None
     
+    def _get_session(self) -> "requests.Session":
+        """获取健康检查复用的 Session (首次使用时创建)"""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+    
+    def _create_session(self) -> "requests.Session":
+        """创建健康检查复用的 Session (保持 TCP/TLS 长连接)"""
+        import requests
+        from requests.adapters import HTTPAdapter
+        
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=HEALTH_CHECK_POOL_SIZE,
+            pool_maxsize=HEALTH_CHECK_POOL_SIZE,
+            max_retries=0
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if self.proxy:
+            session.proxies.update(self.proxy)
+        return session
+    
     def load_api_keys(self) -> Dict:
-        """加载 API Keys"""
+        """加载 API Keys (按文件 mtime 缓存，文件未变化时不重复解析)
+        
+        返回的字典为共享缓存，调用方不应修改。
+        """
         try:
-            if AUTH_CONFIG.exists():
-                with open(AUTH_CONFIG, 'r') as f:
-                    return json.load(f)
+            mtime = AUTH_CONFIG.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._auth_cache = None
+            return {}
         except Exception as e:
             logger.error(f"加载 API keys 失败: {e}")
-        return {}
+            return {}
+        
+        cached = self._auth_cache
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        
+        try:
+            data = loads_json(AUTH_CONFIG.read_bytes())
+        except Exception as e:
+            logger.error(f"加载 API keys 失败: {e}")
+            return {}
+        
+        self._auth_cache = (mtime, data)
+        return data
     
     def get_current_provider(self) -> Optional[str]:
         """获取当前使用的 provider"""
-        try:
-            if AUTH_CONFIG.exists():
-                with open(AUTH_CONFIG, 'r') as f:
-                    data = json.load(f)
-                    return data.get("api_provider", "")
-        except Exception:
-            pass
-        return None
+        return self.load_api_keys().get("api_provider")
     
     def get_provider_key_name(self, provider: str) -> tuple:
         """获取 provider 对应的 key 名称和 base URL"""
-        return PROVIDER_CONFIGS.get(provider, ("", ""))
+        key_name, base_url, _ = PROVIDER_CONFIGS.get(provider, ("", "", DEFAULT_HEALTH_TEMPLATE))
+        return key_name, base_url
     
     def check_api_health(self, api_key: str, base_url: str, provider: str) -> bool:
         """检查单个 API 是否健康"""
@@ -131,20 +296,66 @@ class OpenCodeDaemon:
         return is_healthy
     
     def check_api_health_detailed(self, api_key: str, base_url: str, provider: str) -> tuple:
-        """检查 API 健康状态，返回 (是否健康, 是否余额不足)"""
-        headers = {"Authorization": f"Bearer {api_key}"}
+        """检查任意 key 的 API 健康状态，返回 (是否健康, 是否余额不足)
         
-        if provider == "google":
-            url = f"{base_url}/v1beta/models?key={api_key}"
-        elif provider == "deepseek":
-            url = f"{base_url}/v1/models"
-        else:
-            url = f"{base_url}/models"
+        不走缓存；检查 auth.json 中已配置的 provider 请使用 check_provider_health。
+        """
+        return self._make_probe(api_key, base_url, provider)()
+    
+    def check_provider_health(self, provider: str, force: bool = False) -> tuple:
+        """检查已配置 provider 的健康状态，返回 (是否健康, 是否余额不足)
         
+        HEALTH_CHECK_CACHE_TTL 秒内复用上次结果，force=True 时强制重新探测。
+        """
+        probe = self._get_probes().get(provider)
+        if probe is None:
+            return False, False
+        
+        if not force:
+            cached = self._health_cache.get(provider)
+            if cached and time.monotonic() - cached[0] < HEALTH_CHECK_CACHE_TTL:
+                return cached[1]
+        
+        result = probe()
+        self._health_cache[provider] = (time.monotonic(), result)
+        return result
+    
+    def _get_probes(self) -> Dict[str, Callable[[], tuple]]:
+        """获取已配置 key 的 provider 探测函数 (auth.json 变化时重建并清空结果缓存)"""
+        auth_data = self.load_api_keys()
+        if auth_data is not self._probes_auth:
+            self._probes = {
+                provider: self._make_probe(auth_data[key_name], base_url, provider)
+                for provider, (key_name, base_url, _) in PROVIDER_CONFIGS.items()
+                if auth_data.get(key_name)
+            }
+            self._probes_auth = auth_data
+            self._health_cache.clear()
+        return self._probes
+    
+    def _make_probe(self, api_key: str, base_url: str, provider: str) -> Callable[[], tuple]:
+        """生成绑定了 URL 和 headers 的探测函数"""
+        config = PROVIDER_CONFIGS.get(provider)
+        template = config[2] if config else DEFAULT_HEALTH_TEMPLATE
+        url = template.format(base=base_url, key=api_key)
+        headers = {"Authorization": f"Bearer {api_key}"}
+        return functools.partial(self._probe_health, provider, url, headers)
+    
+    def _probe_health(self, provider: str, url: str, headers: Dict[str, str]) -> tuple:
+        """实际发起健康检查请求，返回 (是否健康, 是否余额不足)"""
+        import requests
+        
+        session = self._get_session()
         try:
-            with requests.get(url, headers=headers, timeout=HEALTH_CHECK_TIMEOUT, proxies=self.proxy) as response:
-                # 只认可 200 为健康状态
-                if response.status_code == 200:
+            # 优先使用 HEAD (无响应体)，不支持时回退到 GET
+            response = session.head(url, headers=headers, timeout=HEALTH_CHECK_TIMEOUT)
+            if response.status_code == 405:
+                response.close()
+                response = session.get(url, headers=headers, timeout=HEALTH_CHECK_TIMEOUT)
+            
+            with response:
+                # 2xx/3xx 视为健康 (兼容 HEAD 的各种返回)
+                if response.status_code < 400:
                     return True, False
                 
                 # 402 表示余额不足
@@ -166,6 +377,7 @@ class OpenCodeDaemon:
         
         try:
             if not self.dispatcher:
+                from smart_model_dispatcher import SmartModelDispatcher
                 self.dispatcher = SmartModelDispatcher()
             
             success = self.dispatcher.activate_profile("research")
@@ -180,17 +392,39 @@ class OpenCodeDaemon:
     def get_all_providers_health(self) -> Dict[str, bool]:
         """获取所有可用 Provider 的健康状态"""
         health_status = {}
-        auth_data = self.load_api_keys()
-        
-        for provider, (key_name, base_url) in PROVIDER_CONFIGS.items():
-            api_key = auth_data.get(key_name, "")
-            if api_key:
-                is_healthy = self.check_api_health(api_key, base_url, provider)
-                health_status[provider] = is_healthy
-                logger.info(f"  {provider}: {'✅ 健康' if is_healthy else '❌ 不可用'}")
+        targets = list(self._get_probes())
+        unreachable = self._find_unreachable_providers(targets)
+        
+        # 并发探测可达的 Provider，总耗时约等于最慢的单个探测
+        futures = {
+            provider: self._probe_executor.submit(self.check_provider_health, provider)
+            for provider in targets
+            if provider not in unreachable
+        }
+        # 结果仍按 PROVIDER_CONFIGS 顺序排列
+        for provider in targets:
+            future = futures.get(provider)
+            is_healthy = future.result()[0] if future else False
+            health_status[provider] = is_healthy
+            logger.info(f"  {provider}: {'✅ 健康' if is_healthy else '❌ 不可用'}")
         
         return health_status
     
+    def _find_unreachable_providers(self, providers: Iterable[str]) -> Set[str]:
+        """TCP 预检: 一次 select 找出握手失败的 Provider，跳过其 HTTPS 探测
+        
+        配置了代理时直连结果不可信，不做预检。
+        """
+        if self.proxy:
+            return set()
+        
+        hosts_by_provider = {p: PROVIDER_HOSTS[p] for p in providers if PROVIDER_HOSTS.get(p)}
+        hosts = set(hosts_by_provider.values())
+        # DNS 解析是阻塞调用，放到探测线程池中并发执行
+        endpoints = [e for e in self._probe_executor.map(resolve_host, hosts) if e]
+        reachable = tcp_reachable(endpoints)
+        return {p for p, host in hosts_by_provider.items() if host not in reachable}
+    
     def switch_to_backup(self, current_provider: str, reason: str = "不健康"):
         """切换到备用模型 (基于健康状态)
         
@@ -220,6 +454,7 @@ class OpenCodeDaemon:
         
         try:
             if not self.dispatcher:
+                from smart_model_dispatcher import SmartModelDispatcher
                 self.dispatcher = SmartModelDispatcher()
             
             success = self.dispatcher.activate_profile(profile)
@@ -252,22 +487,18 @@ class OpenCodeDaemon:
                 if not current_provider:
                     logger.warning("未检测到有效 provider，执行启动加载...")
                     self.auto_startup()
-                    time.sleep(CHECK_INTERVAL)
+                    self.stop_event.wait(CHECK_INTERVAL)
                     continue
                 
-                # 加载 keys，使用当前 provider 的特定 key
-                auth_data = self.load_api_keys()
-                key_name, base_url = self.get_provider_key_name(current_provider)
-                api_key = auth_data.get(key_name, "")
-                
-                if not api_key:
+                # 当前 provider 需已配置 key
+                if current_provider not in self._get_probes():
                     logger.warning(f"未找到 {current_provider} 的 API key，执行启动加载...")
                     self.auto_startup()
-                    time.sleep(CHECK_INTERVAL)
+                    self.stop_event.wait(CHECK_INTERVAL)
                     continue
                 
                 # 检查当前 API 是否健康 (区分余额不足)
-                is_healthy, is_balance_insufficient = self.check_api_health_detailed(api_key, base_url, current_provider)
+                is_healthy, is_balance_insufficient = self.check_provider_health(current_provider)
                 
                 # 余额不足或 API 不健康都需要切换
                 if is_balance_insufficient:
@@ -292,9 +523,9 @@ class OpenCodeDaemon:
             if consecutive_failures > 2:
                 backoff_time = min(CHECK_INTERVAL * (2 ** (consecutive_failures - 2)), max_backoff)
                 logger.info(f"⏳ 连续失败 {consecutive_failures} 次，使用退避间隔 {backoff_time}秒")
-                time.sleep(backoff_time)
+                self.stop_event.wait(backoff_time)
             else:
-                time.sleep(CHECK_INTERVAL)
+                self.stop_event.wait(CHECK_INTERVAL)
     
     def _signal_handler(self, signum, frame):
         """优雅处理退出信号"""
@@ -308,6 +539,8 @@ class OpenCodeDaemon:
         Args:
             daemon_mode: True 表示真正的后台守护进程，False 表示前台运行(调试用)
         """
+        setup_logging(foreground=not daemon_mode)
+        
         # 注册信号处理器 - 优雅退出
         signal.signal(signal.SIGTERM, self._signal_handler)
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -364,8 +597,8 @@ class OpenCodeDaemon:
         health_thread.start()
         
         try:
-            while self.running:
-                time.sleep(1)
+            # 阻塞直到 stop() 设置事件 (信号处理器中调用)，无需轮询
+            self.stop_event.wait()
         except KeyboardInterrupt:
             pass
         finally:
@@ -385,9 +618,11 @@ class OpenCodeDaemon:
         health_thread = Thread(target=self.health_check_loop, daemon=True)
         health_thread.start()
         
+        # systemd (Type=notify) 托管时通知已就绪
+        sd_notify(b"READY=1")
+        
         try:
-            while self.running:
-                time.sleep(1)
+            self.stop_event.wait()
         except KeyboardInterrupt:
             logger.info("收到停止信号")
             self.stop()
@@ -398,6 +633,8 @@ class OpenCodeDaemon:
         """停止守护进程"""
         self.running = False
         self.stop_event.set()
+        sd_notify(b"STOPPING=1")
+        self._probe_executor.shutdown(wait=False)
         
         if PID_FILE.exists():
             PID_FILE.unlink()
@@ -448,6 +685,11 @@ class OpenCodeDaemon:
             with open(PID_FILE, 'r') as f:
                 pid = int(f.read().strip())
             os.kill(pid, 0)
+            if not is_daemon_process(pid):
+                # PID 已被其他进程复用，清理 stale PID 文件
+                logger.warning(f"PID {pid} 不是 OpenCode 守护进程，清理 PID 文件")
+                PID_FILE.unlink(missing_ok=True)
+                return False
             return True
         except (FileNotFoundError, ProcessLookupError, ValueError, PermissionError):
             # PID文件不存在或进程已死，清理后认为未运行
@@ -469,6 +711,11 @@ def daemon_stop():
             with open(PID_FILE, 'r') as f:
                 pid = int(f.read().strip())
             
+            if not is_daemon_process(pid):
+                PID_FILE.unlink(missing_ok=True)
+                print(f"进程 {pid} 不是 OpenCode 守护进程，已清理 PID 文件")
+                return
+            
             # 先发送 SIGTERM (优雅退出)
             os.kill(pid, signal.SIGTERM)
             print(f"✅ 已发送 SIGTERM 信号到进程 {pid}")
@@ -9,9 +9,7 @@ OpenCode Smart Model Selector - Dual Engine Manager
 - 状态持久化：记录当前使用的引擎
 """
 
-import json
 import logging
-import os
 import sys
 from pathlib import Path
 from typing import Optional, Tuple
@@ -21,7 +19,8 @@ from enum import Enum
 SCRIPT_DIR = Path(__file__).parent
 sys.path.insert(0, str(SCRIPT_DIR))
 
-from model_selector import SmartModelSelector
+from base_adapter import dumps_json, loads_json
+from file_writer import write_file_atomic
 
 logger = logging.getLogger("dual_engine")
 
@@ -43,30 +42,42 @@ class DualEngineManager:
     
     def __init__(self):
         self.current_engine = self._load_engine_state()
-        self.custom_selector = SmartModelSelector()
+        # 最近一次持久化的引擎，状态未变化时跳过写盘
+        self._last_saved = self.current_engine
+        self._custom_selector = None
         self.failure_count = 0
-        
+    
+    @property
+    def custom_selector(self):
+        """自定义引擎选择器 (首次使用时加载，--status/--engine 无需导入)"""
+        if self._custom_selector is None:
+            from model_selector import SmartModelSelector
+            self._custom_selector = SmartModelSelector()
+        return self._custom_selector
+    
     def _load_engine_state(self) -> EngineType:
         """加载引擎状态"""
         try:
             if self.ENGINE_STATE_FILE.exists():
-                with open(self.ENGINE_STATE_FILE, 'r') as f:
-                    data = json.load(f)
-                    engine = data.get("engine", "custom")
-                    return EngineType.CUSTOM if engine == "custom" else EngineType.NATIVE
+                data = loads_json(self.ENGINE_STATE_FILE.read_bytes())
+                engine = data.get("engine", "custom")
+                return EngineType.CUSTOM if engine == "custom" else EngineType.NATIVE
         except Exception:
             pass
         return EngineType.CUSTOM
     
     def _save_engine_state(self):
-        """保存引擎状态"""
+        """保存引擎状态
+        
+        只持久化当前引擎 (失败计数是进程内的瞬时状态)，且仅在引擎变化时写盘。
+        经 write_file_atomic 原子写入，避免崩溃时留下半截文件。
+        """
+        if self.current_engine == self._last_saved:
+            return
+        
         try:
-            self.ENGINE_STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.ENGINE_STATE_FILE, 'w') as f:
-                json.dump({
-                    "engine": self.current_engine.value,
-                    "failure_count": self.failure_count
-                }, f)
+            write_file_atomic(self.ENGINE_STATE_FILE, dumps_json({"engine": self.current_engine.value}))
+            self._last_saved = self.current_engine
         except Exception as e:
             logger.warning(f"无法保存引擎状态: {e}")
     
@@ -92,17 +103,15 @@ class DualEngineManager:
     def record_failure(self):
         """记录失败次数"""
         self.failure_count += 1
-        self._save_engine_state()
         
         if self.failure_count >= self.CIRCUIT_BREAK_THRESHOLD:
             logger.warning(f"⚠️ 熔断触发！连续失败 {self.failure_count} 次，切换到原生引擎")
             self.current_engine = EngineType.NATIVE
+            self._save_engine_state()
     
     def record_success(self):
         """记录成功，清零失败计数"""
-        if self.failure_count > 0:
-            self.failure_count = 0
-            self._save_engine_state()
+        self.failure_count = 0
     
     def select(self, task_description: str) -> Tuple[str, str]:
         """
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+文件写入工具
+
+原子写文件，以及由单个后台线程执行的异步写盘 (统计缓存等频繁写出的文件用)。
+"""
+
+import logging
+import os
+import queue
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("file_writer")
+
+
+def write_file_atomic(path: Any, payload: bytes):
+    """
+    原子写文件: 先写同目录下的临时文件，再 os.replace 覆盖，避免留下半截文件
+
+    临时文件名带 pid 和线程 id，多个进程 (如 gunicorn 的多个 worker) 同时写同一文件时
+    不会截断或覆盖彼此的临时文件
+
+    Args:
+        path: 目标文件路径 (Path)
+        payload: 文件内容
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with open(tmp_file, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp_file, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_file)
+        except OSError:
+            pass
+        raise
+
+
+# 后台写盘: 队列里只放路径，内容放在 _pending_writes 中，
+# 同一路径在写出前被多次提交时只保留最新内容
+_write_queue: "queue.Queue[Any]" = queue.Queue()
+_pending_writes: Dict[Any, bytes] = {}
+_pending_lock = threading.Lock()
+_writer_thread: Optional[threading.Thread] = None
+
+
+def _writer_loop():
+    """唯一的写盘线程，依次写出队列中的文件"""
+    while True:
+        path = _write_queue.get()
+        try:
+            with _pending_lock:
+                payload = _pending_writes.pop(path, None)
+            if payload is not None:
+                write_file_atomic(path, payload)
+        except Exception as e:
+            logger.debug(f"后台写盘失败 {path}: {e}")
+        finally:
+            _write_queue.task_done()
+
+
+def write_file_async(path: Any, payload: bytes):
+    """
+    提交一次后台原子写，立即返回 (磁盘延迟不落在调用方线程)
+
+    Args:
+        path: 目标文件路径 (Path)
+        payload: 文件内容 (由调用方序列化好，后台线程不再访问调用方的数据)
+    """
+    global _writer_thread
+    with _pending_lock:
+        queued = path in _pending_writes
+        _pending_writes[path] = payload
+        if _writer_thread is None:
+            _writer_thread = threading.Thread(target=_writer_loop, name="file-writer", daemon=True)
+            _writer_thread.start()
+    if not queued:
+        _write_queue.put(path)
+
+
+def wait_for_writes():
+    """等待已提交的后台写全部完成 (进程退出前调用)"""
+    if _writer_thread is not None:
+        _write_queue.join()
@@ -11,13 +11,28 @@
 Author: OpenCode AI Assistant
 """
 
+import functools
 import json
+import logging
 import re
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 from dataclasses import dataclass
-from enum import Enum
+from enum import Enum, IntEnum
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 尝试导入 pyahocorasick (多关键词一次扫描的 Aho-Corasick 自动机)
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
 
 # 颜色输出
 class Colors:
@@ -40,9 +55,33 @@ class Colors:
     @staticmethod
     def bold(s): return f"{Colors.BOLD}{s}{Colors.RESET}"
 
+
+SEPARATOR = Colors.cyan("=" * 60)
+
+USAGE = """用法: python3 model_selector.py [选项] <任务描述>
+
+选项:
+  --json     JSON 格式输出（供脚本调用）
+
+示例:
+  python3 model_selector.py '帮我写一个 Python 排序算法'
+  python3 model_selector.py --json '帮我翻译'
+
+中文关键词支持:
+  编程: 写代码、写程序、写函数、开发
+  分析: 分析、检查、审查、优化
+  调试: 错误、修复、崩溃、bug
+  写作: 写文档、写文章、写博客
+  翻译: 翻译、什么意思、怎么写
+  聊天: 你好、在吗、聊聊
+"""
+
 # 直接 import dispatcher
 sys.path.insert(0, str(Path(__file__).parent))
 from smart_model_dispatcher import SmartModelDispatcher
+from base_adapter import emit_json
+
+logger = logging.getLogger("model_selector")
 
 
 class TaskType(Enum):
@@ -66,19 +105,132 @@ class Priority(Enum):
     TIER_3 = 3  # 其他付费
 
 
-@dataclass
+class SpeedRank(IntEnum):
+    """模型速度 (数值越小越快，可直接比较和排序)"""
+    FASTEST = 0
+    FAST = 1
+    MEDIUM = 2
+    SLOW = 3
+    
+    @property
+    def label(self) -> str:
+        """对外展示的速度名称 (fastest/fast/medium/slow)"""
+        return self.name.lower()
+
+
+@dataclass(frozen=True)
 class Model:
-    """模型配置"""
+    """模型配置 (不可变，可用性由 SmartModelSelector 按实例维护)"""
+    # Python 3.8 不支持 dataclass(slots=True)，手动声明 __slots__ (字段均无默认值)
+    __slots__ = (
+        "id", "name", "provider", "priority", "strengths", "weaknesses",
+        "cost_per_1k_tokens", "context_window", "speed",
+    )
+    
     id: str
     name: str
     provider: str
     priority: Priority
-    strengths: List[str]      # 擅长领域
-    weaknesses: List[str]     # 不擅长领域
+    strengths: Tuple[str, ...]    # 擅长领域
+    weaknesses: Tuple[str, ...]   # 不擅长领域
     cost_per_1k_tokens: float
     context_window: int
-    speed: str               # fast/medium/slow
-    available: bool = True
+    speed: SpeedRank
+
+
+# 纯字面量交替式，如 "(编程|函数|算法)"，可直接交给 Aho-Corasick 自动机匹配
+_LITERAL_ALTERNATION = re.compile(r"^\(([^\\()\[\]{}.*+?^$|]+(?:\|[^\\()\[\]{}.*+?^$|]+)*)\)$")
+
+# IGNORECASE 正则把 'ı' (U+0131)、'ſ' (U+017F) 当作 i、s，而 lower() 不改变它们
+_AUTOMATON_FOLD = str.maketrans({"\u0131": "i", "\u017f": "s"})
+
+
+def _automaton_text(text: str) -> str:
+    """Aho-Corasick 自动机匹配用的文本: 小写，并按 IGNORECASE 的规则折叠 ı、ſ"""
+    lowered = text.lower()
+    if "\u0131" in lowered or "\u017f" in lowered:
+        lowered = lowered.translate(_AUTOMATON_FOLD)
+    return lowered
+
+
+class PatternMatcher:
+    """多模式匹配器
+    
+    每个模式包成一个可选的零宽前瞻分组 (?=(?:<任意前缀>(?P<名>模式))?)，全部拼成一个正则，
+    一次 match 即可得到哪些模式在文本中出现过；前瞻不消耗文本，各模式互不影响，
+    结果与逐个模式 search 相同。
+    pyahocorasick 可用时，纯字面量的关键词模式改由自动机匹配 (自动机区分大小写，匹配 _automaton_text 副本)，
+    其余模式仍走合并后的正则 (IGNORECASE，直接匹配原文)。
+    """
+    
+    def __init__(self, named_patterns: Dict[str, str]):
+        """
+        Args:
+            named_patterns: {分组名: 正则}，按优先级排列
+        """
+        keywords: Dict[str, List[str]] = {}
+        regex_patterns: Dict[str, str] = {}
+        for name, pattern in named_patterns.items():
+            literal = _LITERAL_ALTERNATION.match(pattern) if AHOCORASICK_AVAILABLE else None
+            if literal:
+                keywords[name] = literal.group(1).split("|")
+            else:
+                regex_patterns[name] = pattern
+        
+        self._regex = None
+        self._any_regex = None
+        if regex_patterns:
+            self._regex = re.compile(
+                "".join(f"(?=(?:[\\s\\S]*?(?P<{name}>{p}))?)" for name, p in regex_patterns.items()),
+                re.IGNORECASE,
+            )
+            # 只需判断是否有任一模式命中时用普通交替式，找到第一个命中即返回
+            self._any_regex = re.compile("|".join(f"(?:{p})" for p in regex_patterns.values()), re.IGNORECASE)
+        
+        self._automaton = None
+        if keywords:
+            # 关键词 -> 包含它的所有模式名 (同一关键词可能出现在多个模式中，命中时每个模式都算出现)
+            owners: Dict[str, Tuple[str, ...]] = {}
+            for name, words in keywords.items():
+                for word in words:
+                    word = word.lower()
+                    if name not in owners.get(word, ()):
+                        owners[word] = owners.get(word, ()) + (name,)
+            self._automaton = ahocorasick.Automaton()
+            for word, names in owners.items():
+                self._automaton.add_word(word, names)
+            self._automaton.make_automaton()
+    
+    def matched(self, text: str, lowered: Optional[str] = None) -> Set[str]:
+        """在 text 中出现过的模式名集合 (每个模式至多计一次)
+        
+        Args:
+            text: 原文
+            lowered: _automaton_text(text) 的结果，多个匹配器共用时由调用方传入避免重复转换
+        """
+        found: Set[str] = set()
+        if self._regex is not None:
+            for name, value in self._regex.match(text).groupdict().items():
+                if value is not None:
+                    found.add(name)
+        if self._automaton is not None:
+            # iter 产出所有 (含相互重叠的) 命中，短关键词不会被包含它的长关键词挡掉
+            for _, names in self._automaton.iter(lowered if lowered is not None else _automaton_text(text)):
+                found.update(names)
+        return found
+    
+    def search(self, text: str, lowered: Optional[str] = None) -> bool:
+        """是否有任一模式命中 (找到第一个命中即返回)
+        
+        Args:
+            text: 原文
+            lowered: text.lower() 的结果 (可选，同 matched)
+        """
+        if self._any_regex is not None and self._any_regex.search(text) is not None:
+            return True
+        if self._automaton is not None:
+            return next(self._automaton.iter(lowered if lowered is not None else _automaton_text(text)), None) is not None
+        return False
 
 
 class TaskAnalyzer:
@@ -140,8 +292,19 @@ class TaskAnalyzer:
         ],
     }
     
-    # 预编译所有正则表达式
-    PATTERNS = {k: [re.compile(p, re.IGNORECASE) for p in v] for k, v in _PATTERN_STRINGS.items()}
+    # 所有任务类型的模式合并匹配，classify 只需一次 match
+    # 分组名为 "<任务类型>_<序号>"，每个命中的模式为对应任务类型计 1 分
+    CLASSIFY_MATCHER = PatternMatcher({
+        f"{task_type.name}_{i}": p
+        for task_type, patterns in _PATTERN_STRINGS.items()
+        for i, p in enumerate(patterns)
+    })
+    _TASK_TYPE_ORDER = tuple(_PATTERN_STRINGS)
+    _GROUP_TYPE_INDEX = {
+        f"{task_type.name}_{i}": index
+        for index, (task_type, patterns) in enumerate(_PATTERN_STRINGS.items())
+        for i in range(len(patterns))
+    }
     
     # 复杂度指标 (预编译)
     _COMPLEXITY_STRINGS = [
@@ -153,7 +316,7 @@ class TaskAnalyzer:
         r'\b(multi-|cross-|poly-)\b',
         r'(复杂|困难|高级|专家|架构|系统设计|微服务|分布式|优化|性能|高并发)',
     ]
-    COMPLEXITY_PATTERNS = [re.compile(p, re.IGNORECASE) for p in _COMPLEXITY_STRINGS]
+    COMPLEXITY_MATCHER = PatternMatcher({f"C{i}": p for i, p in enumerate(_COMPLEXITY_STRINGS)})
     
     # 紧急任务指标 (预编译)
     _URGENT_STRINGS = [
@@ -162,48 +325,77 @@ class TaskAnalyzer:
         r'\b(broken|critical|emergency|help)\b',
         r'(紧急|马上|立刻|立即|着急|deadline|截止|崩溃|严重|救命)',
     ]
-    URGENT_PATTERNS = [re.compile(p, re.IGNORECASE) for p in _URGENT_STRINGS]
+    URGENT_MATCHER = PatternMatcher({f"U{i}": p for i, p in enumerate(_URGENT_STRINGS)})
     
     def __init__(self, task: str):
-        self.task = task.lower()
+        # 正则以 IGNORECASE 直接匹配原文，与匹配 task.lower() 结果相同，只有一个例外:
+        # lower() 把 'İ' (U+0130) 变成 'i' + U+0307 两个字符，IGNORECASE 却把它当作 'i'，
+        # 含有它时仍匹配小写文本，保持原有分类结果
+        self.task = task.lower() if "\u0130" in task else task
+        # 只有 Aho-Corasick 自动机需要小写副本
+        self._lowered = _automaton_text(self.task) if AHOCORASICK_AVAILABLE else None
     
     def classify(self) -> TaskType:
         """分析任务类型"""
-        scores = {}
-        
-        for task_type, compiled_patterns in self.PATTERNS.items():
-            score = 0
-            for pattern in compiled_patterns:
-                if pattern.search(self.task):
-                    score += 1
-            scores[task_type] = score
-        
-        best_type = max(scores, key=lambda k: scores[k])
-        
-        if scores[best_type] == 0:
+        # 每个命中的模式计 1 分，同分时按 _PATTERN_STRINGS 中的顺序取靠前的类型
+        group_index = self._GROUP_TYPE_INDEX
+        scores = [0] * len(self._TASK_TYPE_ORDER)
+        for name in self.CLASSIFY_MATCHER.matched(self.task, self._lowered):
+            scores[group_index[name]] += 1
+        
+        best_score = max(scores)
+        if best_score == 0:
             return TaskType.GENERAL
-        return best_type
+        return self._TASK_TYPE_ORDER[scores.index(best_score)]
     
     def get_complexity(self) -> float:
         """评估任务复杂度 (0.0 - 1.0)"""
-        score = 0
-        for pattern in self.COMPLEXITY_PATTERNS:
-            if pattern.search(self.task):
-                score += 0.15
-        
-        return min(1.0, score)
+        return min(1.0, 0.15 * len(self.COMPLEXITY_MATCHER.matched(self.task, self._lowered)))
     
     def is_urgent(self) -> bool:
-        """是否紧急任务"""
-        for pattern in self.URGENT_PATTERNS:
-            if pattern.search(self.task):
-                return True
-        return False
+        """是否紧急任务 (所有紧急指标合并为一次扫描)"""
+        return self.URGENT_MATCHER.search(self.task, self._lowered)
+
+
+# 常见极短提示词 -> 任务类型 (整句精确匹配，结果与完整分析一致: 复杂度 0、非紧急)
+_FAST_LOOKUP_MAX_LEN = 20
+_FAST_LOOKUP = {
+    "hi": TaskType.CHAT,
+    "hello": TaskType.CHAT,
+    "hey": TaskType.CHAT,
+    "你好": TaskType.CHAT,
+    "在吗": TaskType.CHAT,
+    "聊聊": TaskType.CHAT,
+    "bug": TaskType.DEBUGGING,
+    "error": TaskType.DEBUGGING,
+    "debug": TaskType.DEBUGGING,
+    "报错": TaskType.DEBUGGING,
+    "translate": TaskType.TRANSLATION,
+    "翻译": TaskType.TRANSLATION,
+}
+
+
+@functools.lru_cache(maxsize=512)
+def analyze_task(task: str) -> Tuple[TaskType, float, bool]:
+    """分析任务，返回 (任务类型, 复杂度, 是否紧急)
+    
+    结果只取决于任务文本，按文本缓存，重复的任务不再执行正则扫描。
+    常见的极短提示词直接查表，不进入正则扫描。
+    """
+    if len(task) < _FAST_LOOKUP_MAX_LEN:
+        task_type = _FAST_LOOKUP.get(task.strip().lower())
+        if task_type is not None:
+            return task_type, 0.0, False
+    
+    analyzer = TaskAnalyzer(task)
+    return analyzer.classify(), analyzer.get_complexity(), analyzer.is_urgent()
 
 
 class APIHealthChecker:
     """API 健康检查器 - 快速检查模型可用性"""
     
+    AUTH_CONFIG = Path.home() / ".local" / "share" / "opencode" / "auth.json"
+    
     # Provider 端点配置
     PROVIDER_ENDPOINTS = {
         "google": ("https://generativelanguage.googleapis.com/v1beta/models?key={key}", "google_api_key"),
@@ -219,22 +411,46 @@ class APIHealthChecker:
         Args:
             cache_ttl: 缓存有效期(秒)，默认60秒
         """
-        import time
-        self._cache: Dict[str, tuple] = {}
+        # auth.json 解析结果缓存: (mtime_ns, key_map)
+        self._keys_cache: Optional[Tuple[int, Dict[str, str]]] = None
+        
+        # provider -> (是否可用, 过期时间 monotonic)
+        self._cache: Dict[str, Tuple[bool, float]] = {}
         self._cache_ttl = cache_ttl
-        self._cache_time: Dict[str, float] = {}
+        
+        # 复用 TCP/TLS 连接的 Session
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+    
+    def close(self):
+        """关闭连接池"""
+        self._session.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+    
+    def _set_cache(self, provider: str, is_healthy: bool):
+        """写入检查结果及其过期时间"""
+        self._cache[provider] = (is_healthy, time.monotonic() + self._cache_ttl)
     
     def _load_api_keys(self) -> Dict[str, str]:
-        """从 auth.json 加载 API keys"""
-        import json
-        from pathlib import Path
-        
-        auth_config = Path.home() / ".local" / "share" / "opencode" / "auth.json"
-        if not auth_config.exists():
+        """从 auth.json 加载 API keys (按文件 mtime 缓存，文件未变化时不重复解析)"""
+        try:
+            mtime_ns = self.AUTH_CONFIG.stat().st_mtime_ns
+        except OSError:
             return {}
         
+        keys_cache = self._keys_cache
+        if keys_cache is not None and keys_cache[0] == mtime_ns:
+            return keys_cache[1]
+        
         try:
-            with open(auth_config, 'r') as f:
+            with open(self.AUTH_CONFIG, 'r') as f:
                 data = json.load(f)
         except Exception:
             return {}
@@ -245,25 +461,22 @@ class APIHealthChecker:
             if key_name in data:
                 key_map[provider] = data[key_name]
         
+        self._keys_cache = (mtime_ns, key_map)
         return key_map
     
     def check_provider(self, provider: str) -> bool:
         """检查单个 provider 是否可用"""
-        import time
-        import requests
-        
-        # 检查缓存
-        if provider in self._cache:
-            if time.time() - self._cache_time.get(provider, 0) < self._cache_ttl:
-                return self._cache[provider]
+        # 检查缓存 (单次查找，元组读写是原子的)
+        hit = self._cache.get(provider)
+        if hit is not None and hit[1] > time.monotonic():
+            return hit[0]
         
         # 加载 keys
         keys = self._load_api_keys()
         api_key = keys.get(provider)
         
         if not api_key:
-            self._cache[provider] = False
-            self._cache_time[provider] = time.time()
+            self._set_cache(provider, False)
             return False
         
         # 快速健康检查 (2秒超时)
@@ -274,24 +487,38 @@ class APIHealthChecker:
         try:
             if "{key}" in endpoint:
                 url = endpoint.format(key=api_key)
-                response = requests.get(url, timeout=2)
+                response = self._session.get(url, timeout=2)
             else:
                 headers = {"Authorization": f"Bearer {api_key}"}
-                response = requests.get(url, headers=headers, timeout=2)
+                response = self._session.get(endpoint, headers=headers, timeout=2)
             
             is_healthy = response.status_code == 200
-            self._cache[provider] = is_healthy
-            self._cache_time[provider] = time.time()
+            self._set_cache(provider, is_healthy)
             return is_healthy
         except Exception:
-            self._cache[provider] = False
-            self._cache_time[provider] = time.time()
+            self._set_cache(provider, False)
             return False
     
     def get_available_providers(self) -> Dict[str, bool]:
-        """获取所有 provider 的可用状态"""
-        return {provider: self.check_provider(provider) 
-                for provider in self.PROVIDER_ENDPOINTS.keys()}
+        """获取所有 provider 的可用状态 (并发检查，总耗时约为单次超时)"""
+        with ThreadPoolExecutor(max_workers=len(self.PROVIDER_ENDPOINTS)) as executor:
+            futures = {
+                provider: executor.submit(self.check_provider, provider)
+                for provider in self.PROVIDER_ENDPOINTS
+            }
+            return {provider: future.result() for provider, future in futures.items()}
+
+
+# 全局健康检查器 (所有选择器共享连接池和结果缓存)
+_health_checker: Optional[APIHealthChecker] = None
+
+
+def get_health_checker() -> APIHealthChecker:
+    """获取全局健康检查器单例"""
+    global _health_checker
+    if _health_checker is None:
+        _health_checker = APIHealthChecker()
+    return _health_checker
 
 
 class SmartModelSelector:
@@ -305,22 +532,22 @@ class SmartModelSelector:
             name="Gemini 1.5 Pro",
             provider="google",
             priority=Priority.TIER_1,
-            strengths=["coding", "analysis", "reasoning", "long-context", "multimodal"],
-            weaknesses=["creative-writing"],
+            strengths=("coding", "analysis", "reasoning", "long-context", "multimodal"),
+            weaknesses=("creative-writing",),
             cost_per_1k_tokens=0.0025,
             context_window=2000000,
-            speed="medium",
+            speed=SpeedRank.MEDIUM,
         ),
         "gemini-2.0-pro": Model(
             id="gemini-2.0-pro",
             name="Gemini 2.0 Pro",
             provider="google",
             priority=Priority.TIER_1,
-            strengths=["coding", "analysis", "reasoning", "long-context", "math", "science"],
-            weaknesses=["creative"],
+            strengths=("coding", "analysis", "reasoning", "long-context", "math", "science"),
+            weaknesses=("creative",),
             cost_per_1k_tokens=0.003,
             context_window=2000000,
-            speed="fast",
+            speed=SpeedRank.FAST,
         ),
         
         # Tier 2: 免费模型
@@ -329,44 +556,44 @@ class SmartModelSelector:
             name="Gemini 1.5 Flash",
             provider="google",
             priority=Priority.TIER_2,
-            strengths=["fast", "chat", "translation", "simple-coding"],
-            weaknesses=["deep-analysis", "complex-reasoning"],
+            strengths=("fast", "chat", "translation", "simple-coding"),
+            weaknesses=("deep-analysis", "complex-reasoning"),
             cost_per_1k_tokens=0.000075,
             context_window=1000000,
-            speed="fast",
+            speed=SpeedRank.FAST,
         ),
         "gemini-1.5-flash-8b": Model(
             id="gemini-1.5-flash-8b",
             name="Gemini 1.5 Flash-8B",
             provider="google",
             priority=Priority.TIER_2,
-            strengths=["fast", "simple-tasks", "chat"],
-            weaknesses=["complex-tasks"],
+            strengths=("fast", "simple-tasks", "chat"),
+            weaknesses=("complex-tasks",),
             cost_per_1k_tokens=0.000075,
             context_window=1000000,
-            speed="fastest",
+            speed=SpeedRank.FASTEST,
         ),
         "qwen-2.5-72b": Model(
             id="qwen-2.5-72b",
             name="Qwen 2.5 72B",
             provider="siliconflow",
             priority=Priority.TIER_2,
-            strengths=["coding", "math", "chinese", "reasoning"],
-            weaknesses=["english-creative"],
+            strengths=("coding", "math", "chinese", "reasoning"),
+            weaknesses=("english-creative",),
             cost_per_1k_tokens=0.00014,
             context_window=131072,
-            speed="fast",
+            speed=SpeedRank.FAST,
         ),
         "deepseek-chat": Model(
             id="deepseek-chat",
             name="DeepSeek Chat",
             provider="deepseek",
             priority=Priority.TIER_2,
-            strengths=["coding", "reasoning", "cost-effective"],
-            weaknesses=["creative-writing"],
+            strengths=("coding", "reasoning", "cost-effective"),
+            weaknesses=("creative-writing",),
             cost_per_1k_tokens=0.00014,
             context_window=128000,
-            speed="fast",
+            speed=SpeedRank.FAST,
         ),
         
         # Tier 3: 其他付费模型
@@ -375,105 +602,145 @@ class SmartModelSelector:
             name="Claude 3.5 Sonnet",
             provider="anthropic",
             priority=Priority.TIER_3,
-            strengths=["coding", "analysis", "writing", "reasoning", "safety"],
-            weaknesses=["speed"],
+            strengths=("coding", "analysis", "writing", "reasoning", "safety"),
+            weaknesses=("speed",),
             cost_per_1k_tokens=0.015,
             context_window=200000,
-            speed="medium",
+            speed=SpeedRank.MEDIUM,
         ),
         "claude-3.7-sonnet": Model(
             id="claude-3.7-sonnet",
             name="Claude 3.7 Sonnet",
             provider="anthropic",
             priority=Priority.TIER_3,
-            strengths=["coding", "analysis", "complex-reasoning", "writing"],
-            weaknesses=["speed"],
+            strengths=("coding", "analysis", "complex-reasoning", "writing"),
+            weaknesses=("speed",),
             cost_per_1k_tokens=0.015,
             context_window=200000,
-            speed="medium",
+            speed=SpeedRank.MEDIUM,
         ),
         "gpt-4o": Model(
             id="gpt-4o",
             name="GPT-4o",
             provider="openai",
             priority=Priority.TIER_3,
-            strengths=["multimodal", "coding", "analysis", "chat"],
-            weaknesses=["cost"],
+            strengths=("multimodal", "coding", "analysis", "chat"),
+            weaknesses=("cost",),
             cost_per_1k_tokens=0.01,
             context_window=128000,
-            speed="medium",
+            speed=SpeedRank.MEDIUM,
         ),
         "gpt-4o-mini": Model(
             id="gpt-4o-mini",
             name="GPT-4o Mini",
             provider="openai",
             priority=Priority.TIER_3,
-            strengths=["fast", "cost-effective", "simple-tasks"],
-            weaknesses=["complex-reasoning"],
+            strengths=("fast", "cost-effective", "simple-tasks"),
+            weaknesses=("complex-reasoning",),
             cost_per_1k_tokens=0.0006,
             context_window=128000,
-            speed="fast",
+            speed=SpeedRank.FAST,
         ),
     }
     
     # 任务类型 -> 最佳模型匹配
     TASK_MODEL_MAP = {
-        TaskType.CODING: [
+        TaskType.CODING: (
             "gemini-2.0-pro",
             "claude-3.7-sonnet",
             "qwen-2.5-72b",
             "deepseek-chat",
             "gemini-1.5-pro",
-        ],
-        TaskType.ANALYSIS: [
+        ),
+        TaskType.ANALYSIS: (
             "gemini-2.0-pro",
             "claude-3.5-sonnet",
             "gpt-4o",
             "gemini-1.5-flash",
-        ],
-        TaskType.DEBUGGING: [
+        ),
+        TaskType.DEBUGGING: (
             "claude-3.7-sonnet",
             "gemini-2.0-pro",
             "deepseek-chat",
             "gpt-4o-mini",
-        ],
-        TaskType.WRITING: [
+        ),
+        TaskType.WRITING: (
             "claude-3.5-sonnet",
             "gpt-4o",
             "gemini-1.5-pro",
-        ],
-        TaskType.TRANSLATION: [
+        ),
+        TaskType.TRANSLATION: (
             "gemini-1.5-flash",
             "qwen-2.5-72b",
             "deepseek-chat",
-        ],
-        TaskType.CHAT: [
+        ),
+        TaskType.CHAT: (
             "gemini-1.5-flash",
             "gemini-1.5-flash-8b",
             "gpt-4o-mini",
-        ],
-        TaskType.RESEARCH: [
+        ),
+        TaskType.RESEARCH: (
             "gemini-2.0-pro",
             "claude-3.5-sonnet",
             "gpt-4o",
-        ],
-        TaskType.CREATIVE: [
+        ),
+        TaskType.CREATIVE: (
             "claude-3.5-sonnet",
             "gemini-1.5-pro",
             "gpt-4o",
-        ],
-        TaskType.MATH: [
+        ),
+        TaskType.MATH: (
             "gemini-2.0-pro",
             "qwen-2.5-72b",
             "deepseek-chat",
-        ],
-        TaskType.GENERAL: [
+        ),
+        TaskType.GENERAL: (
             "gemini-1.5-pro",
             "claude-3.5-sonnet",
             "gemini-1.5-flash",
-        ],
+        ),
     }
     
+    # 长文本降级: 超过阈值 (tokens) 的非 coding 任务优先使用免费长上下文模型
+    LONG_TEXT_THRESHOLD = 8000
+    LONG_TEXT_MODELS = ("gemini-1.5-flash", "qwen-2.5-72b")
+    
+    # 成本敏感的任务类型 (非紧急、低复杂度时按成本排序)
+    COST_SENSITIVE_TASKS = frozenset({TaskType.CHAT, TaskType.TRANSLATION, TaskType.GENERAL})
+    
+    # 按任务类型预先解析、排好序的候选模型 (由 _build_indices 在类定义后填充)
+    _CANDIDATES_DEFAULT: Dict[TaskType, Tuple[Model, ...]] = {}
+    _CANDIDATES_HIGH_PRIORITY: Dict[TaskType, Tuple[Model, ...]] = {}  # 复杂任务: 仅 Tier 1/2
+    _CANDIDATES_BY_SPEED: Dict[TaskType, Tuple[Model, ...]] = {}       # 紧急任务: 按速度
+    _CANDIDATES_BY_COST: Dict[TaskType, Tuple[Model, ...]] = {}        # 成本敏感: 按成本
+    _CANDIDATE_TABLES = {
+        "default": _CANDIDATES_DEFAULT,
+        "high_priority": _CANDIDATES_HIGH_PRIORITY,
+        "speed": _CANDIDATES_BY_SPEED,
+        "cost": _CANDIDATES_BY_COST,
+    }
+    
+    # 后台健康检查的最小刷新间隔 (秒)，与 APIHealthChecker 缓存 TTL 一致
+    HEALTH_REFRESH_INTERVAL = 60
+    
+    @classmethod
+    def _build_indices(cls):
+        """根据 MODELS 和 TASK_MODEL_MAP 预计算候选列表，select 无需再查表和排序"""
+        for task_type in TaskType:
+            model_ids = cls.TASK_MODEL_MAP.get(task_type, cls.TASK_MODEL_MAP[TaskType.GENERAL])
+            models = tuple(cls.MODELS[m] for m in model_ids if m in cls.MODELS)
+            cls._CANDIDATES_DEFAULT[task_type] = models
+            cls._CANDIDATES_HIGH_PRIORITY[task_type] = tuple(
+                m for m in models if m.priority.value <= 2
+            )
+            cls._CANDIDATES_BY_SPEED[task_type] = tuple(
+                sorted(models, key=lambda m: m.speed)
+            )
+            cls._CANDIDATES_BY_COST[task_type] = tuple(
+                sorted(models, key=lambda m: m.cost_per_1k_tokens)
+            )
+
+    
     def __init__(self, available_keys: Optional[Dict[str, bool]] = None, enable_health_check: bool = True):
         """初始化智能模型选择器
         
@@ -481,7 +748,7 @@ class SmartModelSelector:
             available_keys: 静态可用性配置 (可选)
             enable_health_check: 是否启用动态健康检查 (默认启用)
         """
-        self._health_checker = APIHealthChecker() if enable_health_check else None
+        self._health_checker = get_health_checker() if enable_health_check else None
         self._static_available_keys = available_keys or {
             "google": True,
             "anthropic": True,
@@ -490,71 +757,117 @@ class SmartModelSelector:
             "openai": True,
         }
         
-        # 初始化时获取动态健康状态
+        # 可用性按实例维护 (Model 不可变，多个选择器互不影响)
+        # model_id -> 是否可用
+        self._available: Dict[str, bool] = {}
+        # 每个候选列表中第一个可用的模型，可用性变化时整体重算，select 只需一次查表
+        self._first_available: Dict[str, Dict[TaskType, Optional[Model]]] = {}
+        # 可用性版本号，每次刷新可用性后递增 (供调用方判断缓存是否失效)
+        self.models_generation = 0
+        
+        # 动态健康状态由后台线程刷新，完成前 select 使用静态配置
         self._dynamic_health: Dict[str, bool] = {}
-        if self._health_checker:
-            try:
-                self._dynamic_health = self._health_checker.get_available_providers()
-            except Exception:
-                pass
-        
-        # 合并静态和动态可用性 (动态优先)
-        for model_id, model in self.MODELS.items():
-            provider = model.provider
-            # 动态检查结果优先，否则使用静态配置
-            if provider in self._dynamic_health:
-                model.available = self._dynamic_health[provider]
-            else:
-                model.available = self._static_available_keys.get(provider, True)
+        self._health_lock = threading.Lock()
+        self._health_thread: Optional[threading.Thread] = None
+        self._last_health_refresh: Optional[float] = None
+        self._apply_availability()
+        self._maybe_refresh_health()
+    
+    def _apply_availability(self):
+        """合并静态和动态可用性 (动态优先)，按模型的 provider 计算可用性"""
+        merged = {**self._static_available_keys, **self._dynamic_health}
+        available = {m.id: merged.get(m.provider, True) for m in self.MODELS.values()}
+        
+        # 整体替换而非原地修改，select 并发读取时总能看到一致的快照
+        self._available = available
+        self._first_available = {
+            strategy: {
+                task_type: next((m for m in candidates if available[m.id]), None)
+                for task_type, candidates in table.items()
+            }
+            for strategy, table in self._CANDIDATE_TABLES.items()
+        }
+        self.models_generation += 1
+    
+    def is_available(self, model_id: str) -> bool:
+        """模型当前是否可用"""
+        return self._available.get(model_id, False)
+    
+    def _refresh_health(self):
+        """后台线程: 获取各 provider 健康状态并合并到模型可用性"""
+        try:
+            self._dynamic_health = self._health_checker.get_available_providers()
+        except Exception as e:
+            logger.debug(f"健康检查失败，继续使用静态可用性: {e}")
+            return
+        self._apply_availability()
+    
+    def _maybe_refresh_health(self):
+        """距上次刷新超过 HEALTH_REFRESH_INTERVAL 时在后台重新检查 (不阻塞调用方)"""
+        if self._health_checker is None:
+            return
+        last = self._last_health_refresh
+        if last is not None and time.monotonic() - last < self.HEALTH_REFRESH_INTERVAL:
+            return
+        with self._health_lock:
+            if self._health_thread is not None and self._health_thread.is_alive():
+                return
+            self._last_health_refresh = time.monotonic()
+            self._health_thread = threading.Thread(
+                target=self._refresh_health, name="model-health", daemon=True
+            )
+            self._health_thread.start()
+    
+    def wait_for_health(self, timeout: Optional[float] = None) -> bool:
+        """等待进行中的健康检查完成 (一次性 CLI 调用需要准确的可用性)
+        
+        Returns:
+            健康检查是否已完成
+        """
+        thread = self._health_thread
+        if thread is None:
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
     
     def select(self, task: str) -> Tuple[Model, str]:
-        analyzer = TaskAnalyzer(task)
-        task_type = analyzer.classify()
-        complexity = analyzer.get_complexity()
-        is_urgent = analyzer.is_urgent()
+        self._maybe_refresh_health()
+        task_type, complexity, is_urgent = analyze_task(task)
         
         # [成本优化] 长文本降级策略 - 超过 8000 tokens 自动切换免费模型
         estimated_tokens = len(task) // 4  # 粗略估算: 4 字符 ≈ 1 token
-        LONG_TEXT_THRESHOLD = 8000
         
         # 只有非 coding 任务才触发长文本降级 (coding 需要高复杂度模型)
-        if estimated_tokens > LONG_TEXT_THRESHOLD and task_type != TaskType.CODING:
+        if estimated_tokens > self.LONG_TEXT_THRESHOLD and task_type != TaskType.CODING:
             logger.info(f"📏 检测到长文本 ({estimated_tokens} tokens)，启用成本优化策略")
             # 优先选择免费长上下文模型
-            free_long_context = ["gemini-1.5-flash", "qwen-2.5-72b"]
-            for model_id in free_long_context:
-                if model_id in self.MODELS and self.MODELS[model_id].available:
-                    return self.MODELS[model_id], f"📏 长文本优化: {estimated_tokens} tokens > {LONG_TEXT_THRESHOLD}，自动降级到免费模型"
-        
-        candidates = self.TASK_MODEL_MAP.get(task_type, self.TASK_MODEL_MAP[TaskType.GENERAL])
+            for model_id in self.LONG_TEXT_MODELS:
+                if self._available.get(model_id):
+                    return self.MODELS[model_id], f"📏 长文本优化: {estimated_tokens} tokens > {self.LONG_TEXT_THRESHOLD}，自动降级到免费模型"
         
-        cost_sensitive_tasks = {TaskType.CHAT, TaskType.TRANSLATION, TaskType.GENERAL}
-        is_cost_sensitive = task_type in cost_sensitive_tasks and not is_urgent and complexity < 0.5
+        is_cost_sensitive = (
+            task_type in self.COST_SENSITIVE_TASKS and not is_urgent and complexity < 0.5
+        )
         
+        # 以下分支互斥 (成本敏感要求非紧急且复杂度 < 0.5)
         if complexity > 0.7:
-            candidates = [c for c in candidates if self.MODELS.get(c, self.MODELS["gemini-1.5-pro"]).priority.value <= 2]
+            strategy = "high_priority"
         elif is_urgent:
-            speed_rank = {"fastest": 0, "fast": 1, "medium": 2}
-            candidates = sorted(candidates, 
-                            key=lambda c: speed_rank.get(self.MODELS.get(c, self.MODELS["gemini-1.5-flash"]).speed, 1))
-        
-        if is_cost_sensitive:
-            candidates = sorted(
-                candidates,
-                key=lambda c: self.MODELS.get(c, self.MODELS["gemini-1.5-flash"]).cost_per_1k_tokens
-            )
+            strategy = "speed"
+        elif is_cost_sensitive:
+            strategy = "cost"
+        else:
+            strategy = "default"
         
-        for model_id in candidates:
-            model = self.MODELS.get(model_id)
-            if model and model.available:
-                reason = self._generate_reason(task_type, complexity, model, is_cost_sensitive)
-                return model, reason
+        model = self._first_available[strategy][task_type]
+        if model is not None:
+            reason = self._generate_reason(task_type, complexity, model, is_cost_sensitive)
+            return model, reason
         
-        for model_id in candidates:
-            model = self.MODELS.get(model_id)
-            if model:
-                reason = f"备选方案: {model.name}"
-                return model, reason
+        candidates = self._CANDIDATE_TABLES[strategy][task_type]
+        if candidates:
+            model = candidates[0]
+            return model, f"备选方案: {model.name}"
         
         fallback = self.MODELS["gemini-1.5-flash"]
         return fallback, "兜底选择: 免费快速模型"
@@ -579,9 +892,9 @@ class SmartModelSelector:
         elif complexity < 0.3:
             reasons.append("⚡ 适合简单任务")
         
-        if model.speed == "fastest":
+        if model.speed == SpeedRank.FASTEST:
             reasons.append("🚀 极速响应")
-        elif model.speed == "fast":
+        elif model.speed == SpeedRank.FAST:
             reasons.append("💨 快速响应")
         
         if model.cost_per_1k_tokens < 0.001:
@@ -598,10 +911,10 @@ class SmartModelSelector:
                 "name": m.name,
                 "provider": m.provider,
                 "priority": m.priority.name,
-                "speed": m.speed,
+                "speed": m.speed.label,
                 "cost_per_1k_tokens": m.cost_per_1k_tokens,
                 "strengths": m.strengths,
-                "available": m.available,
+                "available": self._available[m.id],
             }
             for m in self.MODELS.values()
         ]
@@ -622,9 +935,6 @@ class SmartModelSelector:
         return profile_map.get(model.id, "research")
     
     def activate(self, task: str) -> bool:
-        analyzer = TaskAnalyzer(task)
-        task_type = analyzer.classify()
-        
         model, reason = self.select(task)
         profile = self.get_profile_name(model)
         
@@ -650,6 +960,9 @@ class SmartModelSelector:
             return False
 
 
+SmartModelSelector._build_indices()
+
+
 def main():
     json_output = False
     if len(sys.argv) > 1 and sys.argv[1] == "--json":
@@ -658,29 +971,16 @@ def main():
     
     if len(sys.argv) < 2:
         if json_output:
-            print(json.dumps({"error": "请提供任务描述"}))
+            emit_json({"error": "请提供任务描述"})
             sys.exit(1)
-        print("用法: python3 model_selector.py [选项] <任务描述>")
-        print("")
-        print("选项:")
-        print("  --json     JSON 格式输出（供脚本调用）")
-        print("")
-        print("示例:")
-        print("  python3 model_selector.py '帮我写一个 Python 排序算法'")
-        print("  python3 model_selector.py --json '帮我翻译'")
-        print("")
-        print("中文关键词支持:")
-        print("  编程: 写代码、写程序、写函数、开发")
-        print("  分析: 分析、检查、审查、优化")
-        print("  调试: 错误、修复、崩溃、bug")
-        print("  写作: 写文档、写文章、写博客")
-        print("  翻译: 翻译、什么意思、怎么写")
-        print("  聊天: 你好、在吗、聊聊")
+        sys.stdout.write(USAGE)
         sys.exit(1)
     
     task = " ".join(sys.argv[1:])
     
     selector = SmartModelSelector()
+    # 一次性调用: 等待后台健康检查，避免推荐不可用的模型
+    selector.wait_for_health()
     model, reason = selector.select(task)
     
     if json_output:
@@ -691,25 +991,28 @@ def main():
             "reason": reason,
             "cost_per_1k_tokens": model.cost_per_1k_tokens,
             "context_window": model.context_window,
-            "speed": model.speed,
+            "speed": model.speed.label,
             "strengths": model.strengths,
         }
-        print(json.dumps(result, ensure_ascii=False, indent=2))
+        emit_json(result)
         return
     
-    print(f"\n{Colors.magenta('🤖')} {Colors.bold('智能模型选择结果')}")
-    print(Colors.cyan("=" * 60))
-    print(f"{Colors.yellow('📝')} 任务: {task}")
-    print(f"\n{Colors.green('🎯')} 推荐模型: {Colors.bold(model.name)}")
-    print(f"{Colors.yellow('🏢')} 提供商: {model.provider}")
-    print(f"{Colors.yellow('💰')} 成本: ${model.cost_per_1k_tokens:.4f}/1K tokens")
-    print(f"{Colors.yellow('📏')} 上下文: {model.context_window:,} tokens")
-    print(f"{Colors.yellow('🚀')} 速度: {model.speed}")
-    print(f"\n{Colors.cyan('💡')} 选择理由: {reason}")
-    print(f"\n{Colors.green('✅')} 擅长: {', '.join(model.strengths)}")
-    print(Colors.cyan("=" * 60))
-    print(f"\n{Colors.cyan('💡')} 提示: 直接使用 op.sh 自动切换")
-    print(f"   示例: op '{task[:30]}...'")
+    # 拼接完整输出后一次写入
+    sys.stdout.write(
+        f"\n{Colors.magenta('🤖')} {Colors.bold('智能模型选择结果')}\n"
+        f"{SEPARATOR}\n"
+        f"{Colors.yellow('📝')} 任务: {task}\n"
+        f"\n{Colors.green('🎯')} 推荐模型: {Colors.bold(model.name)}\n"
+        f"{Colors.yellow('🏢')} 提供商: {model.provider}\n"
+        f"{Colors.yellow('💰')} 成本: ${model.cost_per_1k_tokens:.4f}/1K tokens\n"
+        f"{Colors.yellow('📏')} 上下文: {model.context_window:,} tokens\n"
+        f"{Colors.yellow('🚀')} 速度: {model.speed.label}\n"
+        f"\n{Colors.cyan('💡')} 选择理由: {reason}\n"
+        f"\n{Colors.green('✅')} 擅长: {', '.join(model.strengths)}\n"
+        f"{SEPARATOR}\n"
+        f"\n{Colors.cyan('💡')} 提示: 直接使用 op.sh 自动切换\n"
+        f"   示例: op '{task[:30]}...'\n"
+    )
 
 
 if __name__ == "__main__":
@@ -13,21 +13,19 @@ OpenClaw Auto Model Selector - OpenClaw 自动模型选择器
     python3 openclaw_selector.py --json "分析这段代码"
 """
 
-import json
+import atexit
 import sys
-import os
-import re
+import threading
 import time
 import logging
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 from datetime import datetime
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from base_adapter import dumps_json, emit_json, loads_json
+from file_writer import wait_for_writes, write_file_async
+from selector_core import PatternClassifier
+
 logger = logging.getLogger("openclaw_selector")
 
 # ============ 模型定义 ============
@@ -40,7 +38,7 @@ class ModelInfo:
         self.id = id
         self.name = name
         self.provider = provider
-        self.strengths = strengths  # 强项: coding, research, writing, fast, cheap
+        self.strengths = frozenset(strengths)  # 强项: coding, research, writing, fast, cheap
         self.context_window = context_window
         self.cost_per_1k = cost_per_1k
         self.latency_tier = latency_tier  # fast, medium, slow
@@ -150,6 +148,16 @@ MODELS = {
     ),
 }
 
+def _index_by_strength(models: Dict[str, ModelInfo]) -> Dict[str, List[str]]:
+    """构建 强项 -> 模型 ID 列表 的倒排索引 (保持 MODELS 顺序)"""
+    index: Dict[str, List[str]] = {}
+    for model_id, model in models.items():
+        for strength in model.strengths:
+            index.setdefault(strength, []).append(model_id)
+    return index
+
+MODELS_BY_STRENGTH = _index_by_strength(MODELS)
+
 # 任务类型关键词映射
 TASK_PATTERNS = {
     "coding": [
@@ -174,40 +182,91 @@ TASK_PATTERNS = {
     ],
 }
 
+# 按 TASK_PATTERNS 顺序 (即优先级) 分类，关键词模式走 Aho-Corasick 自动机
+_CLASSIFIER = PatternClassifier(TASK_PATTERNS)
+
 # ============ 性能监控 ============
 
 class PerformanceTracker:
     """性能跟踪器 - 记录模型响应时间和成功率"""
     
     CACHE_FILE = Path.home() / ".config" / "openclaw" / "model_performance.json"
+    FLUSH_INTERVAL = 5.0  # 写盘最小间隔 (秒)
+    
+    _instance: Optional["PerformanceTracker"] = None
+    _instance_lock = threading.Lock()
     
     def __init__(self):
         self._performance: Dict[str, Dict] = {}  # model_id -> {latency, success, fail, last_used}
-        self._load_cache()
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        # 缓存文件在第一次读写时才加载
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        # 进程退出时写入尚未落盘的记录
+        atexit.register(self.flush)
+    
+    @classmethod
+    def instance(cls) -> "PerformanceTracker":
+        """获取进程内共享的跟踪器 (单例)"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+    
+    def _ensure_loaded(self):
+        """首次访问时加载性能缓存"""
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self._load_cache()
+                    self._loaded = True
     
     def _load_cache(self):
         """加载性能缓存"""
         try:
-            if self.CACHE_FILE.exists():
-                with open(self.CACHE_FILE, 'r') as f:
-                    data = json.load(f)
-                    self._performance = data.get("performance", {})
-                    logger.info(f"[OK] 加载性能缓存: {len(self._performance)} 个模型")
+            # 直接打开，文件不存在时捕获异常 (省去一次 exists() 的 stat)
+            with open(self.CACHE_FILE, 'rb') as f:
+                data = loads_json(f.read())
+            self._performance = data.get("performance", {})
+            for stats in self._performance.values():
+                self._update_derived(stats)
+            logger.info(f"[OK] 加载性能缓存: {len(self._performance)} 个模型")
+        except FileNotFoundError:
+            pass
         except Exception as e:
             logger.debug(f"性能缓存加载失败: {e}")
     
+    @staticmethod
+    def _update_derived(stats: Dict):
+        """根据计数预先算出平均延迟、成功率和冷却状态，排序时直接读取"""
+        success = stats["success_count"]
+        total = success + stats["fail_count"]
+        stats["avg_latency"] = stats["latency_sum"] / success if success else 0.0
+        stats["success_rate"] = success / total if total else 1.0
+        # 简单实现：如果失败率过高，认为在冷却期
+        stats["in_cooldown"] = stats["success_rate"] < 0.5
+    
     def _save_cache(self):
-        """保存性能缓存"""
+        """保存性能缓存 (当前线程只做序列化，原子写盘交给后台写线程)"""
+        self._dirty = False
+        self._last_flush = time.monotonic()
         try:
-            self.CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
             data = {"performance": self._performance, "updated_at": int(time.time())}
-            with open(self.CACHE_FILE, 'w') as f:
-                json.dump(data, f)
+            write_file_async(self.CACHE_FILE, dumps_json(data))
         except Exception as e:
             logger.debug(f"性能缓存保存失败: {e}")
     
+    def flush(self):
+        """将未落盘的记录写入缓存文件，并等待后台写完成"""
+        if self._dirty:
+            self._save_cache()
+        wait_for_writes()
+    
     def record_request(self, model_id: str, latency: float, success: bool):
         """记录请求结果"""
+        self._ensure_loaded()
         if model_id not in self._performance:
             self._performance[model_id] = {
                 "latency_sum": 0.0,
@@ -221,35 +280,35 @@ class PerformanceTracker:
         stats["success_count"] += 1 if success else 0
         stats["fail_count"] += 0 if success else 1
         stats["last_used"] = int(time.time())
+        self._update_derived(stats)
         
-        self._save_cache()
+        # 只更新内存，按 FLUSH_INTERVAL 节流写盘
+        self._dirty = True
+        if time.monotonic() - self._last_flush > self.FLUSH_INTERVAL:
+            self._save_cache()
     
     def get_stats(self, model_id: str) -> Optional[Dict]:
         """获取模型性能统计"""
+        self._ensure_loaded()
         return self._performance.get(model_id)
     
     def get_average_latency(self, model_id: str) -> float:
         """获取平均延迟"""
+        self._ensure_loaded()
         stats = self._performance.get(model_id)
-        if not stats or stats["success_count"] == 0:
-            return 0.0
-        return stats["latency_sum"] / stats["success_count"]
+        return stats["avg_latency"] if stats else 0.0
     
     def get_success_rate(self, model_id: str) -> float:
         """获取成功率"""
+        self._ensure_loaded()
         stats = self._performance.get(model_id)
-        if not stats:
-            return 1.0
-        total = stats["success_count"] + stats["fail_count"]
-        if total == 0:
-            return 1.0
-        return stats["success_count"] / total
+        return stats["success_rate"] if stats else 1.0
     
     def is_in_cooldown(self, model_id: str) -> bool:
         """检查模型是否在冷却期"""
-        # 简单实现：如果失败率过高，认为在冷却期
-        rate = self.get_success_rate(model_id)
-        return rate < 0.5
+        self._ensure_loaded()
+        stats = self._performance.get(model_id)
+        return stats["in_cooldown"] if stats else False
 
 # ============ 模型选择器 ============
 
@@ -257,18 +316,15 @@ class OpenClawModelSelector:
     """OpenClaw 自动模型选择器 - 混合策略"""
     
     def __init__(self):
-        self.tracker = PerformanceTracker()
+        self.tracker = PerformanceTracker.instance()
     
     def analyze_task(self, task_description: str) -> str:
         """分析任务类型"""
-        task_lower = task_description.lower()
-        
-        # 按优先级匹配
-        for task_type, patterns in TASK_PATTERNS.items():
-            for pattern in patterns:
-                if re.search(pattern, task_lower, re.IGNORECASE):
-                    logger.info(f"任务类型识别: {task_type}")
-                    return task_type
+        task_type = _CLASSIFIER.classify(task_description)
+        if task_type is not None:
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("task_type=%s", task_type)
+            return task_type
         
         return "balanced"  # 默认均衡型
     
@@ -285,47 +341,40 @@ class OpenClawModelSelector:
         # 2. 获取候选模型列表
         candidates = self._get_candidates_by_task(task_type)
         
-        # 3. 按性能排序 (性能驱动)
-        candidates = self._sort_by_performance(candidates)
-        
-        # 4. 选择最佳模型
         if not candidates:
             # 没有可用模型，使用默认
             return "minimax-2.5-free", "[Default] 无可用模型，使用免费模型"
         
-        selected_model = candidates[0]
+        # 3. 选择性能最佳的模型 (性能驱动，只需最小值无需完整排序)
+        selected_model = min(candidates, key=self._performance_key)
         reason = f"[{task_type}] 任务匹配 + 性能优化"
         
         return selected_model, reason
     
     def _get_candidates_by_task(self, task_type: str) -> List[str]:
         """根据任务类型获取候选模型"""
-        candidates = []
-        
-        for model_id, model in MODELS.items():
-            if task_type in model.strengths:
-                candidates.append(model_id)
+        candidates = MODELS_BY_STRENGTH.get(task_type)
         
         # 如果没有匹配的，返回所有模型
         if not candidates:
-            candidates = list(MODELS.keys())
+            return list(MODELS.keys())
         
-        return candidates
+        return list(candidates)
+    
+    def _performance_key(self, model_id: str) -> float:
+        """性能排序键 (越小越好)"""
+        stats = self.tracker.get_stats(model_id)
+        if stats is None:
+            # 无记录: 延迟 0、成功率 1.0、不在冷却期
+            return -10.0
+        
+        # 综合评分：低延迟 + 高成功率，在冷却期的模型惩罚
+        cooldown_penalty = 1000 if stats["in_cooldown"] else 0
+        return stats["avg_latency"] + cooldown_penalty - (stats["success_rate"] * 10)
     
     def _sort_by_performance(self, model_ids: List[str]) -> List[str]:
         """按性能排序"""
-        def sort_key(model_id: str) -> float:
-            # 综合评分：低延迟 + 高成功率
-            latency = self.tracker.get_average_latency(model_id)
-            success_rate = self.tracker.get_success_rate(model_id)
-            in_cooldown = self.tracker.is_in_cooldown(model_id)
-            
-            # 在冷却期的模型惩罚
-            cooldown_penalty = 1000 if in_cooldown else 0
-            
-            return latency + cooldown_penalty - (success_rate * 10)
-        
-        return sorted(model_ids, key=sort_key)
+        return sorted(model_ids, key=self._performance_key)
     
     def get_model_info(self, model_id: str) -> Optional[ModelInfo]:
         """获取模型信息"""
@@ -337,7 +386,7 @@ class OpenClawModelSelector:
             model_id: {
                 "name": model.name,
                 "provider": model.provider,
-                "strengths": model.strengths,
+                "strengths": sorted(model.strengths),
                 "context_window": model.context_window,
                 "cost_per_1k": model.cost_per_1k,
                 "latency_tier": model.latency_tier,
@@ -363,17 +412,23 @@ def main():
     
     args = parser.parse_args()
     
+    # 仅在作为脚本运行时配置日志，被导入时不改动全局日志设置
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
     selector = OpenClawModelSelector()
     
     # 列出所有模型
     if args.list:
         models = selector.list_models()
-        print(json.dumps(models, ensure_ascii=False, indent=2))
+        emit_json(models, pretty=True)
         return
     
     # 显示性能统计
     if args.stats:
-        tracker = PerformanceTracker()
+        tracker = PerformanceTracker.instance()
         for model_id in MODELS.keys():
             stats = tracker.get_stats(model_id)
             if stats:
@@ -393,10 +448,10 @@ def main():
                 "model_info": {
                     "name": MODELS[model_id].name,
                     "provider": MODELS[model_id].provider,
-                    "strengths": MODELS[model_id].strengths,
+                    "strengths": sorted(MODELS[model_id].strengths),
                 }
             }
-            print(json.dumps(result, ensure_ascii=False, indent=2))
+            emit_json(result)
         else:
             print(model_id)
             print(reason)
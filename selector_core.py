@@ -14,25 +14,44 @@ V3.0.0 - 通用核心架构
 - 只做纯粹的模型评估与路由
 """
 
+import atexit
+import functools
 import json
 import re
+import sys
+import threading
 import time
 import logging
-from typing import Dict, List, Optional, Tuple, Any
+from typing import Any, Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
 from pathlib import Path
 from dataclasses import dataclass, field
 from enum import Enum
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+from base_adapter import dumps_json, emit_json, loads_json
+from file_writer import wait_for_writes, write_file_async
+
+# 尝试导入 pyahocorasick (关键词模式改用 Aho-Corasick 自动机一次扫描)
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+# 尝试导入 numpy (模型较多时向量化评分)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
 logger = logging.getLogger("selector_core")
 
 
 # ============ 数据结构 ============
 
+# dataclass(slots=True) 需要 Python 3.10+，低版本退化为普通 frozen dataclass
+_DATACLASS_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
 class TaskType(Enum):
     """任务类型"""
     CODING = "coding"
@@ -56,20 +75,31 @@ class ModelCapability(Enum):
     PREMIUM = "premium"
 
 
-@dataclass
+# 每种能力对应一个二进制位，用于评分时的能力匹配位测试
+_CAP_BIT: Dict[ModelCapability, int] = {cap: 1 << i for i, cap in enumerate(ModelCapability)}
+
+# 模型数达到该值且 numpy 可用时改用向量化评分 (模型少时逐行循环更快)
+NUMPY_MIN_MODELS = 16
+
+
+@dataclass(frozen=True, **_DATACLASS_SLOTS)
 class ModelInfo:
     """模型信息"""
     id: str
     name: str
     provider: str
-    capabilities: List[ModelCapability]
+    capabilities: FrozenSet[ModelCapability]
     context_window: int = 200000
     cost_per_1k_input: float = 0.0
     cost_per_1k_output: float = 0.0
     latency_tier: str = "fast"
+    
+    def __post_init__(self):
+        # 接受任意可迭代对象，统一存为 frozenset 以便 O(1) 判断能力
+        object.__setattr__(self, "capabilities", frozenset(self.capabilities))
 
 
-@dataclass
+@dataclass(frozen=True, **_DATACLASS_SLOTS)
 class TaskRequest:
     """标准任务请求"""
     description: str
@@ -80,16 +110,6 @@ class TaskRequest:
     metadata: Dict[str, Any] = field(default_factory=dict)
 
 
-@dataclass
-class ModelScore:
-    """模型评分"""
-    model_id: str
-    score: float
-    reason: str
-    latency_estimate: float = 0.0
-    cost_estimate: float = 0.0
-
-
 # ============ 模型注册表 ============
 
 class ModelRegistry:
@@ -101,7 +121,45 @@ class ModelRegistry:
     def __init__(self):
         self._models: Dict[str, ModelInfo] = {}
         self._settings: Dict[str, Any] = {}
+        # 评分用的按列存储表: 第 i 行对应注册顺序中的第 i 个模型
+        self.ids: Tuple[str, ...] = ()
+        self.is_fast: Tuple[bool, ...] = ()
+        self.is_free: Tuple[bool, ...] = ()
+        self.caps_mask: Tuple[int, ...] = ()
+        self.base_score: Tuple[float, ...] = ()
+        self.all_rows: Tuple[int, ...] = ()
+        self._rows_by_cap: Dict[ModelCapability, Tuple[int, ...]] = {}
+        # numpy 列 (caps_mask, is_fast, base_score)，模型较少或 numpy 不可用时为 None
+        self.np_columns: Optional[Tuple[Any, Any, Any]] = None
         self._load_from_config()
+        self._build_index()
+    
+    def _build_index(self):
+        """构建能力 -> 行号的倒排索引和评分列表"""
+        rows_by_cap: Dict[ModelCapability, List[int]] = {}
+        models = list(self._models.values())
+        for i, m in enumerate(models):
+            for cap in m.capabilities:
+                rows_by_cap.setdefault(cap, []).append(i)
+        # 按注册顺序保存行号，保证同分时仍取靠前的模型
+        self._rows_by_cap = {cap: tuple(rows) for cap, rows in rows_by_cap.items()}
+        self.ids = tuple(m.id for m in models)
+        self.is_fast = tuple(m.latency_tier == "fast" for m in models)
+        self.is_free = tuple(m.cost_per_1k_input + m.cost_per_1k_output == 0 for m in models)
+        self.caps_mask = tuple(sum(_CAP_BIT[c] for c in m.capabilities) for m in models)
+        # 与任务无关的基础分: 100 + 快速 10 + 免费 15
+        self.base_score = tuple(
+            100.0 + (10 if fast else 0) + (15 if free else 0)
+            for fast, free in zip(self.is_fast, self.is_free)
+        )
+        self.all_rows = tuple(range(len(models)))
+        self.np_columns = None
+        if NUMPY_AVAILABLE and len(models) >= NUMPY_MIN_MODELS:
+            self.np_columns = (
+                np.array(self.caps_mask, dtype=np.int64),
+                np.array(self.is_fast, dtype=bool),
+                np.array(self.base_score, dtype=np.float64),
+            )
     
     def _load_from_config(self):
         """从配置文件加载模型"""
@@ -188,12 +246,115 @@ class ModelRegistry:
     def list_models(self) -> Dict[str, ModelInfo]:
         return self._models.copy()
     
-    def get_models_by_capability(self, cap: ModelCapability) -> List[ModelInfo]:
-        return [m for m in self._models.values() if cap in m.capabilities]
+    def rows_by_capability(self, cap: ModelCapability) -> Tuple[int, ...]:
+        """返回具备该能力的模型在评分列表中的行号"""
+        return self._rows_by_cap.get(cap, ())
 
 
 # ============ 任务分析器 ============
 
+# 分类结果缓存: 条目数上限，以及参与缓存的文本最大长度 (更长的文本直接计算，限制内存占用)
+CLASSIFY_CACHE_SIZE = 2048
+CLASSIFY_CACHE_MAX_LEN = 4096
+
+# 纯字面量关键词模式: \b(a|b|c)\b
+_LITERAL_KEYWORDS = re.compile(r"^\\b\(([^()|\\.*+?\[\]{}^$]+(?:\|[^()|\\.*+?\[\]{}^$]+)*)\)\\b$")
+
+
+def _is_word_char(ch: str) -> bool:
+    """与 re 的 Unicode \\w 一致 (中文字符也是单词字符)"""
+    return ch.isalnum() or ch == "_"
+
+
+# 自动机匹配前对小写文本做的额外折叠 (见 PatternClassifier._classify)
+_AUTOMATON_FOLD = str.maketrans({"\u0131": "i", "\u017f": "s"})
+
+
+class PatternClassifier:
+    """按优先级的多模式分类器
+    
+    patterns 为 {类别: [正则, ...]}，按字典顺序返回第一个有模式命中的类别。
+    pyahocorasick 可用时，形如 \\b(a|b|c)\\b 的关键词模式合并进一个自动机一次扫描，
+    命中后按 re 的单词边界规则校验；其余模式仍按类别合并为正则。
+    结果只取决于文本，不超过 CLASSIFY_CACHE_MAX_LEN 的文本按 LRU 缓存。
+    """
+    
+    def __init__(self, patterns: Dict[Any, List[str]]):
+        self._keys = list(patterns)
+        self._classify_cached = functools.lru_cache(maxsize=CLASSIFY_CACHE_SIZE)(self._classify)
+        # 每个类别的全部模式 (无自动机或无法使用自动机时)
+        self._regexes = [self._union(p) for p in patterns.values()]
+        # 每个类别除关键词外剩余的模式
+        self._residual_regexes: List[Optional[Any]] = []
+        self._automaton = None
+        
+        if not AHOCORASICK_AVAILABLE:
+            return
+        
+        # 关键词 -> 所属类别下标集合
+        keyword_owners: Dict[str, set] = {}
+        for index, type_patterns in enumerate(patterns.values()):
+            residual = []
+            for pattern in type_patterns:
+                literal = _LITERAL_KEYWORDS.match(pattern)
+                if literal:
+                    for word in literal.group(1).split("|"):
+                        keyword_owners.setdefault(word.lower(), set()).add(index)
+                else:
+                    residual.append(pattern)
+            self._residual_regexes.append(self._union(residual))
+        
+        if keyword_owners:
+            self._automaton = ahocorasick.Automaton()
+            for word, owners in keyword_owners.items():
+                self._automaton.add_word(word, (len(word), frozenset(owners)))
+            self._automaton.make_automaton()
+    
+    @staticmethod
+    def _union(patterns: List[str]):
+        if not patterns:
+            return None
+        return re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE)
+    
+    def classify(self, text: str) -> Optional[Any]:
+        """返回第一个命中的类别，均未命中返回 None"""
+        if len(text) <= CLASSIFY_CACHE_MAX_LEN:
+            return self._classify_cached(text)
+        return self._classify(text)
+    
+    def _classify(self, text: str) -> Optional[Any]:
+        # 正则以 IGNORECASE 直接匹配原文，与匹配小写文本结果相同，只有 'İ' (U+0130) 例外:
+        # lower() 把它变成 'i' + U+0307，IGNORECASE 却把它当作 'i'，含有它时仍按小写文本匹配
+        if "\u0130" in text:
+            text = text.lower()
+        lowered = text.lower() if self._automaton is not None else None
+        # IGNORECASE 把 'ı' (U+0131)、'ſ' (U+017F) 当作 i、s，而 lower() 不改变它们
+        if lowered is not None and ("\u0131" in lowered or "\u017f" in lowered):
+            lowered = lowered.translate(_AUTOMATON_FOLD)
+        # 转小写后长度变化 (少数特殊字符) 时下标无法对应，退回纯正则
+        if lowered is None or len(lowered) != len(text):
+            for key, regex in zip(self._keys, self._regexes):
+                if regex is not None and regex.search(text):
+                    return key
+            return None
+        
+        hits: set = set()
+        last = len(text) - 1
+        for end, (length, owners) in self._automaton.iter(lowered):
+            start = end - length + 1
+            before = start > 0 and _is_word_char(text[start - 1])
+            after = end < last and _is_word_char(text[end + 1])
+            if before != _is_word_char(text[start]) and after != _is_word_char(text[end]):
+                hits |= owners
+                if 0 in hits:
+                    break
+        
+        for index, (key, regex) in enumerate(zip(self._keys, self._residual_regexes)):
+            if index in hits or (regex is not None and regex.search(text)):
+                return key
+        return None
+
+
 class TaskAnalyzer:
     """任务分析器"""
     
@@ -205,13 +366,12 @@ class TaskAnalyzer:
         TaskType.MULTIMODAL: [r"\b(图片|图像|图表|截图|照片)\b"],
     }
     
+    # 按 TASK_PATTERNS 顺序 (即优先级) 分类
+    CLASSIFIER = PatternClassifier(TASK_PATTERNS)
+    
     def analyze(self, description: str) -> TaskType:
-        desc_lower = description.lower()
-        for task_type, patterns in self.TASK_PATTERNS.items():
-            for pattern in patterns:
-                if re.search(pattern, desc_lower, re.IGNORECASE):
-                    return task_type
-        return TaskType.BALANCED
+        task_type = self.CLASSIFIER.classify(description)
+        return task_type if task_type is not None else TaskType.BALANCED
     
     def estimate_complexity(self, description: str) -> str:
         length = len(description)
@@ -228,30 +388,74 @@ class PerformanceMonitor:
     """性能监控"""
     
     CACHE_FILE = Path.home() / ".config" / "smart_selector" / "performance.json"
+    FLUSH_INTERVAL = 5.0  # 写盘最小间隔 (秒)
+    
+    _instance: Optional["PerformanceMonitor"] = None
+    _instance_lock = threading.Lock()
     
     def __init__(self):
         self._data: Dict[str, Dict[str, Any]] = {}
-        self._load_cache()
+        # 统计数据版本号，每次 record 后递增 (供路由结果缓存判断失效)
+        self.version = 0
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        atexit.register(self.flush)
+    
+    @classmethod
+    def instance(cls) -> "PerformanceMonitor":
+        """进程内共享的监控实例 (单例)"""
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+    
+    def _ensure_loaded(self):
+        """首次访问时才加载缓存文件"""
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self._load_cache()
+                    self._loaded = True
     
     def _load_cache(self):
         try:
-            if self.CACHE_FILE.exists():
-                with open(self.CACHE_FILE, 'r') as f:
-                    data = json.load(f)
-                    self._data = data.get("performance", {})
+            # 直接打开，文件不存在时捕获异常 (省去一次 exists() 的 stat)
+            with open(self.CACHE_FILE, 'rb') as f:
+                data = loads_json(f.read())
+            self._data = data.get("performance", {})
+            for stats in self._data.values():
+                self._update_derived(stats)
         except Exception:
             pass
     
+    @staticmethod
+    def _update_derived(stats: Dict[str, Any]):
+        """根据计数预先算出平均延迟、成功率和冷却状态，评分时直接读取"""
+        success = stats["success_count"]
+        total = success + stats["fail_count"]
+        stats["avg_latency"] = stats["latency_sum"] / success if success else 0.0
+        stats["success_rate"] = success / total if total else 1.0
+        stats["in_cooldown"] = stats["success_rate"] < 0.5
+    
     def _save_cache(self):
+        self._dirty = False
+        self._last_flush = time.monotonic()
         try:
-            self.CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
             data = {"performance": self._data, "updated_at": int(time.time())}
-            with open(self.CACHE_FILE, 'w') as f:
-                json.dump(data, f)
+            write_file_async(self.CACHE_FILE, dumps_json(data))
         except Exception:
             pass
     
+    def flush(self):
+        if self._dirty:
+            self._save_cache()
+        wait_for_writes()
+    
     def record(self, model_id: str, latency: float, success: bool):
+        self._ensure_loaded()
         if model_id not in self._data:
             self._data[model_id] = {"latency_sum": 0.0, "success_count": 0, "fail_count": 0, "last_used": 0}
         stats = self._data[model_id]
@@ -259,100 +463,184 @@ class PerformanceMonitor:
         stats["success_count"] += 1 if success else 0
         stats["fail_count"] += 0 if success else 1
         stats["last_used"] = int(time.time())
-        self._save_cache()
+        self._update_derived(stats)
+        self.version += 1
+        self._dirty = True
+        if time.monotonic() - self._last_flush > self.FLUSH_INTERVAL:
+            self._save_cache()
+    
+    def record_batch(self, results: Iterable[Tuple[str, float, bool]]):
+        """批量记录 (模型ID, 延迟, 是否成功)，整批只递增一次版本号、最多写一次盘"""
+        self._ensure_loaded()
+        now = int(time.time())
+        touched = False
+        for model_id, latency, success in results:
+            stats = self._data.get(model_id)
+            if stats is None:
+                stats = self._data[model_id] = {"latency_sum": 0.0, "success_count": 0, "fail_count": 0, "last_used": 0}
+            stats["latency_sum"] += latency
+            stats["success_count"] += 1 if success else 0
+            stats["fail_count"] += 0 if success else 1
+            stats["last_used"] = now
+            self._update_derived(stats)
+            touched = True
+        if not touched:
+            return
+        self.version += 1
+        self._dirty = True
+        if time.monotonic() - self._last_flush > self.FLUSH_INTERVAL:
+            self._save_cache()
+    
+    def snapshot(self) -> Dict[str, Tuple[float, float, bool]]:
+        """当前统计快照: 模型ID -> (平均延迟, 成功率, 是否冷却)"""
+        self._ensure_loaded()
+        return {
+            mid: (stats["avg_latency"], stats["success_rate"], stats["in_cooldown"])
+            for mid, stats in self._data.items()
+        }
     
     def get_average_latency(self, model_id: str) -> float:
+        self._ensure_loaded()
         stats = self._data.get(model_id)
-        if not stats or stats["success_count"] == 0:
-            return 0.0
-        return stats["latency_sum"] / stats["success_count"]
+        return stats["avg_latency"] if stats else 0.0
     
     def get_success_rate(self, model_id: str) -> float:
+        self._ensure_loaded()
         stats = self._data.get(model_id)
-        if not stats:
-            return 1.0
-        total = stats["success_count"] + stats["fail_count"]
-        if total == 0:
-            return 1.0
-        return stats["success_count"] / total
+        return stats["success_rate"] if stats else 1.0
     
     def is_in_cooldown(self, model_id: str) -> bool:
-        return self.get_success_rate(model_id) < 0.5
+        self._ensure_loaded()
+        stats = self._data.get(model_id)
+        return stats["in_cooldown"] if stats else False
 
 
 # ============ 模型路由器 ============
 
+# 任务类型 -> 候选模型需具备的能力
+_TASK_TO_CAP: Dict[TaskType, ModelCapability] = {
+    TaskType.CODING: ModelCapability.CODING,
+    TaskType.RESEARCH: ModelCapability.RESEARCH,
+    TaskType.WRITING: ModelCapability.WRITING,
+    TaskType.FAST: ModelCapability.FAST,
+    TaskType.MULTIMODAL: ModelCapability.MULTIMODAL,
+    TaskType.BALANCED: ModelCapability.BALANCED,
+}
+
+# 评分时计入能力匹配加分的任务类型 (均衡型不加分)
+_SCORED_TASK_CAPS: Dict[TaskType, ModelCapability] = {
+    task_type: cap for task_type, cap in _TASK_TO_CAP.items() if task_type is not TaskType.BALANCED
+}
+
+# 快照中没有记录的模型: 无延迟数据、成功率 100%、不在冷却期
+_NO_STATS: Tuple[float, float, bool] = (0.0, 1.0, False)
+
 class ModelRouter:
     """模型路由器"""
     
     def __init__(self, registry: ModelRegistry, monitor: PerformanceMonitor):
         self.registry = registry
         self.monitor = monitor
+        # (任务类型, 复杂度) -> 路由结果，性能统计变化 (monitor.version 变化) 时整体失效
+        self._select_cache: Dict[Tuple[TaskType, str], Tuple[str, str]] = {}
+        self._cache_version = monitor.version
     
     def select(self, task_type: TaskType, complexity: str = "medium") -> Tuple[str, str]:
-        candidates = self._get_candidates(task_type)
-        if not candidates:
-            return "minimax-2.5-free", "[Default] 无候选模型"
+        version = self.monitor.version
+        if version != self._cache_version:
+            self._select_cache = {}
+            self._cache_version = version
         
-        scored = self._score_models(candidates, task_type, complexity)
-        return scored[0].model_id, scored[0].reason
-    
-    def _get_candidates(self, task_type: TaskType) -> List[ModelInfo]:
-        cap_map = {
-            TaskType.CODING: ModelCapability.CODING,
-            TaskType.RESEARCH: ModelCapability.RESEARCH,
-            TaskType.WRITING: ModelCapability.WRITING,
-            TaskType.FAST: ModelCapability.FAST,
-            TaskType.MULTIMODAL: ModelCapability.MULTIMODAL,
-            TaskType.BALANCED: ModelCapability.BALANCED,
-        }
-        cap = cap_map.get(task_type)
-        if cap:
-            return self.registry.get_models_by_capability(cap)
-        return list(self.registry.list_models().values())
+        key = (task_type, complexity)
+        cached = self._select_cache.get(key)
+        if cached is not None:
+            return cached
+        
+        result = self._route(task_type, complexity, self.monitor.is_in_cooldown)
+        self._select_cache[key] = result
+        return result
     
-    def _score_models(self, models: List[ModelInfo], task_type: TaskType, 
-                     complexity: str) -> List[ModelScore]:
-        results = []
-        for m in models:
-            if self.monitor.is_in_cooldown(m.id):
-                continue
-            score = self._calculate_score(m, task_type, complexity)
-            results.append(score)
-        return sorted(results, key=lambda x: x.score, reverse=True)
-    
-    def _calculate_score(self, model: ModelInfo, task_type: TaskType, 
-                       complexity: str) -> ModelScore:
-        score = 100.0
-        reasons = []
+    def select_with_stats(self, task_type: TaskType, complexity: str,
+                          stats: Dict[str, Tuple[float, float, bool]],
+                          cache: Optional[Dict[Tuple[TaskType, str], Tuple[str, str]]] = None) -> Tuple[str, str]:
+        """
+        基于统计快照路由 (不再查询 monitor)，供批量选择使用
         
-        cap_map = {
-            TaskType.CODING: ModelCapability.CODING,
-            TaskType.RESEARCH: ModelCapability.RESEARCH,
-            TaskType.WRITING: ModelCapability.WRITING,
-            TaskType.FAST: ModelCapability.FAST,
-            TaskType.MULTIMODAL: ModelCapability.MULTIMODAL,
-        }
+        Args:
+            stats: PerformanceMonitor.snapshot() 的结果
+            cache: 可选，同一快照下 (任务类型, 复杂度) -> 路由结果 的共享缓存
+        """
+        key = (task_type, complexity)
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
         
-        required = cap_map.get(task_type)
-        if required and required in model.capabilities:
-            score += 20
-            reasons.append(f"能力匹配:{required.value}")
+        result = self._route(task_type, complexity, lambda mid: stats.get(mid, _NO_STATS)[2])
         
-        latency = self.monitor.get_average_latency(model.id)
-        if model.latency_tier == "fast":
-            score += 10
+        if cache is not None:
+            cache[key] = result
+        return result
+    
+    def _route(self, task_type: TaskType, complexity: str,
+               in_cooldown: Callable[[str], bool]) -> Tuple[str, str]:
+        """
+        在评分列表上选出得分最高的非冷却模型 (同分取靠前的)
         
-        total_cost = model.cost_per_1k_input + model.cost_per_1k_output
-        if total_cost == 0:
-            score += 15
-            reasons.append("免费模型")
+        得分 = 基础分 (100 + 快速 10 + 免费 15) + 能力匹配 20 + (简单任务且快速模型) 10
+        """
+        registry = self.registry
+        ids, caps_mask = registry.ids, registry.caps_mask
+        cap = _TASK_TO_CAP.get(task_type)
+        required = _SCORED_TASK_CAPS.get(task_type)
+        bit = _CAP_BIT[required] if required else 0
+        simple = complexity == "simple"
         
-        if complexity == "simple" and model.latency_tier == "fast":
-            score += 10
+        if registry.np_columns is not None:
+            best_row = self._best_row_np(cap, bit, simple, in_cooldown)
+        else:
+            base_score, is_fast = registry.base_score, registry.is_fast
+            rows = registry.rows_by_capability(cap) if cap else registry.all_rows
+            best_row = -1
+            best_score = 0.0
+            for i in rows:
+                if in_cooldown(ids[i]):
+                    continue
+                score = base_score[i]
+                if caps_mask[i] & bit:
+                    score += 20
+                if simple and is_fast[i]:
+                    score += 10
+                if best_row < 0 or score > best_score:
+                    best_row = i
+                    best_score = score
+        
+        if best_row < 0:
+            # 无候选或候选全部处于冷却期
+            return ("minimax-2.5-free", "[Default] 无候选模型")
         
-        reason = ", ".join(reasons) if reasons else "默认选择"
-        return ModelScore(model.id, score, reason, latency, total_cost)
+        reasons = []
+        if required is not None and caps_mask[best_row] & bit:
+            reasons.append(f"能力匹配:{required.value}")
+        if registry.is_free[best_row]:
+            reasons.append("免费模型")
+        return (ids[best_row], ", ".join(reasons) if reasons else "默认选择")
+    
+    def _best_row_np(self, cap: Optional[ModelCapability], bit: int, simple: bool,
+                     in_cooldown: Callable[[str], bool]) -> int:
+        """numpy 版评分: 对整张表一次算出得分，候选过滤和冷却用布尔掩码，无可选模型时返回 -1"""
+        registry = self.registry
+        caps_mask, is_fast, base_score = registry.np_columns
+        scores = base_score + 20.0 * ((caps_mask & bit) != 0)
+        if simple:
+            scores = scores + 10.0 * is_fast
+        valid = np.fromiter((not in_cooldown(mid) for mid in registry.ids), dtype=bool, count=len(registry.ids))
+        if cap:
+            valid &= (caps_mask & _CAP_BIT[cap]) != 0
+        if not valid.any():
+            return -1
+        # argmax 返回第一个最大值，与逐行循环的同分取靠前一致
+        return int(np.argmax(np.where(valid, scores, -np.inf)))
 
 
 # ============ 核心调度器 ============
@@ -362,7 +650,7 @@ class SelectorCore:
     
     def __init__(self):
         self.registry = ModelRegistry()
-        self.monitor = PerformanceMonitor()
+        self.monitor = PerformanceMonitor.instance()
         self.analyzer = TaskAnalyzer()
         self.router = ModelRouter(self.registry, self.monitor)
     
@@ -370,19 +658,41 @@ class SelectorCore:
         task_type = self.analyzer.analyze(task_description)
         complexity = self.analyzer.estimate_complexity(task_description)
         model_id, reason = self.router.select(task_type, complexity)
-        logger.info(f"[SelectorCore] 选择: {model_id} - {reason}")
+        logger.info("[SelectorCore] 选择: %s - %s", model_id, reason)
         return model_id, reason
     
+    def select_batch(self, descriptions: Sequence[str]) -> List[Tuple[str, str]]:
+        """
+        批量选择模型
+        
+        整批共享同一份性能统计快照和路由结果缓存，结果与逐条调用 select 一致
+        (批内不会因为其它请求的回报而改变)。执行结果可通过 record_batch 一次性回报。
+        """
+        stats = self.monitor.snapshot()
+        cache: Dict[Tuple[TaskType, str], Tuple[str, str]] = {}
+        analyzer = self.analyzer
+        select = self.router.select_with_stats
+        results = [
+            select(analyzer.analyze(desc), analyzer.estimate_complexity(desc), stats, cache)
+            for desc in descriptions
+        ]
+        logger.info("[SelectorCore] 批量选择: %d 条", len(results))
+        return results
+    
     def record_result(self, model_id: str, latency: float, success: bool):
         self.monitor.record(model_id, latency, success)
     
+    def record_batch(self, results: Iterable[Tuple[str, float, bool]]):
+        """批量回报执行结果: [(模型ID, 延迟, 是否成功), ...]"""
+        self.monitor.record_batch(results)
+    
     def get_models(self) -> Dict[str, Dict[str, Any]]:
         result = {}
         for mid, m in self.registry.list_models().items():
             result[mid] = {
                 "name": m.name,
                 "provider": m.provider,
-                "capabilities": [c.value for c in m.capabilities],
+                "capabilities": sorted(c.value for c in m.capabilities),
                 "context_window": m.context_window,
                 "cost_per_1k_input": m.cost_per_1k_input,
                 "cost_per_1k_output": m.cost_per_1k_output,
@@ -401,16 +711,22 @@ def main():
     parser.add_argument("--json", action="store_true", help="JSON 输出")
     args = parser.parse_args()
     
+    # 仅在作为脚本运行时配置日志，被导入时不改动全局日志设置
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
     core = SelectorCore()
     
     if args.list:
-        print(json.dumps(core.get_models(), ensure_ascii=False, indent=2))
+        emit_json(core.get_models(), pretty=True)
         return
     
     if args.task:
         model_id, reason = core.select(args.task)
         if args.json:
-            print(json.dumps({"model": model_id, "reason": reason}, ensure_ascii=False, indent=2))
+            emit_json({"model": model_id, "reason": reason})
         else:
             print(model_id)
             print(reason)
@@ -8,12 +8,13 @@ V3.0.0 - 通用架构
 支持扩展新平台，只需注册即可。
 """
 
+import importlib
 import logging
-from typing import Dict, Optional, Any
+from typing import Dict, Optional, Any, Union
 
 logger = logging.getLogger("selector_factory")
 
-# 导入所有适配器
+# 适配器基类 (具体适配器在 _register_default_adapters 中按路径延迟注册)
 from base_adapter import BasePlatformAdapter, BaseAPIServerAdapter, BaseCLIAdapter
 from selector_core import SelectorCore
 
@@ -26,23 +27,24 @@ class SelectorFactory:
     支持注册新的平台适配器。
     """
     
-    # 注册表
-    _adapters: Dict[str, type] = {}
+    # 注册表: 平台名称 -> 适配器类，或 "模块:类名" 字符串 (首次使用时才导入)
+    _adapters: Dict[str, Union[type, str]] = {}
     
     # 核心实例缓存
     _core_instance: Optional[SelectorCore] = None
     
     @classmethod
-    def register(cls, platform_name: str, adapter_class: type):
+    def register(cls, platform_name: str, adapter_class: Union[type, str]):
         """
         注册平台适配器
         
         Args:
             platform_name: 平台名称
-            adapter_class: 适配器类
+            adapter_class: 适配器类，或 "模块:类名" 形式的路径 (延迟到 get_adapter 时导入)
         """
         cls._adapters[platform_name] = adapter_class
-        logger.info(f"[Factory] 注册适配器: {platform_name} -> {adapter_class.__name__}")
+        name = adapter_class if isinstance(adapter_class, str) else adapter_class.__name__
+        logger.info(f"[Factory] 注册适配器: {platform_name} -> {name}")
     
     @classmethod
     def get_core(cls) -> SelectorCore:
@@ -74,6 +76,11 @@ class SelectorFactory:
             raise ValueError(f"未知平台: {platform_name}. 可用平台: {list(cls._adapters.keys())}")
         
         adapter_class = cls._adapters[platform_name]
+        if isinstance(adapter_class, str):
+            # 首次使用时导入，并把解析出的类写回注册表
+            module_name, class_name = adapter_class.split(":")
+            adapter_class = getattr(importlib.import_module(module_name), class_name)
+            cls._adapters[platform_name] = adapter_class
         return adapter_class()
     
     @classmethod
@@ -129,12 +136,9 @@ class SelectorFactory:
 # ============ 初始化注册 ============
 
 def _register_default_adapters():
-    """注册默认适配器"""
-    from adapter_opencode import OpenCodeAdapter
-    from adapter_openclaw import OpenClawAdapter
-    
-    SelectorFactory.register("opencode", OpenCodeAdapter)
-    SelectorFactory.register("openclaw", OpenClawAdapter)
+    """注册默认适配器 (按路径注册，只有实际用到的适配器才会被导入)"""
+    SelectorFactory.register("opencode", "adapter_opencode:OpenCodeAdapter")
+    SelectorFactory.register("openclaw", "adapter_openclaw:OpenClawAdapter")
     
     logger.info("[Factory] 默认适配器注册完成")
 
@@ -193,8 +197,6 @@ def select_model(task_description: str, platform: str = "auto") -> tuple:
 
 def main():
     """测试入口"""
-    import json
-    
     # 列出所有平台
     print("已注册的平台:")
     for platform in SelectorFactory.list_platforms():
@@ -205,8 +207,8 @@ def main():
     # 测试 OpenCode
     print("\n1. OpenCode 适配器:")
     adapter, core = get_selector("opencode")
-    model, reason = adapter.parse_request("帮我写一个排序算法") | {} | {"task_description": "帮我写一个排序算法"}
-    model_id, reason = core.select("帮我写一个排序算法")
+    request = adapter.parse_request("帮我写一个排序算法")
+    model_id, reason = core.select(request["task_description"])
     print(f"   模型: {model_id}")
     print(f"   原因: {reason}")
     
@@ -5,20 +5,47 @@
 Author: OpenCode Smart Model Dispatcher
 """
 
+import asyncio
+import atexit
+import copy
 import json
 import logging
-import requests
 import sys
-import fcntl
+import threading
+import weakref
 from pathlib import Path
 from dataclasses import dataclass
 from enum import Enum
 import os
-from typing import List, Dict, Any, Optional, Union
+import re
+import statistics
+from collections import defaultdict, deque
+from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple, Union
+from functools import cached_property
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from logging.handlers import RotatingFileHandler
 
+from base_adapter import dumps_json, loads_json
+
+# 尝试导入 ijson (流式解析响应，只取需要的文本字段)
+try:
+    import ijson
+    IJSON_AVAILABLE = True
+except ImportError:
+    IJSON_AVAILABLE = False
+
+# 尝试导入 httpx (异步运行时请求，HTTP/2 下同一主机的并发请求复用一条连接)
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+# requests 较重，只在真正发起 HTTP 请求时才导入 (见 SmartModelDispatcher.session)
+if TYPE_CHECKING:
+    import requests
+
 # 可配置参数
 HEALTH_CHECK_TIMEOUT = float(os.environ.get("OPENCODE_HEALTH_TIMEOUT", "3.0"))
 LOG_MAX_BYTES = 5 * 1024 * 1024
@@ -30,6 +57,51 @@ MAX_TIMEOUT = 10.0
 TIMEOUT_SAMPLE_SIZE = 10
 TIMEOUT_WEIGHT = 0.7
 
+# API key 格式校验 (预编译，整串匹配；与原先的前缀 + 长度判断等价)
+_GOOGLE_KEY_RE = re.compile(r"AIzaSy(?:Dum.{11,}|.{29,})", re.DOTALL)  # AI Studio keys (>=20) / 标准 keys (>=35)
+_ANTHROPIC_KEY_RE = re.compile(r"sk-ant.{34,}", re.DOTALL)  # >=40
+_DEEPSEEK_KEY_RE = re.compile(r"sk-de2bd.{24}", re.DOTALL)  # ==32
+_SILICONFLOW_KEY_RE = re.compile(r"sk-yyeh.{33,}", re.DOTALL)  # >=40
+# 环境变量中的数组格式: ("key1" "key2" ...)
+_QUOTED_RE = re.compile(r'"([^"]+)"')
+
+# 单个 key 的环境变量 -> (provider, model, base_url)
+_ENV_SINGLE_KEY_MAP = {
+    "ANTHROPIC_API_KEY": ("anthropic", "anthropic/claude-3.5-sonnet", "https://api.anthropic.com/v1"),
+    "DEEPSEEK_API_KEY": ("deepseek", "deepseek-chat", "https://api.deepseek.com"),
+    "SILICONFLOW_API_KEY": ("siliconflow", "Qwen/Qwen2.5-72B-Instruct", "https://api.siliconflow.cn/v1"),
+    "MINIMAX_API_KEY": ("minimax", "MiniMax-M2.1-lightning", "https://api.minimax.chat/v1"),
+    "KIMI_API_KEY": ("kimi", "moonshot-v1-8k", "https://api.moonshot.cn/v1"),
+    "DOUBAO_API_KEY": ("doubao", "doubao-pro-32k", "https://ark.cn-beijing.volces.com/api/v1"),
+    "GROQ_API_KEY": ("groq", "llama-3.1-70b", "https://api.groq.com/openai/v1"),
+    "OPENROUTER_API_KEY": ("openrouter", "openrouter/auto", "https://openrouter.ai/api/v1"),
+    "OPENAI_API_KEY": ("openai", "gpt-4o", "https://api.openai.com/v1"),
+    "ZHIPU_API_KEY": ("zhipuai", "glm-4", "https://open.bigmodel.cn/api/paas/v4"),
+    "MODELSCOPE_API_KEY": ("modelscope", "modelscope/qwen2.5-72b-instruct", "https://api.modelscope.cn/v1"),
+}
+
+# auth.json 中的 Google key 字段 -> (model, tier)，按加载顺序排列
+_AUTH_GOOGLE_KEYS = (
+    ("google_pro_api_keys", "google/gemini-1.5-pro", "pro"),
+    ("google_free_api_keys", "google/gemini-1.5-flash", "free"),
+    ("google_api_key", "google/gemini-1.5-flash", "auth"),
+)
+
+# auth.json 中其它 provider 的 key 字段 -> (provider, model, base_url)
+_AUTH_PROVIDER_MAP = {
+    "anthropic_api_key": ("anthropic", "anthropic/claude-3.5-sonnet", "https://api.anthropic.com/v1"),
+    "deepseek_api_key": ("deepseek", "deepseek-chat", "https://api.deepseek.com"),
+    "siliconflow_api_key": ("siliconflow", "Qwen/Qwen2.5-72B-Instruct", "https://api.siliconflow.cn/v1"),
+    "minimax_api_key": ("minimax", "MiniMax-M2.1-lightning", "https://api.minimax.chat/v1"),
+    "zhipuai_api_key": ("zhipuai", "glm-4", "https://open.bigmodel.cn/api/paas/v4"),
+    "kimi_api_key": ("kimi", "moonshot-v1-8k", "https://api.moonshot.cn/v1"),
+    "doubao_api_key": ("doubao", "doubao-pro-32k", "https://ark.cn-beijing.volces.com/api/v1"),
+    "groq_api_key": ("groq", "llama-3.1-70b", "https://api.groq.com/openai/v1"),
+    "qiniuyun_api_key": ("qiniuyun", "qwen-turbo", "https://openai.qiniu.com"),
+    "openrouter_api_key": ("openrouter", "openrouter/auto", "https://openrouter.ai/api/v1"),
+    "opencode_api_key": ("opencode", "opencode/gpt-4o", "https://api.opencode.ai/v1"),
+}
+
 class TimeoutTracker:
     """动态超时追踪器 - 基于历史响应时间调整超时 (使用中位数算法)
     
@@ -39,7 +111,10 @@ class TimeoutTracker:
     CACHE_FILE = Path.home() / ".local" / "share" / "opencode" / "latency_cache.json"
     
     def __init__(self):
-        self._history: Dict[str, List[float]] = {}
+        # provider -> 最近 TIMEOUT_SAMPLE_SIZE 次响应时间 (deque 满后自动丢弃最旧的样本)
+        self._history: Dict[str, Deque[float]] = {}
+        # provider -> 已算好的超时，record 时失效
+        self._cached_timeout: Dict[str, float] = {}
         self._load_cache()  # 热启动：加载历史测速数据
     
     def _load_cache(self):
@@ -59,37 +134,13 @@ class TimeoutTracker:
                         return
                     
                     # [核心修复] 真正将磁盘数据加载到内存中，激活热启动
-                    self._history = data.get("history", {})
-                    
-                    logger.info(f"[OK] 加载测速缓存: {len(self._history)} 个 provider (缓存 {cache_age // 60} 分钟有效)")
-        except Exception as e:
-            logger.debug(f"测速缓存加载失败: {e}")
-        """从磁盘加载历史测速数据"""
-        try:
-            if self.CACHE_FILE.exists():
-                with open(self.CACHE_FILE, 'r') as f:
-                    data = json.load(f)
-                    # 检查缓存是否过期（超过4小时）
-                    cache_time = data.get("updated_at", 0)
-                    current_time = int(time.time())
-                    cache_age = current_time - cache_time
-                    
-                    if cache_age > 4 * 3600:  # 4小时 = 14400秒
-                        logger.info(f"⏰ 测速缓存已过期 ({cache_age // 3600}h)，重新探测")
-                        self._history = {}
-                        return
+                    self._history = {
+                        provider: deque(samples, maxlen=TIMEOUT_SAMPLE_SIZE)
+                        for provider, samples in data.get("history", {}).items()
+                    }
+                    self._cached_timeout = {}
                     
                     logger.info(f"[OK] 加载测速缓存: {len(self._history)} 个 provider (缓存 {cache_age // 60} 分钟有效)")
-                cache_time = data.get("updated_at", 0)
-                current_time = int(time.time())
-                cache_age = current_time - cache_time
-                
-                if cache_age > 4 * 3600:  # 4小时 = 14400秒
-                    logger.info(f"⏰ 测速缓存已过期 ({cache_age // 3600}h)，重新探测")
-                    self._history = {}
-                    return
-                
-                logger.info(f"[OK] 加载测速缓存: {len(self._history)} 个 provider (缓存 {cache_age // 60} 分钟有效)")
         except Exception as e:
             logger.debug(f"测速缓存加载失败: {e}")
     
@@ -97,43 +148,96 @@ class TimeoutTracker:
         """保存测速数据到磁盘"""
         try:
             self.CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
-            data = {"history": self._history, "updated_at": int(time.time())}
+            history = {provider: list(samples) for provider, samples in list(self._history.items())}
+            data = {"history": history, "updated_at": int(time.time())}
             with open(self.CACHE_FILE, 'w') as f:
                 json.dump(data, f)
         except Exception as e:
             logger.debug(f"测速缓存保存失败: {e}")
     
     def record(self, provider: str, response_time: float):
-        if provider not in self._history:
-            self._history[provider] = []
-        self._history[provider].append(response_time)
-        if len(self._history[provider]) > TIMEOUT_SAMPLE_SIZE:
-            self._history[provider].pop(0)
+        samples = self._history.get(provider)
+        if samples is None:
+            samples = self._history[provider] = deque(maxlen=TIMEOUT_SAMPLE_SIZE)
+        samples.append(response_time)
+        self._cached_timeout.pop(provider, None)
         # 自动保存缓存 (每 10 次记录)
         if sum(len(v) for v in self._history.values()) % 10 == 0:
             self.save_cache()
     
-    def _get_median(self, values: List[float]) -> float:
+    def _get_median(self, values: Iterable[float]) -> float:
         """计算中位数，过滤离群值"""
+        values = list(values)
         if not values:
             return HEALTH_CHECK_TIMEOUT
-        sorted_values = sorted(values)
-        n = len(sorted_values)
-        if n % 2 == 0:
-            return (sorted_values[n // 2 - 1] + sorted_values[n // 2]) / 2
-        return sorted_values[n // 2]
+        return statistics.median(values)
     
     def get_timeout(self, provider: str) -> float:
-        if provider not in self._history or not self._history[provider]:
+        cached = self._cached_timeout.get(provider)
+        if cached is not None:
+            return cached
+        
+        samples = self._history.get(provider)
+        if not samples:
             return HEALTH_CHECK_TIMEOUT
         
-        median_time = self._get_median(self._history[provider])
+        median_time = self._get_median(samples)
         dynamic_timeout = median_time * TIMEOUT_WEIGHT * 2
         
-        return max(MIN_TIMEOUT, min(MAX_TIMEOUT, dynamic_timeout))
+        timeout = max(MIN_TIMEOUT, min(MAX_TIMEOUT, dynamic_timeout))
+        self._cached_timeout[provider] = timeout
+        return timeout
 
 timeout_tracker = TimeoutTracker()
 
+# 已解析的只读 JSON 配置: 路径 -> ((mtime_ns, size), 内容)，文件变化后自动重新解析
+_JSON_CACHE: Dict[str, Tuple[Tuple[int, int], Any]] = {}
+
+
+def _load_json_cached(path: Path) -> Any:
+    """读取并解析 JSON 文件 (优先 orjson)，文件未变化时直接返回上次的结果 (调用方不要修改)"""
+    st = path.stat()
+    stamp = (st.st_mtime_ns, st.st_size)
+    key = str(path)
+    cached = _JSON_CACHE.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    data = loads_json(path.read_bytes())
+    _JSON_CACHE[key] = (stamp, data)
+    return data
+
+
+def _prime_json_cache(path: Path, data: Any) -> None:
+    """刚写出文件后登记其内容，下一次读取不必重新解析 (data 之后不能再被修改)"""
+    st = path.stat()
+    _JSON_CACHE[str(path)] = ((st.st_mtime_ns, st.st_size), data)
+
+
+# 批量运行时请求: 合并窗口 (毫秒) 与每批最多请求数 (见 runtime_request_with_failover_batched)
+BATCH_INTERVAL_MS = 10
+MAX_BATCH_SIZE = 10
+
+# 预检共享线程池 (首次使用时创建；fork 出的子进程会重新创建自己的线程池)
+HEALTH_CHECK_WORKERS = 32
+_health_executor: Optional[ThreadPoolExecutor] = None
+_health_executor_pid = 0
+_health_executor_lock = threading.Lock()
+
+
+def _get_health_executor() -> ThreadPoolExecutor:
+    """获取进程内共享的预检线程池，避免每次 activate_profile 重新创建线程"""
+    global _health_executor, _health_executor_pid
+    pid = os.getpid()
+    if _health_executor is None or _health_executor_pid != pid:
+        with _health_executor_lock:
+            if _health_executor is None or _health_executor_pid != pid:
+                _health_executor = ThreadPoolExecutor(
+                    max_workers=HEALTH_CHECK_WORKERS, thread_name_prefix="dispatcher-hc"
+                )
+                _health_executor_pid = pid
+                atexit.register(_health_executor.shutdown, wait=False)
+    return _health_executor
+
 # ═════════════════════════════════════════════════════════════
 # JSON 配置容错机制
 # ═════════════════════════════════════════════════════════════
@@ -243,9 +347,39 @@ class ModelProfile(Enum):
     FAST = "fast"          # 极速 (Groq/Flash)
     CN = "cn"              # 中文 (MinMax)
 
+# 模式名 -> ModelProfile (查表代替 Enum 构造，未知模式不走异常路径)
+_PROFILES_BY_NAME: Dict[str, ModelProfile] = {p.value: p for p in ModelProfile}
+
+# 国内模型提供商 - 这些域名在国内，直接连接无代理
+DOMESTIC_PROVIDERS = frozenset({"deepseek", "minimax", "kimi", "doubao", "zhipuai", "siliconflow", "qiniuyun", "modelscope"})
+
+# 预检仍用 GET 的 provider (google 的 ?key= 接口响应很小；anthropic 的 /messages 不是列表接口)，其余用 HEAD 只取状态码
+_GET_PROBE_PROVIDERS = frozenset({"google", "anthropic"})
+
+# 国内提供商使用的空代理 (显式注入，覆盖代理配置)
+_DIRECT_PROXIES: Dict[str, str] = {"http": "", "https": ""}
+
+# 请求错误分类: 第 i 个分组对应 _REQUEST_ERROR_LOG[i - 1]，分组越靠前优先级越高
+_REQUEST_ERROR_RE = re.compile(
+    r"(502|Bad Gateway)|(504|Gateway Timeout)|(429|Too Many Requests)|((?i:timeout))|((?i:connection))"
+)
+_REQUEST_ERROR_LOG = (
+    "❌ %s 返回 502 Bad Gateway",
+    "❌ %s 返回 504 Gateway Timeout",
+    "❌ %s 触发限流 (429)",
+    "⏰ %s 请求超时",
+    "🔌 %s 连接失败",
+)
+
+# 故障转移时备用 key 的优先级: pro > primary/env > secondary/specific > backup > expert > free
+_TIER_PRIORITY: Dict[str, int] = {"pro": 0, "primary": 1, "env": 1, "secondary": 2, "specific": 2, "backup": 3, "expert": 4, "free": 5}
+
 @dataclass
 class APIKey:
     """API key configuration with validation metadata"""
+    # 固定属性，不创建 __dict__ (手写以兼容 Python < 3.10)
+    __slots__ = ("provider", "model", "key", "base_url", "tier", "_headers", "_test_url", "_proxies", "_key_display")
+    
     provider: str
     model: str
     key: str
@@ -255,14 +389,242 @@ class APIKey:
     def __post_init__(self) -> None:
         """Strip whitespace from API key after initialization"""
         self.key = self.key.strip()
+        # 预检请求参数 (只依赖 key 本身，首次预检时由 SmartModelDispatcher._decorate 计算一次)
+        # 不是 dataclass 字段，不参与 __init__ / __repr__ / __eq__
+        self._headers: Optional[Dict[str, str]] = None
+        self._test_url: Optional[str] = None
+        self._proxies: Optional[Dict[str, str]] = None
+        # 日志中显示的 key 尾部 (只保留后 4 位)
+        self._key_display = self.key[-4:] if len(self.key) > 4 else '****'
     
     def __str__(self) -> str:
         """Safe string representation (hides sensitive key)"""
-        return f"APIKey(provider={self.provider}, model={self.model}, key=...{self.key[-4:] if len(self.key) > 4 else '****'})"
+        return f"APIKey(provider={self.provider}, model={self.model}, key=...{self._key_display})"
+
+
+def _bearer_auth(key: str) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {key}"}
+
+
+def _anthropic_auth(key: str) -> Dict[str, str]:
+    return {"x-api-key": key, "anthropic-version": "2023-06-01"}
+
+
+def _chat_completions_url(api: APIKey) -> str:
+    return f"{api.base_url}/chat/completions"
+
+
+def _google_url(api: APIKey) -> str:
+    return f"{api.base_url}/v1beta/models/{api.model.replace('google/', '')}:generateContent"
+
+
+def _openai_payload(api: APIKey, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    return {"messages": messages, "model": api.model}
+
+
+def _anthropic_payload(api: APIKey, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    return {"messages": messages, "model": api.model.replace("anthropic/", ""), "max_tokens": 4096}
+
+
+# 只会被序列化，不会被修改，所有请求共用一份
+_GOOGLE_GENERATION_CONFIG = {
+    "temperature": 0.9,
+    "maxOutputTokens": 8192,
+    "topP": 0.95,
+    "topK": 40
+}
+
+
+def _google_payload(api: APIKey, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    return {"messages": messages, "model": api.model, "generationConfig": _GOOGLE_GENERATION_CONFIG}
+
+
+def _extract_openai_content(data: Dict[str, Any]) -> Any:
+    choices = data.get("choices", [])
+    if choices:
+        return choices[0].get("message", {}).get("content", "")
+    return ""
+
+
+def _extract_google_content(data: Dict[str, Any]) -> Any:
+    candidates = data.get("candidates", [])
+    if candidates:
+        content = candidates[0].get("content", {})
+        parts = content.get("parts", [])
+        if parts:
+            return parts[0].get("text", "")
+    return ""
+
+
+@dataclass(frozen=True)
+class ProviderSpec:
+    """运行时请求的 provider 差异: 认证头、URL、请求体、回复文本的位置"""
+    auth: Callable[[str], Dict[str, str]]
+    url: Callable[[APIKey], str]
+    payload: Callable[[APIKey, List[Dict[str, str]]], Dict[str, Any]]
+    extract: Callable[[Dict[str, Any]], Any]
+    # 回复文本在响应 JSON 中的路径 (ijson 前缀)
+    text_prefix: str
+
+
+def _no_auth(key: str) -> Dict[str, str]:
+    return {}
+
+
+# OpenAI 兼容接口 (Bearer 认证)
+_OPENAI_SPEC = ProviderSpec(
+    auth=_bearer_auth,
+    url=_chat_completions_url,
+    payload=_openai_payload,
+    extract=_extract_openai_content,
+    text_prefix="choices.item.message.content",
+)
+
+# 未列出的 provider: 同样按 OpenAI 兼容接口请求，但不带认证头 (不把 key 发给未知的服务)
+_UNLISTED_SPEC = ProviderSpec(
+    auth=_no_auth,
+    url=_chat_completions_url,
+    payload=_openai_payload,
+    extract=_extract_openai_content,
+    text_prefix="choices.item.message.content",
+)
+
+# 使用 Bearer 认证的 OpenAI 兼容 provider
+_BEARER_PROVIDERS = (
+    "openai", "deepseek", "siliconflow", "minimax", "kimi", "doubao", "groq", "qiniuyun", "openrouter", "zhipuai"
+)
+
+_PROVIDER_SPECS: Dict[str, ProviderSpec] = {
+    **{provider: _OPENAI_SPEC for provider in _BEARER_PROVIDERS},
+    "anthropic": ProviderSpec(
+        auth=_anthropic_auth,
+        url=_chat_completions_url,
+        payload=_anthropic_payload,
+        extract=_extract_openai_content,
+        text_prefix="choices.item.message.content",
+    ),
+    "google": ProviderSpec(
+        auth=_bearer_auth,
+        url=_google_url,
+        payload=_google_payload,
+        extract=_extract_google_content,
+        text_prefix="candidates.item.content.parts.item.text",
+    ),
+}
+
+class _RequestBatcher:
+    """收集短时间内到达的运行时请求，按批在同一个事件循环上并发发出
+    
+    后台线程运行一个常驻事件循环: 取到请求后等待 batch_interval_ms 或攒满 max_batch_size，
+    整批交给 runtime_request_with_failover_async 并发执行。事件循环常驻，
+    dispatcher 在该循环上的 httpx AsyncClient (HTTP/2) 也随之常驻，
+    同一主机的请求 (包括前后不同批次) 复用同一条连接上的多路复用流。
+    每个请求独立发送 (对话结果有随机性，相同的请求也不合并)。
+    close() 后尚未发出的请求被取消，已发出的请求执行完后关闭客户端并退出线程。
+    """
+    
+    def __init__(
+        self,
+        dispatcher: "SmartModelDispatcher",
+        batch_interval_ms: int = BATCH_INTERVAL_MS,
+        max_batch_size: int = MAX_BATCH_SIZE
+    ) -> None:
+        self._dispatcher = dispatcher
+        self._interval = batch_interval_ms / 1000.0
+        self._max_batch_size = max_batch_size
+        self._closed = False
+        # submit 与 close 互斥，close 之后不会再有请求进入队列
+        self._lock = threading.Lock()
+        self._loop = asyncio.new_event_loop()
+        # 队列与停止信号只在事件循环线程内访问，其他线程通过 call_soon_threadsafe 投递
+        # 队列元素为 (messages, options, future)；None 仅用于唤醒空闲的 _serve
+        self._queue: "asyncio.Queue[Optional[Tuple[List[Dict[str, str]], Tuple[Any, ...], Future]]]"
+        self._stopping: asyncio.Event
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, args=(ready,), name="dispatcher-batcher", daemon=True)
+        self._thread.start()
+        ready.wait()
+    
+    def submit(self, messages: List[Dict[str, str]], options: Tuple[Any, ...]) -> Future:
+        """加入一个请求，options 为 runtime_request_with_failover_async 的其余位置参数"""
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("batcher is closed")
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, (messages, options, future))
+        return future
+    
+    def close(self) -> None:
+        """停止接收请求并等待后台线程退出 (已发出的请求继续执行完，排队中的请求被取消)"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._loop.call_soon_threadsafe(self._stop)
+        self._thread.join()
+    
+    def _stop(self) -> None:
+        self._stopping.set()
+        self._queue.put_nowait(None)
+    
+    def _run_loop(self, ready: threading.Event) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._stopping = asyncio.Event()
+        ready.set()
+        try:
+            self._loop.run_until_complete(self._serve())
+        finally:
+            self._loop.close()
+    
+    async def _serve(self) -> None:
+        in_flight: set = set()
+        while not self._stopping.is_set():
+            item = await self._queue.get()
+            if item is None:
+                continue
+            # 攒批窗口; close() 时立即结束等待
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self._interval)
+            except asyncio.TimeoutError:
+                pass
+            batch = [item]
+            while len(batch) < self._max_batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is not None:
+                    batch.append(item)
+            if self._stopping.is_set():
+                for _, _, future in batch:
+                    future.cancel()
+                break
+            for messages, options, future in batch:
+                if future.set_running_or_notify_cancel():
+                    task = asyncio.ensure_future(self._run(messages, options, future))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not None:
+                item[2].cancel()
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+        await self._dispatcher._close_async_client()
+    
+    async def _run(self, messages: List[Dict[str, str]], options: Tuple[Any, ...], future: Future) -> None:
+        try:
+            result = await self._dispatcher.runtime_request_with_failover_async(messages, *options)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(result)
+
 
 class SmartModelDispatcher:
     """Intelligent model dispatcher with automatic failover and load balancing"""
     
+    # 预检结果缓存有效期 (秒)，期间重复 activate_profile 不再重复探测同一个 key
+    PROBE_TTL = 30.0
+    
     def __init__(self, config_file_path: Optional[Path] = None) -> None:
         """Initialize the dispatcher with optional custom config path
         
@@ -275,7 +637,28 @@ class SmartModelDispatcher:
         self.opencode_config: Path = Path.home() / ".config" / "opencode" / "opencode.json"
         self.auth_config: Path = Path.home() / ".local" / "share" / "opencode" / "auth.json"
         
-        self.api_keys: List[APIKey] = []
+        self._api_keys: List[APIKey] = []
+        # 按 _TIER_PRIORITY 排好序的 api_keys，key 列表变化时置空，用到时再重建
+        self._api_keys_sorted: Optional[List[APIKey]] = None
+        # (base_url, key) -> (是否健康, 过期时间 monotonic)
+        self._probe_cache: Dict[Tuple[str, str], Tuple[bool, float]] = {}
+        # provider -> 运行时请求用的 Session (见 _provider_session)
+        self._sessions: Dict[str, "requests.Session"] = {}
+        self._sessions_lock = threading.Lock()
+        # 串行化进程内的配置写入 (预检线程池中可能有多个线程同时写)
+        self._config_lock = threading.Lock()
+        # 批量运行时请求的合并器 (首次调用 runtime_request_with_failover_batched 时创建)
+        self._batcher: Optional[_RequestBatcher] = None
+        self._batcher_lock = threading.Lock()
+        # 事件循环 -> 该循环上异步运行时请求用的 httpx 客户端 (见 _async_client)
+        self._aclients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        # 上次写出的 opencode.json 内容及其 (mtime_ns, size)，文件未被外部修改时免去重新读取解析
+        self._main_config_cache: Optional[Dict[str, Any]] = None
+        self._main_config_stamp: Optional[Tuple[int, int]] = None
+        # key 字符串 -> APIKey (O(1) 去重，以及按 auth.json 中的当前 key 查找)
+        self._key_index: Dict[str, APIKey] = {}
+        # provider -> 该 provider 的 key (按加载顺序)
+        self._by_provider: Dict[str, List[APIKey]] = defaultdict(list)
         self._routing_config: Dict[ModelProfile, List[str]] = {
             ModelProfile.RESEARCH: ["google"],
             ModelProfile.CODING: ["anthropic", "siliconflow"],
@@ -299,18 +682,117 @@ class SmartModelDispatcher:
             proxy_dict["https"] = https_proxy
         self.proxy_sandbox = proxy_dict if proxy_dict else None
         
-        # 创建 requests.Session 连接池 (复用 TCP 连接)
-        self.session = requests.Session()
-        
         # 清理命名空间
         del _os
         
         self.initialize_system()
 
+    @staticmethod
+    def _new_session(pool_connections: int, pool_maxsize: int) -> "requests.Session":
+        """创建带连接池的 requests.Session (首次调用时才导入 requests)"""
+        import requests
+        from requests.adapters import HTTPAdapter
+        
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                              pool_block=False, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        # 代理显式指定，不再让 requests 每次请求扫描环境变量
+        session.trust_env = False
+        # trust_env 关闭后 requests 不再读取 CA 证书环境变量，这里手动保留
+        ca_bundle = os.environ.get('REQUESTS_CA_BUNDLE') or os.environ.get('CURL_CA_BUNDLE')
+        if ca_bundle:
+            session.verify = ca_bundle
+        return session
+    
+    def _async_client(self) -> "httpx.AsyncClient":
+        """当前事件循环上的 httpx.AsyncClient (HTTP/2)，连接池在同一事件循环内复用
+        
+        AsyncClient 不能跨事件循环使用，每个事件循环各有一个客户端
+        (如批量请求的常驻循环与调用方的 asyncio.run 互不影响)，循环被回收后客户端随之释放
+        """
+        loop = asyncio.get_running_loop()
+        client = self._aclients.get(loop)
+        if client is None or client.is_closed:
+            proxies = self.proxy_sandbox or {}
+            ca_bundle = os.environ.get('REQUESTS_CA_BUNDLE') or os.environ.get('CURL_CA_BUNDLE')
+            verify: Any = ca_bundle or True
+            limits = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+            client = httpx.AsyncClient(
+                http2=True,
+                # 与 requests Session 相同: 代理显式指定，不读取环境变量
+                trust_env=False,
+                mounts={
+                    f"{scheme}://": httpx.AsyncHTTPTransport(
+                        http2=True, verify=verify, limits=limits, proxy=proxies.get(scheme) or None
+                    )
+                    for scheme in ("http", "https")
+                },
+                headers={"Content-Type": "application/json"},
+            )
+            self._aclients[loop] = client
+        return client
+    
+    async def _close_async_client(self) -> None:
+        """关闭当前事件循环上的 httpx 客户端 (如已创建)"""
+        client = self._aclients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+    
+    @property
+    def api_keys(self) -> List[APIKey]:
+        return self._api_keys
+    
+    @api_keys.setter
+    def api_keys(self, keys: List[APIKey]) -> None:
+        # 整体替换 key 列表时重建派生的索引
+        self._api_keys = keys
+        self._api_keys_sorted = None
+        self._key_index = {}
+        self._by_provider = defaultdict(list)
+        for api in keys:
+            self._key_index.setdefault(api.key, api)
+            self._by_provider[api.provider].append(api)
+    
+    @cached_property
+    def session(self) -> "requests.Session":
+        """预检用的 requests.Session 连接池 (复用 TCP 连接)，首次发起请求时才创建"""
+        # 连接池容量与 activate_profile 的并发预检线程数 (最多 32) 一致，避免超过默认 10 个连接后反复重建连接
+        # 代理由 _get_proxies 按 provider 显式传入
+        return self._new_session(32, 32)
+    
+    def _provider_session(self, provider: str) -> "requests.Session":
+        """运行时请求用的 Session，每个 provider 独立连接池并预先绑定代理和公共请求头"""
+        session = self._sessions.get(provider)
+        if session is None:
+            with self._sessions_lock:
+                session = self._sessions.get(provider)
+                if session is None:
+                    session = self._new_session(4, 16)
+                    # 统一代理策略：所有运行时请求使用相同代理配置
+                    if self.proxy_sandbox:
+                        session.proxies.update(self.proxy_sandbox)
+                    session.headers["Content-Type"] = "application/json"
+                    self._sessions[provider] = session
+        return session
+
     # ═════════════════════════════════════════════════════════════
     # 用户显式指定模型检测 (优先级最高)
     # ═════════════════════════════════════════════════════════════
     
+    def _read_auth(self) -> Dict[str, Any]:
+        """读取 auth.json 的可修改副本 (经 _load_json_cached，文件未变化时只需一次 stat)，文件不存在时为空"""
+        try:
+            return dict(_load_json_cached(self.auth_config))
+        except FileNotFoundError:
+            return {}
+    
+    def _write_auth(self, auth_data: Dict[str, Any]) -> None:
+        """原子写回 auth.json 并登记到解析缓存，之后的读取不必重新解析 (auth_data 之后不能再被修改)"""
+        self._atomic_write_json(self.auth_config, auth_data)
+        _prime_json_cache(self.auth_config, auth_data)
+    
     def is_user_specified_model(self) -> bool:
         """检查用户是否显式指定了模型（优先级最高，同时检查过期）"""
         # 先检查是否过期
@@ -318,8 +800,7 @@ class SmartModelDispatcher:
             return False
         try:
             if self.auth_config.exists():
-                with open(self.auth_config, 'r') as f:
-                    auth_data = json.load(f)
+                auth_data = _load_json_cached(self.auth_config)
                 return auth_data.get("user_specified_model", False) is True
         except Exception:
             pass
@@ -328,20 +809,14 @@ class SmartModelDispatcher:
     def clear_user_specified_model(self) -> None:
         """清除用户显式指定标记，允许自动切换"""
         try:
-            if self.auth_config.exists():
-                with open(self.auth_config, 'r') as f:
-                    auth_data = json.load(f)
-            else:
-                auth_data = {}
+            auth_data = self._read_auth()
             
             if "user_specified_model" in auth_data:
                 del auth_data["user_specified_model"]
             if "specified_model" in auth_data:
                 del auth_data["specified_model"]
             
-            self.auth_config.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.auth_config, 'w') as f:
-                json.dump(auth_data, f, indent=2)
+            self._write_auth(auth_data)
         except Exception as e:
             logger.warning(f"⚠️ 清除用户指定标记失败: {e}")
     
@@ -355,11 +830,7 @@ class SmartModelDispatcher:
         """
         import time
         try:
-            if self.auth_config.exists():
-                with open(self.auth_config, 'r') as f:
-                    auth_data = json.load(f)
-            else:
-                auth_data = {}
+            auth_data = self._read_auth()
             
             auth_data["user_specified_model"] = True
             auth_data["specified_model"] = f"{provider}/{model}"
@@ -367,9 +838,7 @@ class SmartModelDispatcher:
             auth_data["specified_ttl"] = ttl_hours * 3600  # 转换为秒
             auth_data["consecutive_failures"] = 0  # 重置连续失败计数
             
-            self.auth_config.parent.mkdir(parents=True, exist_ok=True)
-            with open(self.auth_config, 'w') as f:
-                json.dump(auth_data, f, indent=2)
+            self._write_auth(auth_data)
             logger.info(f"[OK] 用户指定模型标记已设置: {provider}/{model} (有效期 {ttl_hours} 小时)")
         except Exception as e:
             logger.warning(f"⚠️ 设置用户指定标记失败: {e}")
@@ -379,8 +848,7 @@ class SmartModelDispatcher:
         import time
         try:
             if self.auth_config.exists():
-                with open(self.auth_config, 'r') as f:
-                    auth_data = json.load(f)
+                auth_data = _load_json_cached(self.auth_config)
                 specified_at = auth_data.get("specified_at", 0)
                 ttl = auth_data.get("specified_ttl", 24 * 3600)  # 默认 24 小时
                 if time.time() - specified_at > ttl:
@@ -400,14 +868,12 @@ class SmartModelDispatcher:
         MAX_FAILURES = 3  # 连续失败 3 次后切换
         try:
             if self.auth_config.exists():
-                with open(self.auth_config, 'r') as f:
-                    auth_data = json.load(f)
+                auth_data = self._read_auth()
                 
                 failures = auth_data.get("consecutive_failures", 0) + 1
                 auth_data["consecutive_failures"] = failures
                 
-                with open(self.auth_config, 'w') as f:
-                    json.dump(auth_data, f, indent=2)
+                self._write_auth(auth_data)
                 
                 if failures >= MAX_FAILURES:
                     logger.warning(f"⚠️ 指定模型连续失败 {failures} 次，自动切换智能模式")
@@ -423,12 +889,11 @@ class SmartModelDispatcher:
         """成功后重置失败计数"""
         try:
             if self.auth_config.exists():
-                with open(self.auth_config, 'r') as f:
-                    auth_data = json.load(f)
+                auth_data = _load_json_cached(self.auth_config)
                 if auth_data.get("consecutive_failures", 0) > 0:
+                    auth_data = dict(auth_data)
                     auth_data["consecutive_failures"] = 0
-                    with open(self.auth_config, 'w') as f:
-                        json.dump(auth_data, f, indent=2)
+                    self._write_auth(auth_data)
         except Exception:
             pass
 
@@ -441,19 +906,17 @@ class SmartModelDispatcher:
         Returns:
             True if key matches Google format, False otherwise
         """
-        if not key or len(key) < 20:
+        if not key:
             return False
         
         # Google Gemini API keys must start with "AIzaSy" (standard API key format)
+        if _GOOGLE_KEY_RE.fullmatch(key):
+            return True
+        
         # OAuth client IDs (AQ.Ab...) are NOT valid for Gemini API
-        if key.startswith("AQ.Ab"):
+        if len(key) >= 20 and key.startswith("AQ.Ab"):
             logger.debug(f"⏭️ 跳过 OAuth Client ID (非 Gemini API Key): {key[:15]}...")
-            return False
-        
-        return (
-            key.startswith("AIzaSyDum") or  # AI Studio keys
-            key.startswith("AIzaSy") and len(key) >= 35  # Standard keys
-        )
+        return False
     
     def _validate_anthropic_key(self, key: str) -> bool:
         """Validate Anthropic API key format
@@ -464,7 +927,7 @@ class SmartModelDispatcher:
         Returns:
             True if key matches Anthropic format, False otherwise
         """
-        return bool(key and key.startswith("sk-ant") and len(key) >= 40)
+        return bool(key and _ANTHROPIC_KEY_RE.fullmatch(key))
     
     def _validate_deepseek_key(self, key: str) -> bool:
         """Validate DeepSeek API key format
@@ -475,7 +938,7 @@ class SmartModelDispatcher:
         Returns:
             True if key matches DeepSeek format, False otherwise
         """
-        return bool(key and key.startswith("sk-de2bd") and len(key) == 32)
+        return bool(key and _DEEPSEEK_KEY_RE.fullmatch(key))
     
     def _validate_siliconflow_key(self, key: str) -> bool:
         """Validate SiliconFlow API key format
@@ -486,7 +949,7 @@ class SmartModelDispatcher:
         Returns:
             True if key matches SiliconFlow format, False otherwise
         """
-        return bool(key and key.startswith("sk-yyeh") and len(key) >= 40)
+        return bool(key and _SILICONFLOW_KEY_RE.fullmatch(key))
     
     def _load_provider_keys(self, raw_keys: Dict[str, Any], provider: str, config_key: str, 
                            validator_func, model: str, base_url: str, tier: str) -> None:
@@ -508,7 +971,7 @@ class SmartModelDispatcher:
                     continue
                     
                 if validator_func(key):
-                    self.api_keys.append(APIKey(
+                    self._add_api_key(APIKey(
                         provider=provider,
                         model=model,
                         key=key,
@@ -518,6 +981,13 @@ class SmartModelDispatcher:
         except Exception as e:
             logger.warning(f"⚠️ Failed to load {provider} keys: {str(e)}")
 
+    def _add_api_key(self, api: APIKey) -> None:
+        """加入一个 API key 并登记到索引"""
+        self._api_keys.append(api)
+        self._api_keys_sorted = None
+        self._key_index.setdefault(api.key, api)
+        self._by_provider[api.provider].append(api)
+
     def initialize_system(self) -> None:
         """Initialize the smart dispatcher by loading and validating API keys
         
@@ -530,8 +1000,7 @@ class SmartModelDispatcher:
             raise FileNotFoundError(f"配置文件不存在: {self.config_source}")
 
         try:
-            with open(self.config_source, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            data = _load_json_cached(self.config_source)
             raw_keys = data.get("api_keys", {})
             
             # Load provider-specific keys with validation
@@ -585,6 +1054,33 @@ class SmartModelDispatcher:
         else:
             logger.warning("[!] No valid API keys found")
     
+    def _ingest(self, provider: str, model: str, base_url: str, tier: str,
+                keys: Iterable[Any], validator: Optional[Callable[[str], bool]] = None) -> int:
+        """校验、去重并加入一组 key，返回新加入的数量
+        
+        Args:
+            provider: Provider name
+            model: Model identifier for this provider
+            base_url: Base URL for API requests
+            tier: Provider tier (env, auth, pro, free, ...)
+            keys: Candidate keys (non-string entries are skipped)
+            validator: Optional key format validator
+        """
+        count = 0
+        for key in keys:
+            if not isinstance(key, str):
+                continue
+            key = key.strip()
+            if len(key) <= 10:
+                continue
+            if validator is not None and not validator(key):
+                continue
+            if key in self._key_index:
+                continue
+            self._add_api_key(APIKey(provider, model, key, base_url, tier))
+            count += 1
+        return count
+    
     def _load_keys_from_env(self) -> int:
         """Load API keys from environment variables"""
         loaded_count = 0
@@ -593,69 +1089,21 @@ class SmartModelDispatcher:
         google_keys = os.environ.get("GOOGLE_API_KEYS", "")
         if google_keys:
             # 解析数组格式: ("key1" "key2" ...)
-            import re
-            keys = re.findall(r'"([^"]+)"', google_keys) or google_keys.split()
-            for key in keys:
-                key = key.strip()
-                if key and self._validate_google_key(key):
-                    exists = any(k.key == key for k in self.api_keys)
-                    if not exists:
-                        self.api_keys.append(APIKey(
-                            provider="google",
-                            model="google/gemini-1.5-flash",
-                            base_url="https://generativelanguage.googleapis.com",
-                            key=key,
-                            tier="env"
-                        ))
-                        loaded_count += 1
+            keys = _QUOTED_RE.findall(google_keys) or google_keys.split()
+            loaded_count += self._ingest("google", "google/gemini-1.5-flash", "https://generativelanguage.googleapis.com",
+                                         "env", keys, self._validate_google_key)
         
         # OpenAI API Keys
         openai_keys = os.environ.get("OPENAI_API_KEYS", "")
         if openai_keys:
-            import re
-            keys = re.findall(r'"([^"]+)"', openai_keys) or openai_keys.split()
-            for key in keys:
-                key = key.strip()
-                if key and len(key) > 10:
-                    exists = any(k.key == key for k in self.api_keys)
-                    if not exists:
-                        self.api_keys.append(APIKey(
-                            provider="openai",
-                            model="gpt-4o",
-                            base_url="https://api.openai.com/v1",
-                            key=key,
-                            tier="env"
-                        ))
-                        loaded_count += 1
+            keys = _QUOTED_RE.findall(openai_keys) or openai_keys.split()
+            loaded_count += self._ingest("openai", "gpt-4o", "https://api.openai.com/v1", "env", keys)
         
         # Single API Key 环境变量
-        single_key_map = {
-            "ANTHROPIC_API_KEY": ("anthropic", "anthropic/claude-3.5-sonnet", "https://api.anthropic.com/v1"),
-            "DEEPSEEK_API_KEY": ("deepseek", "deepseek-chat", "https://api.deepseek.com"),
-            "SILICONFLOW_API_KEY": ("siliconflow", "Qwen/Qwen2.5-72B-Instruct", "https://api.siliconflow.cn/v1"),
-            "MINIMAX_API_KEY": ("minimax", "MiniMax-M2.1-lightning", "https://api.minimax.chat/v1"),
-            "KIMI_API_KEY": ("kimi", "moonshot-v1-8k", "https://api.moonshot.cn/v1"),
-            "DOUBAO_API_KEY": ("doubao", "doubao-pro-32k", "https://ark.cn-beijing.volces.com/api/v1"),
-            "GROQ_API_KEY": ("groq", "llama-3.1-70b", "https://api.groq.com/openai/v1"),
-            "OPENROUTER_API_KEY": ("openrouter", "openrouter/auto", "https://openrouter.ai/api/v1"),
-            "OPENAI_API_KEY": ("openai", "gpt-4o", "https://api.openai.com/v1"),
-            "ZHIPU_API_KEY": ("zhipuai", "glm-4", "https://open.bigmodel.cn/api/paas/v4"),
-            "MODELSCOPE_API_KEY": ("modelscope", "modelscope/qwen2.5-72b-instruct", "https://api.modelscope.cn/v1"),
-        }
-        
-        for env_name, (provider, model, base_url) in single_key_map.items():
+        for env_name, (provider, model, base_url) in _ENV_SINGLE_KEY_MAP.items():
             key = os.environ.get(env_name, "")
-            if key and len(key) > 10:
-                exists = any(k.key == key for k in self.api_keys)
-                if not exists:
-                    self.api_keys.append(APIKey(
-                        provider=provider,
-                        model=model,
-                        base_url=base_url,
-                        key=key,
-                        tier="env"
-                    ))
-                    loaded_count += 1
+            if key:
+                loaded_count += self._ingest(provider, model, base_url, "env", (key,))
         
         if loaded_count > 0:
             logger.info(f"[OK] Loaded {loaded_count} keys from environment variables")
@@ -668,91 +1116,25 @@ class SmartModelDispatcher:
                 logger.warning("[!] auth.json not found")
                 return
             
-            with open(self.auth_config, 'r', encoding='utf-8') as f:
-                auth_data = json.load(f)
-            
-            # Map auth keys to dispatcher providers (flat format: google_api_key -> google)
-            provider_map = {
-                "anthropic_api_key": ("anthropic", "anthropic/claude-3.5-sonnet", "https://api.anthropic.com/v1"),
-                "deepseek_api_key": ("deepseek", "deepseek-chat", "https://api.deepseek.com"),
-                "siliconflow_api_key": ("siliconflow", "Qwen/Qwen2.5-72B-Instruct", "https://api.siliconflow.cn/v1"),
-                "minimax_api_key": ("minimax", "MiniMax-M2.1-lightning", "https://api.minimax.chat/v1"),
-                "zhipuai_api_key": ("zhipuai", "glm-4", "https://open.bigmodel.cn/api/paas/v4"),
-                "kimi_api_key": ("kimi", "moonshot-v1-8k", "https://api.moonshot.cn/v1"),
-                "doubao_api_key": ("doubao", "doubao-pro-32k", "https://ark.cn-beijing.volces.com/api/v1"),
-                "groq_api_key": ("groq", "llama-3.1-70b", "https://api.groq.com/openai/v1"),
-                "qiniuyun_api_key": ("qiniuyun", "qwen-turbo", "https://openai.qiniu.com"),
-                "openrouter_api_key": ("openrouter", "openrouter/auto", "https://openrouter.ai/api/v1"),
-                "opencode_api_key": ("opencode", "opencode/gpt-4o", "https://api.opencode.ai/v1"),
-            }
+            auth_data = _load_json_cached(self.auth_config)
             
             loaded_count = 0
             
-            # Load Google Pro API Keys (array format)
-            if "google_pro_api_keys" in auth_data:
-                pro_keys = auth_data["google_pro_api_keys"]
-                if isinstance(pro_keys, list):
-                    for i, key in enumerate(pro_keys):
-                        if key and len(key) > 10 and self._validate_google_key(key):
-                            exists = any(k.key == key for k in self.api_keys)
-                            if not exists:
-                                self.api_keys.append(APIKey(
-                                    provider="google",
-                                    model="google/gemini-1.5-pro",
-                                    base_url="https://generativelanguage.googleapis.com",
-                                    key=key,
-                                    tier="pro"
-                                ))
-                                loaded_count += 1
-            
-            # Load Google Free API Keys (array format)
-            if "google_free_api_keys" in auth_data:
-                free_keys = auth_data["google_free_api_keys"]
-                if isinstance(free_keys, list):
-                    for key in free_keys:
-                        if key and len(key) > 10 and self._validate_google_key(key):
-                            exists = any(k.key == key for k in self.api_keys)
-                            if not exists:
-                                self.api_keys.append(APIKey(
-                                    provider="google",
-                                    model="google/gemini-1.5-flash",
-                                    base_url="https://generativelanguage.googleapis.com",
-                                    key=key,
-                                    tier="free"
-                                ))
-                                loaded_count += 1
-            
-            # Load legacy single Google API key (backward compatibility)
-            if "google_api_key" in auth_data:
-                key = auth_data["google_api_key"]
-                if key and len(key) > 10 and self._validate_google_key(key):
-                    exists = any(k.key == key for k in self.api_keys)
-                    if not exists:
-                        self.api_keys.append(APIKey(
-                            provider="google",
-                            model="google/gemini-1.5-flash",
-                            base_url="https://generativelanguage.googleapis.com",
-                            key=key,
-                            tier="auth"
-                        ))
-                        loaded_count += 1
+            # Google keys: pro / free 数组格式，以及旧版单个 google_api_key (向后兼容)
+            for auth_key, model, tier in _AUTH_GOOGLE_KEYS:
+                keys = auth_data.get(auth_key)
+                if isinstance(keys, str):
+                    keys = (keys,)
+                elif not isinstance(keys, list):
+                    continue
+                loaded_count += self._ingest("google", model, "https://generativelanguage.googleapis.com",
+                                             tier, keys, self._validate_google_key)
             
-            # Load other providers
-            for auth_key, (provider, model, base_url) in provider_map.items():
-                if auth_key in auth_data:
-                    key = auth_data[auth_key]
-                    if key and len(key) > 10:
-                        # 检查是否已存在
-                        exists = any(k.key == key for k in self.api_keys)
-                        if not exists:
-                            self.api_keys.append(APIKey(
-                                provider=provider,
-                                model=model,
-                                key=key,
-                                base_url=base_url,
-                                tier="auth"
-                            ))
-                            loaded_count += 1
+            # Load other providers (flat format: deepseek_api_key -> deepseek)
+            for auth_key, (provider, model, base_url) in _AUTH_PROVIDER_MAP.items():
+                key = auth_data.get(auth_key)
+                if key:
+                    loaded_count += self._ingest(provider, model, base_url, "auth", (key,))
             
             if loaded_count > 0:
                 logger.info(f"[OK] Loaded {loaded_count} keys from auth.json")
@@ -780,7 +1162,7 @@ class SmartModelDispatcher:
                 # 注意：不要硬编码具体key值，而是通过API验证来判断
                 if self._validate_google_key(key):
                     # Google备用 (Flash model)
-                    self.api_keys.append(APIKey(
+                    self._add_api_key(APIKey(
                         provider="google",
                         model="google/gemini-1.5-flash",
                         key=key,
@@ -811,32 +1193,58 @@ class SmartModelDispatcher:
     
     def _get_proxies(self, provider: str) -> Optional[Dict[str, str]]:
         """获取代理配置 - 国产模型强制直连（物理级流量绕行）"""
-        # 国内模型列表 - 这些域名在国内，直接连接无代理
-        domestic_providers = {"deepseek", "minimax", "kimi", "doubao", "zhipuai", "siliconflow", "qiniuyun", "modelscope"}
-        
-        if provider in domestic_providers:
+        if provider in DOMESTIC_PROVIDERS:
             # 显式注入空代理，实现物理级的流量绕行
             # 这样即使环境变量设置了代理，也会强制直连
-            return {"http": "", "https": ""}
+            return _DIRECT_PROXIES
         
         return self.proxy_sandbox
     
+    def _decorate(self, api: APIKey) -> None:
+        """预先算好预检请求的 headers / URL / 代理，存到 APIKey 上供后续预检复用"""
+        headers = self._build_request_headers(api)
+        if api.provider == "anthropic":
+            headers["anthropic-version"] = "2023-06-01"
+        api._headers = headers
+        api._test_url = self._build_test_url(api)
+        api._proxies = self._get_proxies(api.provider)
+    
     def pre_flight_check(self, api: APIKey) -> bool:
-        """Perform connectivity test with dynamic timeout"""
-        start_time = time.time()
+        """Perform connectivity test with dynamic timeout (results cached for PROBE_TTL seconds)"""
+        cache_key = (api.base_url, api.key)
+        cached = self._probe_cache.get(cache_key)
+        if cached is not None and time.monotonic() < cached[1]:
+            return cached[0]
         
-        dynamic_timeout = timeout_tracker.get_timeout(api.provider)
+        result = self._probe(api)
+        self._probe_cache[cache_key] = (result, time.monotonic() + self.PROBE_TTL)
+        return result
+    
+    def _send_probe(self, provider: str, url: str, headers: Optional[Dict[str, str]],
+                    proxies: Optional[Dict[str, str]], timeout: float) -> "requests.Response":
+        """发送预检请求: 列表接口用 HEAD，不支持 HEAD (405/501) 时退回不读响应体的 GET"""
+        if provider in _GET_PROBE_PROVIDERS:
+            return self.session.get(url, headers=headers, timeout=timeout, proxies=proxies)
+        response = self.session.head(url, headers=headers, timeout=timeout, proxies=proxies)
+        if response.status_code not in (405, 501):
+            return response
+        response.close()
+        return self.session.get(url, headers=headers, timeout=timeout, proxies=proxies, stream=True)
+    
+    def _probe(self, api: APIKey) -> bool:
+        """Issue one connectivity request for the key"""
+        import requests
         
-        headers = self._build_request_headers(api)
-        url = self._build_test_url(api)
+        start_time = time.time()
         
-        if api.provider == "anthropic":
-            headers["anthropic-version"] = "2023-06-01"
+        dynamic_timeout = timeout_tracker.get_timeout(api.provider)
         
-        proxies = self._get_proxies(api.provider)
+        if api._test_url is None:
+            self._decorate(api)
+        headers, url, proxies = api._headers, api._test_url, api._proxies
         
         try:
-            with self.session.get(url, headers=headers, timeout=dynamic_timeout, proxies=proxies) as response:
+            with self._send_probe(api.provider, url, headers, proxies, dynamic_timeout) as response:
                 response_time = time.time() - start_time
                 timeout_tracker.record(api.provider, response_time)
                 
@@ -871,8 +1279,7 @@ class SmartModelDispatcher:
         if self.is_user_specified_model():
             specified = ""
             try:
-                with open(self.auth_config, 'r') as f:
-                    specified = json.load(f).get("specified_model", "")
+                specified = _load_json_cached(self.auth_config).get("specified_model", "")
             except:
                 pass
             logger.info(f"ℹ️ 检测到用户切换 profile，清除指定模型: {specified}")
@@ -882,11 +1289,10 @@ class SmartModelDispatcher:
         # profile 命令清除用户指定标记，允许自动切换
         self._clear_user_specified_for_profile()
 
-        try:
-            profile = ModelProfile(profile_name)
-        except ValueError:
+        profile = _PROFILES_BY_NAME.get(profile_name)
+        if profile is None:
             logger.error(f"❌ 未知模式: {profile_name}")
-            logger.info(f"📋 可用模式: {[p.value for p in ModelProfile]}")
+            logger.info(f"📋 可用模式: {list(_PROFILES_BY_NAME)}")
             return False
 
         target_providers = self._routing_config.get(profile, [])
@@ -894,7 +1300,7 @@ class SmartModelDispatcher:
 
         candidates = []
         for provider in target_providers:
-            provider_candidates = [api for api in self.api_keys if api.provider == provider]
+            provider_candidates = self._by_provider.get(provider)
             if provider_candidates:
                 candidates.extend(provider_candidates)
             else:
@@ -904,25 +1310,49 @@ class SmartModelDispatcher:
             logger.error("❌ 无可用 API 密钥")
             return False
 
-        max_workers = min(32, len(candidates))
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            future_to_api = {executor.submit(self.pre_flight_check, api): api for api in candidates}
-            
-            for future in as_completed(future_to_api):
-                api = future_to_api[future]
-                try:
-                    is_healthy = future.result()
-                    if is_healthy:
-                        self._write_config(api)
-                        logger.info(f"🎉 竞速胜出: {api.provider} | Model: {api.model}")
-                        return True
-                except Exception as e:
-                    logger.debug(f"API {api.provider} check error: {e}")
-                    continue
+        # 分两轮检测: 第一轮每个 host 只测一个 key (同一 host 的请求不争抢连接)，
+        # 全部失败后再并发检测其余 key
+        first_wave: List[APIKey] = []
+        rest: List[APIKey] = []
+        seen_hosts = set()
+        for api in candidates:
+            (rest if api.base_url in seen_hosts else first_wave).append(api)
+            seen_hosts.add(api.base_url)
+        
+        for wave in (first_wave, rest):
+            winner = self._race_pre_flight(wave) if wave else None
+            if winner is not None:
+                self._write_config(winner)
+                logger.info(f"🎉 竞速胜出: {winner.provider} | Model: {winner.model}")
+                return True
         
         logger.error("❌ 所有候选大脑均无法连接!")
         return False
     
+    def _race_pre_flight(self, candidates: List[APIKey]) -> Optional[APIKey]:
+        """并发检测一组 key，返回第一个健康的 key (全部失败返回 None)"""
+        # 共享线程池: 第一个健康结果出来就返回，不等其余检测跑完
+        executor = _get_health_executor()
+        future_to_api = {executor.submit(self.pre_flight_check, api): api for api in candidates}
+        pending = set(future_to_api)
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    api = future_to_api[future]
+                    try:
+                        is_healthy = future.result()
+                    except Exception as e:
+                        logger.debug(f"API {api.provider} check error: {e}")
+                        continue
+                    if is_healthy:
+                        return api
+        finally:
+            # 取消尚未开始的检测，已在进行中的请求在后台自行结束
+            for future in pending:
+                future.cancel()
+        return None
+    
     def set_specific_model(self, full_model_string: str, skip_health_check: bool = False) -> bool:
         """直接设置指定的模型，可选健康检测
         
@@ -940,8 +1370,8 @@ class SmartModelDispatcher:
             # 从已加载的 keys 中查找对应 provider 的 key
             api_key = ""
             base_url = ""
-            for k in self.api_keys:
-                if k.provider == provider and k.key:
+            for k in self._by_provider.get(provider, ()):
+                if k.key:
                     api_key = k.key
                     base_url = k.base_url
                     break
@@ -949,8 +1379,7 @@ class SmartModelDispatcher:
             # 如果没找到，从 auth.json 查找
             if not api_key and self.auth_config.exists():
                 try:
-                    with open(self.auth_config, 'r') as f:
-                        auth_data = json.load(f)
+                    auth_data = _load_json_cached(self.auth_config)
                     key_name = f"{provider}_api_key"
                     api_key = auth_data.get(key_name, "")
                     # 获取对应的 base_url
@@ -996,27 +1425,37 @@ class SmartModelDispatcher:
             logger.error(f"❌ 设置特定模型失败: {e}")
             return False
     
+    @staticmethod
+    def _atomic_write_json(path: Path, data: Dict[str, Any]) -> None:
+        """原子写 JSON 文件，临时文件创建时即为 0o600，不需要事后 chmod"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # 临时文件名带 pid，多个进程同时写时不会互相覆盖临时文件
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(dumps_json(data, indent=True))
+            f.flush()
+            os.fsync(fd)
+        os.replace(tmp, path)
+    
     def _write_config(self, api: APIKey) -> None:
-        lock_file = Path("/tmp/opencode_dispatcher.lock")
-        lock_file.parent.mkdir(parents=True, exist_ok=True)
-        
-        lock_fd = open(lock_file, 'w')
-        try:
-            fcntl.flock(lock_fd, fcntl.LOCK_EX)
-            try:
-                self._write_config_unlocked(api)
-            finally:
-                fcntl.flock(lock_fd, fcntl.LOCK_UN)
-        finally:
-            lock_fd.close()
+        # 进程内用锁串行化；跨进程依赖临时文件 + 原子 rename，读者不会看到半截文件
+        with self._config_lock:
+            self._write_config_unlocked(api)
     
     def _write_config_unlocked(self, api: APIKey) -> None:
         try:
-            if self.opencode_config.exists():
-                with open(self.opencode_config, 'r', encoding='utf-8') as f:
-                    main_config = json.load(f)
-            else:
+            try:
+                st = self.opencode_config.stat()
+                stamp: Optional[Tuple[int, int]] = (st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                stamp = None
+            if stamp is None:
                 main_config = {}
+            elif stamp == self._main_config_stamp and self._main_config_cache is not None:
+                main_config = copy.deepcopy(self._main_config_cache)
+            else:
+                main_config = loads_json(self.opencode_config.read_bytes())
 
             # [安全修复] 强制清洗可能潜伏在任何地方的 apiKey
             if "provider" in main_config:
@@ -1033,22 +1472,16 @@ class SmartModelDispatcher:
             if "plugin" not in main_config:
                 main_config["plugin"] = ["oh-my-opencode@latest"]
             
-            self.opencode_config.parent.mkdir(parents=True, exist_ok=True)
-            temp_file = self.opencode_config.with_suffix(".tmp")
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(main_config, f, indent=2, ensure_ascii=False)
-            temp_file.replace(self.opencode_config)
-            os.chmod(self.opencode_config, 0o600)
-            
-            self.auth_config.parent.mkdir(parents=True, exist_ok=True)
+            self._atomic_write_json(self.opencode_config, main_config)
+            st = self.opencode_config.stat()
+            self._main_config_cache = main_config
+            self._main_config_stamp = (st.st_mtime_ns, st.st_size)
             
-            auth_data = {}
-            if self.auth_config.exists():
-                try:
-                    with open(self.auth_config, 'r') as f:
-                        auth_data = json.load(f)
-                except Exception:
-                    pass
+            try:
+                auth_data = self._read_auth()
+            except (ValueError, TypeError):
+                # auth.json 已损坏，整体重写
+                auth_data = {}
             
             # 只更新当前 provider 的 key，保留其他 provider 的 keys
             if api.key:  # 只有非空 key 才更新
@@ -1057,11 +1490,7 @@ class SmartModelDispatcher:
             auth_data["api_base_url"] = api.base_url
             auth_data["api_provider"] = api.provider
             
-            temp_auth = self.auth_config.with_suffix(".auth.tmp")
-            with open(temp_auth, 'w') as f:
-                json.dump(auth_data, f, indent=2)
-            temp_auth.replace(self.auth_config)
-            os.chmod(self.auth_config, 0o600)
+            self._write_auth(auth_data)
 
             logger.info(f"[OK] Config updated: Model -> {api.model}")
             logger.info(f"[OK] Credentials injected: {api.provider} -> auth.json")
@@ -1079,20 +1508,49 @@ class SmartModelDispatcher:
     
     def get_current_api_key(self) -> Optional[APIKey]:
         try:
-            if self.auth_config.exists():
-                with open(self.auth_config, 'r') as f:
-                    auth_data = json.load(f)
-                
-                key = auth_data.get("api_key", "")
-                
-                for api in self.api_keys:
-                    if api.key == key:
-                        return api
-                return None
+            # 文件未变化时直接复用上次的解析结果 (只需一次 stat)
+            auth_data = _load_json_cached(self.auth_config)
+            return self._key_index.get(auth_data.get("api_key", ""))
         except Exception:
             pass
         return None
     
+    def runtime_request_with_failover_batched(
+        self,
+        messages: List[Dict[str, str]],
+        max_retries: int = 3,
+        timeout: int = 60,
+        hedge_delay_ms: Optional[int] = None,
+        return_raw: bool = False
+    ) -> "Future[Dict[str, Any]]":
+        """提交一个运行时请求并立即返回 Future，适合同步代码中的大量短请求 (评测、分类等) (需要 httpx)
+        
+        BATCH_INTERVAL_MS 内到达的请求 (最多 MAX_BATCH_SIZE 个) 作为一批，
+        在后台线程的常驻事件循环上经 runtime_request_with_failover_async 并发发出，
+        同一主机的请求共用一条 HTTP/2 连接。每个请求独立发送、各自得到结果；
+        各 provider 的对话接口都只接受单个会话，因此不做请求体层面的合并。
+        用完后调用 close() 停止后台线程。
+        
+        Returns:
+            Future，结果与 runtime_request_with_failover 的返回值相同
+        """
+        if not HTTPX_AVAILABLE:
+            raise RuntimeError("runtime_request_with_failover_batched 需要 httpx: pip install 'httpx[http2]'")
+        batcher = self._batcher
+        if batcher is None:
+            with self._batcher_lock:
+                batcher = self._batcher
+                if batcher is None:
+                    batcher = self._batcher = _RequestBatcher(self)
+        return batcher.submit(messages, (max_retries, timeout, hedge_delay_ms, return_raw))
+    
+    def close(self) -> None:
+        """停止批量请求的后台线程 (如已创建)；之后仍可再次调用 runtime_request_with_failover_batched"""
+        with self._batcher_lock:
+            batcher, self._batcher = self._batcher, None
+        if batcher is not None:
+            batcher.close()
+    
     def get_fallback_keys(self, current_key: str, max_count: int = 3) -> List[APIKey]:
         """获取备用 API Keys 列表
         
@@ -1103,19 +1561,28 @@ class SmartModelDispatcher:
         Returns:
             备用 API Keys 列表
         """
-        # 按优先级排序: pro > secondary > backup > expert > free
-        priority_order = {"pro": 0, "primary": 1, "secondary": 2, "backup": 3, "expert": 4, "free": 5, "env": 1, "specific": 2}
-        
-        available_keys = [k for k in self.api_keys if k.key != current_key]
-        available_keys.sort(key=lambda x: priority_order.get(x.tier, 99))
+        sorted_keys = self._api_keys_sorted
+        if sorted_keys is None:
+            sorted_keys = sorted(self._api_keys, key=lambda x: _TIER_PRIORITY.get(x.tier, 99))
+            self._api_keys_sorted = sorted_keys
         
-        return available_keys[:max_count]
+        available_keys: List[APIKey] = []
+        if max_count <= 0:
+            return available_keys
+        for k in sorted_keys:
+            if k.key != current_key:
+                available_keys.append(k)
+                if len(available_keys) == max_count:
+                    break
+        return available_keys
     
     def runtime_request_with_failover(
         self, 
         messages: List[Dict[str, str]],
         max_retries: int = 3,
-        timeout: int = 60
+        timeout: int = 60,
+        hedge_delay_ms: Optional[int] = None,
+        return_raw: bool = False
     ) -> Dict[str, Any]:
         """运行时请求 with 自动故障转移
         
@@ -1126,10 +1593,17 @@ class SmartModelDispatcher:
         - Connection Error (连接失败)
         - Timeout (超时)
         
+        默认依次尝试: 当前候选失败后才发出下一个。
+        对冲请求 (需显式设置 hedge_delay_ms 开启): 当前候选在 hedge_delay_ms 内没有返回时，
+        并行发出下一个候选，取最先成功的结果。落选的请求会继续执行到结束，
+        token 消耗和限流额度可能成倍增加，延迟应设得高于正常响应时间。
+        
         Args:
             messages: 消息列表 [{"role": "user", "content": "..."}]
             max_retries: 最大重试次数
             timeout: 请求超时时间(秒)
+            hedge_delay_ms: 对冲延迟(毫秒)，默认 None 表示不对冲 (失败后才依次尝试下一个)
+            return_raw: 是否在 response 中附带完整的响应 JSON ("raw")
             
         Returns:
             {
@@ -1140,70 +1614,166 @@ class SmartModelDispatcher:
                 "attempts": 尝试次数
             }
         """
-        # 获取当前配置的 key
-        current_api = self.get_current_api_key()
+        all_keys_to_try = self._failover_candidates(max_retries)
+        if not all_keys_to_try:
+            return self._no_key_result()
         
-        if not current_api:
-            logger.error("❌ 无法获取当前 API 配置")
-            return {
-                "success": False,
-                "response": None,
-                "error": "No API key configured",
-                "fallback_used": False,
-                "attempts": 0
-            }
+        hedge_delay = hedge_delay_ms / 1000 if hedge_delay_ms is not None else None
+        executor = ThreadPoolExecutor(max_workers=len(all_keys_to_try), thread_name_prefix="dispatcher-hedge")
+        future_to_idx: Dict[Any, int] = {}
+        pending: set = set()
         
-        # 获取备用 keys
-        fallback_keys = self.get_fallback_keys(current_api.key, max_retries)
+        def submit_next() -> None:
+            idx = len(future_to_idx)
+            api = all_keys_to_try[idx]
+            if idx > 0:
+                logger.warning(f"🔄 尝试备用模型 {idx + 1}/{len(all_keys_to_try)}: {api.provider}/{api.model}")
+            future = executor.submit(self._make_api_request, api, messages, timeout, return_raw)
+            future_to_idx[future] = idx
+            pending.add(future)
         
-        all_keys_to_try = [current_api] + fallback_keys
+        last_error = None
+        try:
+            submit_next()
+            while pending:
+                has_more = len(future_to_idx) < len(all_keys_to_try)
+                done, not_done = wait(pending, timeout=hedge_delay if has_more else None,
+                                      return_when=FIRST_COMPLETED)
+                pending.intersection_update(not_done)
+                if not done:
+                    # 对冲: 当前候选迟迟未返回，并行发出下一个
+                    submit_next()
+                    continue
+                
+                for future in done:
+                    attempt_idx = future_to_idx[future]
+                    api = all_keys_to_try[attempt_idx]
+                    try:
+                        response = future.result()
+                    except Exception as e:
+                        last_error = str(e)
+                        self._log_request_error(api, last_error)
+                        response = None
+                    
+                    if response:
+                        return self._success_result(api, attempt_idx, response)
+                    
+                    # 失败后立即尝试下一个
+                    if len(future_to_idx) < len(all_keys_to_try):
+                        submit_next()
+        finally:
+            # 取消尚未开始的请求，已发出的请求在后台自行结束
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
         
-        logger.info(f"🚀 开始请求 (共 {len(all_keys_to_try)} 个候选)")
+        return self._all_failed_result(last_error, len(all_keys_to_try))
+    
+    async def runtime_request_with_failover_async(
+        self, 
+        messages: List[Dict[str, str]],
+        max_retries: int = 3,
+        timeout: int = 60,
+        hedge_delay_ms: Optional[int] = None,
+        return_raw: bool = False
+    ) -> Dict[str, Any]:
+        """runtime_request_with_failover 的异步版本 (需要 httpx)
+        
+        对冲与故障转移规则相同，但请求在事件循环中并发执行、不占用线程；
+        HTTP/2 下同一主机的对冲请求复用同一条 TLS 连接。胜出后其余请求会被真正取消。
+        参数与返回值同 runtime_request_with_failover。
+        """
+        if not HTTPX_AVAILABLE:
+            raise RuntimeError("runtime_request_with_failover_async 需要 httpx: pip install 'httpx[http2]'")
+        
+        all_keys_to_try = self._failover_candidates(max_retries)
+        if not all_keys_to_try:
+            return self._no_key_result()
+        
+        hedge_delay = hedge_delay_ms / 1000 if hedge_delay_ms is not None else None
+        task_to_idx: Dict["asyncio.Task[Any]", int] = {}
+        pending: set = set()
+        
+        def submit_next() -> None:
+            idx = len(task_to_idx)
+            api = all_keys_to_try[idx]
+            if idx > 0:
+                logger.warning(f"🔄 尝试备用模型 {idx + 1}/{len(all_keys_to_try)}: {api.provider}/{api.model}")
+            task = asyncio.ensure_future(self._make_api_request_async(api, messages, timeout, return_raw))
+            task_to_idx[task] = idx
+            pending.add(task)
         
         last_error = None
-        for attempt_idx, api in enumerate(all_keys_to_try):
-            try:
-                is_fallback = attempt_idx > 0
-                if is_fallback:
-                    logger.warning(f"🔄 尝试备用模型 {attempt_idx + 1}/{len(all_keys_to_try)}: {api.provider}/{api.model}")
-                
-                # 构建请求
-                response = self._make_api_request(api, messages, timeout)
+        try:
+            submit_next()
+            while pending:
+                has_more = len(task_to_idx) < len(all_keys_to_try)
+                done, pending = await asyncio.wait(pending, timeout=hedge_delay if has_more else None,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 对冲: 当前候选迟迟未返回，并行发出下一个
+                    submit_next()
+                    continue
                 
-                if response:
-                    if is_fallback:
-                        logger.info(f"✅ 备用模型成功! Provider: {api.provider}")
-                    return {
-                        "success": True,
-                        "response": response,
-                        "error": None,
-                        "fallback_used": is_fallback,
-                        "attempts": attempt_idx + 1,
-                        "provider": api.provider,
-                        "model": api.model
-                    }
+                for task in done:
+                    attempt_idx = task_to_idx[task]
+                    api = all_keys_to_try[attempt_idx]
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        last_error = str(e)
+                        self._log_request_error(api, last_error)
+                        response = None
                     
-            except Exception as e:
-                error_msg = str(e)
-                last_error = error_msg
-                
-                # 判断错误类型
-                if "502" in error_msg or "Bad Gateway" in error_msg:
-                    logger.warning(f"❌ {api.provider} 返回 502 Bad Gateway")
-                elif "504" in error_msg or "Gateway Timeout" in error_msg:
-                    logger.warning(f"❌ {api.provider} 返回 504 Gateway Timeout")
-                elif "429" in error_msg or "Too Many Requests" in error_msg:
-                    logger.warning(f"❌ {api.provider} 触发限流 (429)")
-                elif "timeout" in error_msg.lower():
-                    logger.warning(f"⏰ {api.provider} 请求超时")
-                elif "connection" in error_msg.lower():
-                    logger.warning(f"🔌 {api.provider} 连接失败")
-                else:
-                    logger.warning(f"❓ {api.provider} 未知错误: {error_msg[:50]}")
-                
-                # 继续尝试下一个
-                continue
+                    if response:
+                        return self._success_result(api, attempt_idx, response)
+                    
+                    # 失败后立即尝试下一个
+                    if len(task_to_idx) < len(all_keys_to_try):
+                        submit_next()
+        finally:
+            for task in pending:
+                task.cancel()
         
+        return self._all_failed_result(last_error, len(all_keys_to_try))
+    
+    def _failover_candidates(self, max_retries: int) -> List[APIKey]:
+        """当前 key + 备用 keys，按尝试顺序排列；没有当前配置时为空"""
+        current_api = self.get_current_api_key()
+        if not current_api:
+            return []
+        all_keys_to_try = [current_api] + self.get_fallback_keys(current_api.key, max_retries)
+        logger.info(f"🚀 开始请求 (共 {len(all_keys_to_try)} 个候选)")
+        return all_keys_to_try
+    
+    @staticmethod
+    def _no_key_result() -> Dict[str, Any]:
+        logger.error("❌ 无法获取当前 API 配置")
+        return {
+            "success": False,
+            "response": None,
+            "error": "No API key configured",
+            "fallback_used": False,
+            "attempts": 0
+        }
+    
+    @staticmethod
+    def _success_result(api: APIKey, attempt_idx: int, response: Dict[str, Any]) -> Dict[str, Any]:
+        is_fallback = attempt_idx > 0
+        if is_fallback:
+            logger.info(f"✅ 备用模型成功! Provider: {api.provider}")
+        return {
+            "success": True,
+            "response": response,
+            "error": None,
+            "fallback_used": is_fallback,
+            "attempts": attempt_idx + 1,
+            "provider": api.provider,
+            "model": api.model
+        }
+    
+    @staticmethod
+    def _all_failed_result(last_error: Optional[str], attempts: int) -> Dict[str, Any]:
         # 所有 key 都失败
         logger.error("❌ 所有模型均失败，无法完成请求")
         return {
@@ -1211,106 +1781,150 @@ class SmartModelDispatcher:
             "response": None,
             "error": last_error or "All models failed",
             "fallback_used": True,
-            "attempts": len(all_keys_to_try)
+            "attempts": attempts
         }
     
+    def _log_request_error(self, api: APIKey, error_msg: str) -> None:
+        """按错误类型记录请求失败日志 (一次扫描，多类同时出现时取优先级最高的)"""
+        best = 0
+        for match in _REQUEST_ERROR_RE.finditer(error_msg):
+            if not best or match.lastindex < best:
+                best = match.lastindex
+                if best == 1:
+                    break
+        if best:
+            logger.warning(_REQUEST_ERROR_LOG[best - 1], api.provider)
+        else:
+            logger.warning("❓ %s 未知错误: %s", api.provider, error_msg[:50])
+    
+    @staticmethod
+    def _stream_content(spec: ProviderSpec, response: "requests.Response") -> Any:
+        """流式解析响应，取到第一段回复文本即停止 (不构建完整的 JSON 对象)"""
+        response.raw.decode_content = True
+        try:
+            content = next(ijson.items(response.raw, spec.text_prefix), "")
+        except ijson.JSONError:
+            raise Exception("Invalid JSON response")
+        # 读完剩余响应体，连接可以放回连接池复用
+        response.raw.drain_conn()
+        return content
+    
     def _make_api_request(
         self, 
         api: APIKey, 
         messages: List[Dict[str, str]],
-        timeout: int = 60
+        timeout: int = 60,
+        return_raw: bool = False
     ) -> Optional[Dict[str, Any]]:
-        headers = {
-            "Content-Type": "application/json"
-        }
+        """发送一次对话请求
         
-        if api.provider == "anthropic":
-            headers["x-api-key"] = api.key
-            headers["anthropic-version"] = "2023-06-01"
-        elif api.provider in ["openai", "deepseek", "siliconflow", "minimax", "kimi", "doubao", "groq", "qiniuyun", "openrouter"]:
-            headers["Authorization"] = f"Bearer {api.key}"
-        elif api.provider == "google":
-            headers["Authorization"] = f"Bearer {api.key}"
-        elif api.provider == "zhipuai":
-            headers["Authorization"] = f"Bearer {api.key}"
-        
-        payload: Dict[str, Any] = {
-            "messages": messages
-        }
-        
-        if api.provider == "anthropic":
-            payload["model"] = api.model.replace("anthropic/", "")
-            payload["max_tokens"] = 4096
-        elif api.provider == "google":
-            payload["model"] = api.model
-            payload["generationConfig"] = {
-                "temperature": 0.9,
-                "maxOutputTokens": 8192,
-                "topP": 0.95,
-                "topK": 40
-            }
-        else:
-            payload["model"] = api.model
-        
-        if api.provider == "google":
-            url = f"{api.base_url}/v1beta/models/{api.model.replace('google/', '')}:generateContent"
-        else:
-            url = f"{api.base_url}/chat/completions"
+        Args:
+            return_raw: 是否在结果中附带完整的响应 JSON ("raw")；
+                不需要时用 ijson 流式解析，只取回复文本
+        """
+        import requests
         
-        # 统一代理策略：所有请求使用相同代理配置
-        proxies = self.proxy_sandbox
+        stream = IJSON_AVAILABLE and not return_raw
+        spec = _PROVIDER_SPECS.get(api.provider, _UNLISTED_SPEC)
         
         try:
-            with self.session.post(
-                url, 
-                headers=headers, 
-                json=payload, 
+            # Content-Type 已绑定在 provider 的 Session 上
+            with self._provider_session(api.provider).post(
+                spec.url(api), 
+                headers=spec.auth(api.key), 
+                json=spec.payload(api, messages), 
                 timeout=timeout,
-                proxies=proxies
+                stream=stream
             ) as response:
                 
                 if response.status_code == 200:
+                    if stream:
+                        return {"content": self._stream_content(spec, response)}
+                    
                     try:
-                        data = response.json()
+                        data = loads_json(response.content)
                     except ValueError:
                         raise Exception(f"Invalid JSON response: {response.text[:100]}")
                     
-                    if api.provider == "google":
-                        candidates = data.get("candidates", [])
-                        if candidates:
-                            content = candidates[0].get("content", {})
-                            parts = content.get("parts", [])
-                            if parts:
-                                return {"content": parts[0].get("text", ""), "raw": data}
-                    else:
-                        choices = data.get("choices", [])
-                        if choices:
-                            return {"content": choices[0].get("message", {}).get("content", ""), "raw": data}
-                    
-                    return {"content": "", "raw": data}
-                    
-                elif response.status_code == 401:
-                    raise Exception("401 Unauthorized - API Key invalid")
-                elif response.status_code == 402:
-                    raise Exception("402 Payment Required - Insufficient balance")
-                elif response.status_code == 403:
-                    raise Exception("403 Forbidden - Access denied")
-                elif response.status_code == 429:
-                    raise Exception("429 Too Many Requests - Rate limited")
-                elif response.status_code == 502:
-                    raise Exception("502 Bad Gateway")
-                elif response.status_code == 504:
-                    raise Exception("504 Gateway Timeout")
-                elif response.status_code >= 500:
-                    raise Exception(f"{response.status_code} Server Error")
-                else:
-                    raise Exception(f"HTTP {response.status_code}: {response.text[:100]}")
+                    result: Dict[str, Any] = {"content": spec.extract(data)}
+                    if return_raw:
+                        result["raw"] = data
+                    return result
+                
+                raise self._status_error(response)
         except requests.exceptions.Timeout:
             raise Exception("Request timeout")
         except requests.exceptions.ConnectionError as e:
             raise Exception(f"Connection error: {str(e)}")
         except Exception as e:
             raise
+    
+    async def _make_api_request_async(
+        self, 
+        api: APIKey, 
+        messages: List[Dict[str, str]],
+        timeout: int = 60,
+        return_raw: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """_make_api_request 的异步版本 (httpx，HTTP/2)"""
+        spec = _PROVIDER_SPECS.get(api.provider, _UNLISTED_SPEC)
+        
+        try:
+            # Content-Type 已绑定在客户端上
+            response = await self._async_client().post(
+                spec.url(api),
+                headers=spec.auth(api.key),
+                content=dumps_json(spec.payload(api, messages)),
+                timeout=timeout
+            )
+        except httpx.TimeoutException:
+            raise Exception("Request timeout")
+        except httpx.TransportError as e:
+            raise Exception(f"Connection error: {str(e)}")
+        
+        if response.status_code != 200:
+            raise self._status_error(response)
+        
+        try:
+            data = loads_json(response.content)
+        except ValueError:
+            raise Exception(f"Invalid JSON response: {response.text[:100]}")
+        
+        result: Dict[str, Any] = {"content": spec.extract(data)}
+        if return_raw:
+            result["raw"] = data
+        return result
+    
+    @staticmethod
+    def _status_error(response: Any) -> Exception:
+        """非 200 响应对应的异常 (requests / httpx 的 Response 均可)"""
+        status = response.status_code
+        if status == 401:
+            return Exception("401 Unauthorized - API Key invalid")
+        elif status == 402:
+            return Exception("402 Payment Required - Insufficient balance")
+        elif status == 403:
+            return Exception("403 Forbidden - Access denied")
+        elif status == 429:
+            return Exception("429 Too Many Requests - Rate limited")
+        elif status == 502:
+            return Exception("502 Bad Gateway")
+        elif status == 504:
+            return Exception("504 Gateway Timeout")
+        elif status >= 500:
+            return Exception(f"{status} Server Error")
+        return Exception(f"HTTP {status}: {response.text[:100]}")
+
+
+# export_env 导出的 auth.json 字段 -> 环境变量名
+_EXPORT_ENV_KEYS: Tuple[Tuple[str, str], ...] = tuple(
+    (key, key.upper()) for key in (
+        "google_api_key", "openai_api_key", "anthropic_api_key",
+        "deepseek_api_key", "siliconflow_api_key", "minimax_api_key",
+        "zhipuai_api_key", "kimi_api_key", "doubao_api_key",
+    )
+)
+
 
 def export_env():
     """导出环境变量供 Shell 脚本使用
@@ -1325,29 +1939,24 @@ def export_env():
         # 方式3: 直接运行后手动 export
         python3 smart_model_dispatcher.py --export-env
     """
-    import json
     import shlex
     auth_config = Path.home() / ".local" / "share" / "opencode" / "auth.json"
     
     auth_data = {}
-    if auth_config.exists():
-        try:
-            with open(auth_config, 'r') as f:
-                auth_data = json.load(f)
-        except Exception:
-            pass
+    try:
+        auth_data = _load_json_cached(auth_config)
+    except Exception:
+        pass
     
     # 导出有效的环境变量 - 使用 shlex.quote 确保安全的 shell 转义
-    for key in ["google_api_key", "openai_api_key", "anthropic_api_key", 
-                 "deepseek_api_key", "siliconflow_api_key", "minimax_api_key",
-                 "zhipuai_api_key", "kimi_api_key", "doubao_api_key"]:
-        value = auth_data.get(key, "")
+    lines = []
+    for key, env_name in _EXPORT_ENV_KEYS:
+        value = auth_data.get(key)
         if value:
-            # 转换为大写并输出 export 命令
-            env_name = key.upper()
-            # 使用 shlex.quote 进行安全的 shell 转义
-            safe_value = shlex.quote(value)
-            print(f"export {env_name}={safe_value}")
+            lines.append(f"export {env_name}={shlex.quote(value)}\n")
+    # 一次性写出
+    if lines:
+        sys.stdout.write("".join(lines))
 
 
 if __name__ == "__main__":
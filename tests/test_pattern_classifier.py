@@ -0,0 +1,54 @@
+"""
+PatternClassifier 回归测试
+
+期望值与重构前的实现一致: 任务描述转小写后，按类别顺序逐个模式 re.search (IGNORECASE)，
+返回第一个有模式命中的类别。
+"""
+
+import re
+
+import pytest
+
+import selector_core
+from openclaw_selector import TASK_PATTERNS
+from selector_core import PatternClassifier
+
+# (任务描述, 类别；None 表示均未命中)
+CASES = [
+    ("import numpy", "coding"),
+    ("fix this bug", "coding"),
+    ("Debug THE Crash", "coding"),
+    ("写一个排序函数", "fast"),
+    ("hello", None),
+    ("", "fast"),
+    # lower() 把 'İ' 变成 'i' + U+0307，原实现因此匹配不到 "import"
+    ("İmport numpy", None),
+    # IGNORECASE 把 'ı'、'ſ' 当作 i、s (lower() 不改变它们)，自动机路径需同样折叠
+    ("ımport numpy", "coding"),
+    ("claſſ Foo", "coding"),
+]
+
+_AUTOMATON_MODES = [False]
+if selector_core.AHOCORASICK_AVAILABLE:
+    _AUTOMATON_MODES.append(True)
+
+
+def _baseline(text):
+    lowered = text.lower()
+    for key, patterns in TASK_PATTERNS.items():
+        if any(re.search(p, lowered, re.IGNORECASE) for p in patterns):
+            return key
+    return None
+
+
+@pytest.fixture(params=_AUTOMATON_MODES, ids=lambda on: "ahocorasick" if on else "regex")
+def classifier(request, monkeypatch):
+    """按指定路径 (纯正则 / Aho-Corasick) 构建分类器"""
+    monkeypatch.setattr(selector_core, "AHOCORASICK_AVAILABLE", request.param)
+    return PatternClassifier(TASK_PATTERNS)
+
+
+@pytest.mark.parametrize("text,expected", CASES)
+def test_classify_matches_baseline(classifier, text, expected):
+    assert _baseline(text) == expected
+    assert classifier.classify(text) == expected
@@ -0,0 +1,94 @@
+"""
+_RequestBatcher 测试
+
+用替身 dispatcher 代替真实的 provider 请求，检查结果回传、批内并发与关闭行为。
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from smart_model_dispatcher import _RequestBatcher
+
+
+class _FakeDispatcher:
+    """记录调用所在线程 / 并发数的替身，代替 SmartModelDispatcher"""
+    
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.loops = set()
+        self.active = 0
+        self.max_active = 0
+        self.closed_clients = 0
+    
+    async def runtime_request_with_failover_async(self, messages, *options):
+        self.loops.add(asyncio.get_running_loop())
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if messages == "boom":
+                raise ValueError("boom")
+            return {"success": True, "content": messages, "options": options}
+        finally:
+            self.active -= 1
+    
+    async def _close_async_client(self):
+        self.closed_clients += 1
+
+
+def test_results_are_delivered_per_request():
+    dispatcher = _FakeDispatcher()
+    batcher = _RequestBatcher(dispatcher, batch_interval_ms=5)
+    try:
+        futures = [batcher.submit(f"m{i}", (3, 60, None, False)) for i in range(25)]
+        failing = batcher.submit("boom", ())
+        for i, future in enumerate(futures):
+            assert future.result(timeout=5) == {"success": True, "content": f"m{i}", "options": (3, 60, None, False)}
+        with pytest.raises(ValueError):
+            failing.result(timeout=5)
+    finally:
+        batcher.close()
+
+
+def test_batches_share_one_event_loop_and_run_concurrently():
+    dispatcher = _FakeDispatcher(delay=0.2)
+    batcher = _RequestBatcher(dispatcher, batch_interval_ms=20, max_batch_size=10)
+    try:
+        start = time.monotonic()
+        futures = [batcher.submit(f"m{i}", ()) for i in range(10)]
+        for future in futures:
+            future.result(timeout=5)
+        elapsed = time.monotonic() - start
+    finally:
+        batcher.close()
+    assert len(dispatcher.loops) == 1
+    assert dispatcher.max_active == 10
+    assert elapsed < 1.0
+
+
+def test_close_cancels_queued_requests_and_closes_client():
+    dispatcher = _FakeDispatcher()
+    # 攒批窗口远大于测试时长，close 时请求仍在排队
+    batcher = _RequestBatcher(dispatcher, batch_interval_ms=60_000)
+    futures = [batcher.submit(f"m{i}", ()) for i in range(3)]
+    start = time.monotonic()
+    batcher.close()
+    assert time.monotonic() - start < 5
+    assert all(future.cancelled() for future in futures)
+    assert dispatcher.closed_clients == 1
+    assert not batcher._thread.is_alive()
+    with pytest.raises(RuntimeError):
+        batcher.submit("late", ())
+    batcher.close()
+
+
+def test_close_waits_for_requests_in_flight():
+    dispatcher = _FakeDispatcher(delay=0.2)
+    batcher = _RequestBatcher(dispatcher, batch_interval_ms=1)
+    future = batcher.submit("m", ())
+    while dispatcher.active == 0:
+        time.sleep(0.01)
+    batcher.close()
+    assert future.result(timeout=0) == {"success": True, "content": "m", "options": ()}
@@ -0,0 +1,117 @@
+"""
+TaskAnalyzer 分类回归测试
+
+期望值由重构前的实现 (逐个模式 re.search，命中的模式各计 1 分) 生成，
+合并匹配 / Aho-Corasick 等优化都不能改变这些结果。
+"""
+
+import re
+
+import pytest
+
+import model_selector
+from model_selector import PatternMatcher, TaskAnalyzer
+
+# (任务文本, 任务类型, 复杂度, 是否紧急)
+GOLDEN = [
+    ("hi", "CHAT", 0, False),
+    ("hello there", "CHAT", 0, False),
+    ("hey", "CHAT", 0, False),
+    ("你好", "CHAT", 0, False),
+    ("在吗", "CHAT", 0, False),
+    ("bug", "DEBUGGING", 0, False),
+    ("error", "DEBUGGING", 0, False),
+    ("translate", "TRANSLATION", 0, False),
+    ("翻译", "TRANSLATION", 0, False),
+    ("urgent fix crash now", "DEBUGGING", 0, True),
+    ("help me debug", "DEBUGGING", 0, True),
+    ("why is my app slow", "CODING", 0, False),
+    ("code review of this project", "ANALYSIS", 0, False),
+    ("a-b-c-d translate", "TRANSLATION", 0, False),
+    ("写一个快速排序算法", "CODING", 0, False),
+    ("写个函数计算斐波那契", "CODING", 0, False),
+    ("帮我写一个 python 脚本读取 csv", "CODING", 0, False),
+    ("implement a REST api in flask", "CODING", 0, False),
+    ("refactor this class to use dependency injection", "CODING", 0, False),
+    ("main.py", "CODING", 0, False),
+    ("fix the bug in utils.js", "DEBUGGING", 0, False),
+    ("Traceback (most recent call last): KeyError: 'x'", "DEBUGGING", 0, False),
+    ("程序报错了，帮我调试一下", "CODING", 0, False),
+    ("app 闪退 怎么修复", "CODING", 0, False),
+    ("analyze the system architecture for scalability", "ANALYSIS", 0.3, False),
+    ("代码审查 性能分析", "CODING", 0.15, False),
+    ("解释一下这段代码", "CODING", 0, False),
+    ("review my pull request please", "ANALYSIS", 0, False),
+    ("write a blog post about rust", "GENERAL", 0, False),
+    ("summarize this article", "WRITING", 0, False),
+    ("写文章介绍微服务", "WRITING", 0.15, False),
+    ("translate this to Japanese", "TRANSLATION", 0, False),
+    ("这个单词什么意思", "TRANSLATION", 0, False),
+    ("How are you today?", "CHAT", 0, False),
+    ("research the latest LLM papers 2025", "RESEARCH", 0, False),
+    ("compare postgres vs mysql", "RESEARCH", 0, False),
+    ("哪个好: vue 还是 react", "RESEARCH", 0, False),
+    ("brainstorm creative ideas for a game", "CREATIVE", 0, False),
+    ("写诗一首关于秋天", "CREATIVE", 0, False),
+    ("calculate the integral of x^2", "MATH", 0, False),
+    ("12*34+56", "MATH", 0, False),
+    ("算一下 3.5 * 4", "MATH", 0, False),
+    ("design a distributed system with million users ASAP", "GENERAL", 0.3, True),
+    ("紧急！线上服务崩溃了", "DEBUGGING", 0, True),
+    ("deadline is tomorrow, need help", "GENERAL", 0, True),
+    ("multi-tenant cross-region architecture optimization", "CHAT", 0.45, False),
+    ("just chatting\nabout nothing", "CHAT", 0, False),
+    ("README.md", "WRITING", 0, False),
+    ("", "CHAT", 0, False),
+    # 大写原文 (正则以 IGNORECASE 直接匹配原文)
+    ("TRANSLATE THIS TO JAPANESE", "TRANSLATION", 0, False),
+    ("URGENT: Production CRASH", "DEBUGGING", 0, True),
+    # lower() 把 'İ' 变成 'i' + U+0307，原实现因此匹配不到 "implement"
+    ("İmplement a parser", "GENERAL", 0, False),
+    # IGNORECASE 把 'ı'、'ſ' 当作 i、s (lower() 不改变它们)，自动机路径需同样折叠
+    ("ımplement a parser", "CODING", 0, False),
+    ("ımport numpy as np", "CODING", 0, False),
+    ("claſſ Foo", "CODING", 0, False),
+]
+
+_MATCHER_SOURCES = {
+    "CLASSIFY_MATCHER": {
+        f"{task_type.name}_{i}": p
+        for task_type, patterns in TaskAnalyzer._PATTERN_STRINGS.items()
+        for i, p in enumerate(patterns)
+    },
+    "COMPLEXITY_MATCHER": {f"C{i}": p for i, p in enumerate(TaskAnalyzer._COMPLEXITY_STRINGS)},
+    "URGENT_MATCHER": {f"U{i}": p for i, p in enumerate(TaskAnalyzer._URGENT_STRINGS)},
+}
+
+_AUTOMATON_MODES = [False]
+if model_selector.AHOCORASICK_AVAILABLE:
+    _AUTOMATON_MODES.append(True)
+
+
+@pytest.fixture(params=_AUTOMATON_MODES, ids=lambda on: "ahocorasick" if on else "regex")
+def use_automaton(request, monkeypatch):
+    """按指定路径 (纯正则 / Aho-Corasick) 重建 TaskAnalyzer 的匹配器"""
+    monkeypatch.setattr(model_selector, "AHOCORASICK_AVAILABLE", request.param)
+    for attr, patterns in _MATCHER_SOURCES.items():
+        monkeypatch.setattr(TaskAnalyzer, attr, PatternMatcher(patterns))
+    return request.param
+
+
+@pytest.mark.parametrize("task,task_type,complexity,urgent", GOLDEN)
+def test_golden_classification(use_automaton, task, task_type, complexity, urgent):
+    analyzer = TaskAnalyzer(task)
+    assert analyzer.classify().name == task_type
+    assert analyzer.get_complexity() == pytest.approx(complexity)
+    assert analyzer.is_urgent() is urgent
+
+
+@pytest.mark.parametrize("task", [case[0] for case in GOLDEN])
+def test_matched_equals_per_pattern_search(use_automaton, task):
+    # 原实现对小写文本逐个模式 search；TaskAnalyzer 对含 'İ' 的原文仍先转小写
+    text = TaskAnalyzer(task).task
+    for patterns in _MATCHER_SOURCES.values():
+        expected = {name for name, p in patterns.items() if re.search(p, task.lower(), re.IGNORECASE)}
+        matcher = PatternMatcher(patterns)
+        assert matcher.matched(text) == expected
+        assert matcher.search(text) is bool(expected)
@@ -7,41 +7,28 @@ OpenCode Smart Model Selector 版本管理模块
 - PATCH: 向后兼容的 bug 修复
 """
 
+from functools import lru_cache
+from pathlib import Path
+
 __version__ = "4.0.0"
 __author__ = "OpenCode Team"
 __description__ = "智能模型调度系统"
 
-# 版本历史
-VERSION_HISTORY = {
-    "1.0.0": {
-        "date": "2025-01-01",
-        "description": "初始版本 - 智能模型选择 + 故障转移"
-    },
-    "2.0.0": {
-        "date": "2025-02-25", 
-        "description": "重大更新: 手动指定模型 > 自动推荐优先级, 24h TTL, 连续3次失败自动切换, op auto/reset 命令, 长文本降级策略, 测速记忆持久化"
-    },
-    "2.1.0": {
-        "date": "2026-02-26",
-        "description": "新增功能: API Server 模块 (OpenAI 兼容接口), op api 命令"
-    },
-    "2.2.0": {
-        "date": "2026-02-27",
-        "description": "新增功能: 双引擎架构, 熔断降级, 并发优化, 测速缓存4h过期, op engine 命令"
-    },
-    "3.0.0": {
-        "date": "2026-03-01",
-        "description": "架构升级: 通用核心 + 适配器模式, 六边形架构"
-    },
-    "3.1.0": {
-        "date": "2026-03-02",
-        "description": "配置驱动: models_config.json, 零代码添加模型"
-    },
-    "4.0.0": {
-        "date": "2026-03-02",
-        "description": "V2.0增强期: YAML配置+性能埋点+动态降级"
-    }
-}
+# 版本历史保存在同目录的 version_history.json 中，只在需要时读取 (见 _load_history)
+_HISTORY_FILE = Path(__file__).with_name("version_history.json")
+
+@lru_cache(maxsize=1)
+def _load_history():
+    """读取版本历史 (首次调用时读取一次)"""
+    import json
+    with open(_HISTORY_FILE, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def __getattr__(name):
+    """兼容旧代码直接访问 version.VERSION_HISTORY"""
+    if name == "VERSION_HISTORY":
+        return _load_history()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def get_version():
     """获取当前版本号"""
@@ -53,7 +40,7 @@ def get_version_info():
         "version": __version__,
         "author": __author__,
         "description": __description__,
-        "history": VERSION_HISTORY
+        "history": _load_history()
     }
 
 def print_version():
@@ -62,7 +49,7 @@ def print_version():
     print(f"Author: {__author__}")
     print()
     print("版本历史:")
-    for ver, info in VERSION_HISTORY.items():
+    for ver, info in _load_history().items():
         print(f"  v{ver} ({info['date']}) - {info['description']}")
 
 if __name__ == "__main__":